@@ -12,6 +12,14 @@ load_dotenv()
 DEFAULT_GRADING_SYSTEM_URL = "https://auto-grading-system-gc6kcexpcq-an.a.run.app"
 GRADING_SYSTEM_URL = os.getenv('GRADING_SYSTEM_URL', DEFAULT_GRADING_SYSTEM_URL)
 
+# デバッグ用ファイルの保存レベル（off / errors / all）
+DEBUG_ARTIFACTS = os.getenv('GRADING_DEBUG_ARTIFACTS', 'all')
+
+# 送信前の軽量化ルール（課題ID -> ルール、None は全課題の既定ルール）
+# 例: 出力を見て採点する課題だけ出力を残す
+#   MINIMIZE_RULES = {"practice_problem_3": {"drop_outputs": False, "max_stream_chars": 1000}}
+MINIMIZE_RULES = {}
+
 # グローバル設定変数
 GLOBAL_NOTEBOOK_PATH = None
 
@@ -24,16 +32,27 @@ try:
     # クライアントモジュールをインポート
     from python import (
         create_submit_button,
+        create_submit_all_button,
         initialize_common_program,
-        SubmitWidget
+        SubmitWidget,
+        get_shared_transport,
+        close_shared_transport
     )
     from python.grading_client import GradingClient
+    from python.debug_artifacts import configure_debug_artifacts
+    from python.payload_minimizer import get_shared_minimizer
+    from python.notebook_cache import get_notebook_cache
+    from python.notebook_index import get_notebook_index
+    from python.colab_snapshot import get_colab_snapshot
     
     # 採点システムURL設定付きの初期化関数
     def initialize_with_config():
         """環境変数とnotebook_pathを考慮した初期化"""
         widget_manager = initialize_common_program()
         widget_manager.set_grading_system_url(GRADING_SYSTEM_URL)
+        configure_debug_artifacts(level=DEBUG_ARTIFACTS)
+        for assignment_id, rules in MINIMIZE_RULES.items():
+            get_shared_minimizer().set_rules(assignment_id, **rules)
         print(f"🔧 採点システムURL: {GRADING_SYSTEM_URL}")
         return widget_manager
     
@@ -50,6 +69,18 @@ try:
         
         return widget_manager.create_submit_button(problem_number)
     
+    # URL設定付きの全問題まとめて送信ボタン作成関数
+    def create_submit_all_button_with_config():
+        """環境変数を考慮した全問題まとめて送信ボタン作成"""
+        widget_manager = SubmitWidget()
+        widget_manager.set_grading_system_url(GRADING_SYSTEM_URL)
+        
+        global GLOBAL_NOTEBOOK_PATH
+        if GLOBAL_NOTEBOOK_PATH:
+            widget_manager.set_notebook_path(GLOBAL_NOTEBOOK_PATH)
+        
+        return widget_manager.create_submit_all_button()
+    
     # ノートブック環境変数設定関数
     def set_notebook_config(notebook_path):
         """ノートブック固有の環境変数を設定"""
@@ -65,6 +96,79 @@ try:
         client.set_grading_system_url(GRADING_SYSTEM_URL)
         return client.test_cancel_button(max_retry, retry_delay)
     
+    # HTTP接続統計の表示関数
+    def show_connection_stats():
+        """共有HTTP接続プールの再利用状況を表示"""
+        get_shared_transport().print_stats()
+    
+    # 送信キューの表示関数
+    def show_submission_queue():
+        """送信できずに保存されている解答の一覧を表示"""
+        client = GradingClient()
+        client.set_grading_system_url(GRADING_SYSTEM_URL)
+        entries = client.get_queue_entries()
+        if not entries:
+            print("📮 送信キューは空です")
+            return
+        print(f"📮 送信キュー: {len(entries)}件")
+        for entry in entries:
+            print(f"  練習プログラム{entry['problem_number']}: {entry['state']}"
+                  f"（再送失敗 {entry['attempts']} 回, {entry['last_error'] or '-'}）")
+    
+    # デバッグ用ファイルの保存レベル設定関数
+    def set_debug_artifacts(level):
+        """デバッグ用ファイル（.grading_debug/）の保存レベルを設定（off / errors / all）"""
+        configure_debug_artifacts(level=level)
+        print(f"🔍 デバッグ用ファイルの保存レベル: {level}")
+    
+    # 送信前の軽量化ルール設定関数
+    def set_minimize_rules(assignment_id=None, **rules):
+        """
+        送信前に取り除くデータのルールを設定
+        
+        Args:
+            assignment_id (str): 課題ID（practice_problem_N、Noneなら全課題）
+            **rules: drop_outputs, max_stream_chars, drop_rich_outputs, drop_execution_count,
+                     clear_metadata, keep_metadata_keys, strip_attachments
+        """
+        get_shared_minimizer().set_rules(assignment_id, **rules)
+        print(f"🧹 軽量化ルールを設定しました: {assignment_id or '全課題'} {rules}")
+    
+    # ノートブック読み込みキャッシュの破棄関数
+    def clear_notebook_cache(path=None):
+        """解析済みノートブックのキャッシュを捨てる（次の送信でファイルを読み直す）"""
+        if path is None:
+            get_notebook_index().invalidate()
+            get_colab_snapshot().invalidate()
+        removed = get_notebook_cache().invalidate(path)
+        print(f"🗑️ ノートブックのキャッシュを{removed}件破棄しました")
+    
+    # 送信中の採点の取り消し関数
+    def cancel_grading(problem_number=None):
+        """送信中の採点を取り消す（problem_number を省略すると全ての送信）"""
+        cancelled = GradingClient().cancel_submission(problem_number=problem_number)
+        print(f"🛑 {cancelled}件の送信を取り消しました" if cancelled else "ℹ️ 取り消せる送信はありません")
+    
+    # 送信処理の計測
+    def enable_tracing(enabled=True):
+        """送信処理の段階ごとの所要時間の計測を有効/無効にする"""
+        GradingClient().set_tracing(enabled)
+        print("⏱️ 送信処理の計測を開始しました" if enabled else "⏱️ 送信処理の計測を停止しました")
+    
+    def show_trace_summary():
+        """段階ごとの所要時間の集計を表示"""
+        summary = GradingClient().get_trace_summary()
+        if not summary:
+            print("⏱️ 計測記録はありません（enable_tracing() で計測を開始してください）")
+            return
+        for name, stats in summary.items():
+            print(f"  {name}: {stats['count']}回, 平均 {stats['mean'] * 1000:.1f} ms, 合計 {stats['total']:.2f} 秒")
+    
+    def export_grading_traces(trace_path="grading_trace.jsonl", metrics_path="grading_metrics.prom"):
+        """計測記録（JSON Lines）と集計（Prometheus形式）をファイルに書き出す"""
+        client = GradingClient()
+        client.export_traces(trace_path)
+        client.export_metrics(metrics_path)
     
     # 初期化実行
     initialize_with_config()
@@ -73,8 +177,19 @@ try:
     
     # グローバル名前空間に主要関数をエクスポート
     globals()['create_submit_button'] = create_submit_button_with_config
+    globals()['create_submit_all_button'] = create_submit_all_button_with_config
     globals()['set_notebook_config'] = set_notebook_config
     globals()['test_cancel_button'] = test_cancel_button
+    globals()['show_connection_stats'] = show_connection_stats
+    globals()['close_connections'] = close_shared_transport
+    globals()['show_submission_queue'] = show_submission_queue
+    globals()['set_debug_artifacts'] = set_debug_artifacts
+    globals()['set_minimize_rules'] = set_minimize_rules
+    globals()['cancel_grading'] = cancel_grading
+    globals()['clear_notebook_cache'] = clear_notebook_cache
+    globals()['enable_tracing'] = enable_tracing
+    globals()['show_trace_summary'] = show_trace_summary
+    globals()['export_grading_traces'] = export_grading_traces
     # globals()['test_retry_countdown'] = test_retry_countdown
     globals()['GRADING_SYSTEM_URL'] = GRADING_SYSTEM_URL
     
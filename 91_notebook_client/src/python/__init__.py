@@ -8,6 +8,7 @@ from .environment_detector import EnvironmentDetector
 from .storage_helper import StorageManager
 from .email_detector import EmailDetector
 from .notebook_reader import NotebookReader
+from .http_transport import HttpTransport, get_shared_transport, close_shared_transport
 from .grading_client import GradingClient
 from .submit_widget import SubmitWidget
 from .result_viewer import ResultViewer
@@ -30,6 +31,11 @@ __all__ = [
     # ノートブック読み込み
     'NotebookReader',
     
+    # HTTP接続プール
+    'HttpTransport',
+    'get_shared_transport',
+    'close_shared_transport',
+    
     # 採点システムクライアント
     'GradingClient',
     
@@ -54,6 +60,16 @@ def create_submit_button(problem_number=1):
     widget_manager = SubmitWidget()
     return widget_manager.create_submit_button(problem_number)
 
+def create_submit_all_button():
+    """
+    全問題をまとめて送信するボタンを作成する便利関数
+    
+    Returns:
+        widgets.VBox: 送信ウィジェット
+    """
+    widget_manager = SubmitWidget()
+    return widget_manager.create_submit_all_button()
+
 def initialize_common_program():
     """
     共通プログラムの初期化
@@ -0,0 +1,297 @@
+"""
+送信制御モジュール - 採点システムが混雑しているときに送信を控える
+
+- TokenBucket: 送信先ごとの送信頻度と同時送信数の上限（サーバーがレスポンスヘッダーで変更できる）
+- CircuitBreaker: 5xx・タイムアウトが続いたら送信を止め、時間を置いて1件だけ試す
+- AdmissionController: 上の2つを送信先URLごとにまとめ、カーネル内で共有する
+
+サーバーが返すヘッダー:
+    RateLimit-Policy: 10;w=60       60秒あたり10件まで
+    RateLimit-Remaining: 0          残り件数（0なら RateLimit-Reset 秒後まで送らない）
+    RateLimit-Reset: 12
+    X-Max-Concurrency: 4            同時送信数の上限
+"""
+
+import re
+import threading
+import time
+
+# 既定の送信頻度（1送信先あたり）
+DEFAULT_RATE = 1.0            # 1秒あたりの送信数
+DEFAULT_BURST = 5             # まとめて送ってよい件数
+DEFAULT_MAX_CONCURRENCY = 4   # 同時送信数の上限
+MIN_CONCURRENCY = 1
+
+# サーキットブレーカーの既定値
+DEFAULT_FAILURE_THRESHOLD = 3   # 連続でこの回数失敗したら送信を止める
+DEFAULT_RESET_TIMEOUT = 30.0    # 止めてから試しに1件送るまでの秒数
+MAX_RESET_TIMEOUT = 300.0
+
+# サーキットブレーカーの状態
+STATE_CLOSED = "closed"         # 通常
+STATE_OPEN = "open"             # 送信停止中
+STATE_HALF_OPEN = "half_open"   # 試しに送信中
+
+# 混雑とみなすHTTPステータス（同時送信数を減らす）
+OVERLOAD_STATUS_CODES = frozenset({429, 503})
+
+_POLICY_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*;\s*w\s*=\s*(\d+(?:\.\d+)?)")
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    送信頻度（トークンバケット）と同時送信数を制限するクラス
+
+    同時送信数は、成功が続けば1ずつ増やし、429/503・タイムアウトで半分にする（AIMD）。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._blocked_until = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self):
+        """
+        送信してよければ枠を確保する
+
+        Returns:
+            float: 0なら確保できた。正の値なら、その秒数待ってから再度試す
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self._in_flight >= self.concurrency_limit:
+                return 0.05
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.rate if self.rate > 0 else 1.0
+            self._tokens -= 1.0
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self, timeout=None):
+        """枠を確保できるまで待つ（スレッド用）。timeout秒で確保できなければFalse"""
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def release(self, overloaded=False, succeeded=False):
+        """送信が終わったら枠を返す（混雑・成功に応じて同時送信数を調整）"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if overloaded:
+                self.concurrency_limit = max(MIN_CONCURRENCY, self.concurrency_limit // 2)
+            elif succeeded and self.concurrency_limit < self.max_concurrency:
+                self.concurrency_limit += 1
+
+    def update_from_headers(self, headers):
+        """サーバーのレスポンスヘッダーに従って上限を変更"""
+        if not headers:
+            return
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            match = _POLICY_PATTERN.match(headers.get("RateLimit-Policy", "") or "")
+            if match:
+                quota, window = float(match.group(1)), float(match.group(2))
+                if quota > 0 and window > 0:
+                    self.rate = quota / window
+                    self.burst = max(1.0, quota)
+                    self._tokens = min(self._tokens, self.burst)
+            remaining = _header_float(headers, "RateLimit-Remaining")
+            reset = _header_float(headers, "RateLimit-Reset")
+            if remaining is not None:
+                self._tokens = min(self._tokens, remaining)
+                if remaining < 1 and reset is not None:
+                    self._blocked_until = max(self._blocked_until, now + reset)
+            max_concurrency = _header_float(headers, "X-Max-Concurrency")
+            if max_concurrency is not None and max_concurrency >= MIN_CONCURRENCY:
+                self.max_concurrency = int(max_concurrency)
+                self.concurrency_limit = min(self.concurrency_limit, self.max_concurrency)
+
+    def get_stats(self):
+        with self._lock:
+            self._refill(self.clock())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": self._tokens,
+                "in_flight": self._in_flight,
+                "concurrency_limit": self.concurrency_limit,
+                "max_concurrency": self.max_concurrency,
+                "blocked_for": max(0.0, self._blocked_until - self.clock()),
+            }
+
+
+class CircuitBreaker:
+    """
+    5xx・タイムアウトが続いたら送信を止めるサーキットブレーカー
+
+    連続 failure_threshold 回の失敗で open（送信停止）になり、reset_timeout 秒後に
+    half_open として1件だけ試しに送る。成功すれば closed に戻り、失敗すれば
+    待ち時間を倍にして再び open になる。
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """送信を再開できるまでの秒数（送信できる状態なら0）"""
+        with self._lock:
+            if self.state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def is_open(self):
+        """送信停止中か（試しに送る時刻を過ぎていればFalse）"""
+        return self.retry_after() > 0
+
+    def allow_request(self):
+        """この送信を行ってよいか（half_open では試しの1件だけ許可）"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN:
+                if self.clock() < self._opened_at + self.reset_timeout:
+                    return False
+                self.state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.consecutive_failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN:
+                self.reset_timeout = min(MAX_RESET_TIMEOUT, self.reset_timeout * 2)
+                self._open()
+            elif self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def record_neutral(self):
+        """サーバーの障害とは関係ない結果（4xx等）。試しの送信枠だけ解放する"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self._opened_at = self.clock()
+        self._probe_in_flight = False
+
+
+class AdmissionController:
+    """送信先URLごとの送信制御（パスごとのTokenBucketと、URL全体のCircuitBreaker）"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self._bucket_settings = {"rate": rate, "burst": burst, "max_concurrency": max_concurrency}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def bucket(self, path):
+        """パス（/grade, /jobs 等）ごとのTokenBucketを取得"""
+        with self._lock:
+            bucket = self._buckets.get(path)
+            if bucket is None:
+                bucket = TokenBucket(**self._bucket_settings)
+                self._buckets[path] = bucket
+            return bucket
+
+    def record_result(self, path, status_code=None, headers=None, exc=None):
+        """
+        1回の送信結果を記録し、枠を返す
+
+        status_code も exc も無い場合（送信前の失敗など）は、同時送信数・ブレーカーの
+        失敗回数を変えずに枠と試しの送信枠だけを返す。
+
+        Args:
+            status_code (int): HTTPステータス（通信例外の場合はNone）
+            headers (dict): レスポンスヘッダー
+            exc (Exception): 通信例外
+        """
+        import requests
+        bucket = self.bucket(path)
+        bucket.update_from_headers(headers)
+        timed_out = isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+        server_error = status_code is not None and status_code >= 500
+        overloaded = timed_out or status_code in OVERLOAD_STATUS_CODES
+        succeeded = status_code is not None and status_code < 400
+        bucket.release(overloaded=overloaded, succeeded=succeeded)
+
+        if timed_out or server_error:
+            self.breaker.record_failure()
+        elif succeeded:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_neutral()
+
+    def get_stats(self):
+        """送信制御の状態（ブレーカーとパスごとのバケット）"""
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_after": self.breaker.retry_after(),
+            "buckets": {path: bucket.get_stats() for path, bucket in buckets.items()},
+        }
+
+
+# 送信先URLごとの共有AdmissionController
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(base_url):
+    """送信先URLごとに1つのAdmissionControllerを取得（カーネル内で共有）"""
+    with _controllers_lock:
+        controller = _controllers.get(base_url)
+        if controller is None:
+            controller = AdmissionController()
+            _controllers[base_url] = controller
+        return controller
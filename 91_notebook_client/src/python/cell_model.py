@@ -0,0 +1,169 @@
+"""
+セルモデルモジュール - 送信するセルをコピーせずに扱う
+
+1回の送信で、セルは絞り込み（#@title除外）・軽量化・キャッシュキー・差分送信のハッシュ・
+送信データのJSON・デバッグ用ファイルと何度も扱われる。以前はそのたびにセルのリストを作り直し、
+ソースの行のリストを連結し、送信データ全体を1つの文字列にしてからバイト列にしていた。
+
+- Cell: 元のセル（dict）を参照し、ソースの連結とJSONへの変換をそれぞれ1回だけ行って覚えておく
+- CellList: Cell の並びのビュー。スライスと絞り込みは位置だけを持つ新しいビューを返し、
+  セルをコピーしない（要素を取り出すと元のdictを返すので、セルのリストと同じように使える）
+- write_json(): 送信データを少しずつ書き出す（セルは覚えておいたJSONをそのまま書く）
+
+セルのJSONはキー順を揃えた形（差分送信のハッシュと同じ）なので、
+ハッシュ・送信データ・デバッグ用ファイルで同じバイト列を使い回せる。
+Cell が参照する元のdictは変更しないこと（覚えておいたソース・JSONと食い違うため）。
+"""
+
+import collections.abc
+import hashlib
+import json
+
+
+def source_text(cell):
+    """セルのソースを1つの文字列で返す（行のリストなら連結する）"""
+    source = cell.get("source", "")
+    return "".join(source) if isinstance(source, list) else source
+
+
+def encode_cell(cell):
+    """セルをキー順を揃えたコンパクトなJSON（UTF-8）にする"""
+    return json.dumps(cell, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+class Cell:
+    """送信するセル1つ（元のセルのdictを参照し、ソースとJSONは初回に作って覚えておく）"""
+
+    __slots__ = ("data", "_source", "_encoded", "_digest")
+
+    def __init__(self, data, source=None):
+        """source は連結済みのソース（軽量化したセルに元のセルの値を引き継ぐ場合）"""
+        self.data = data
+        self._source = source
+        self._encoded = None
+        self._digest = None
+
+    @property
+    def cell_type(self):
+        return self.data.get("cell_type")
+
+    @property
+    def source(self):
+        """ソース（行のリストは連結した文字列）"""
+        if self._source is None:
+            self._source = source_text(self.data)
+        return self._source
+
+    @property
+    def encoded(self):
+        """キー順を揃えたコンパクトなJSON（UTF-8のバイト列）"""
+        if self._encoded is None:
+            self._encoded = encode_cell(self.data)
+        return self._encoded
+
+    @property
+    def digest(self):
+        """encoded のSHA-256（差分送信のセルのハッシュ）"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.encoded).hexdigest()
+        return self._digest
+
+    def __repr__(self):
+        return f"Cell({self.cell_type!r}, {self.source[:30]!r})"
+
+
+class CellList(collections.abc.Sequence):
+    """
+    Cell の並びのビュー（読み取り専用）
+
+    len()・インデックス・for文ではセルのdictを返す。スライスと filter() はセルをコピーせず、
+    同じ Cell を参照する新しいビューを返す。Cell そのものは cells() で取り出す。
+    """
+
+    __slots__ = ("_cells", "_indices")
+
+    def __init__(self, cells=()):
+        if isinstance(cells, CellList):
+            self._cells, self._indices = cells._cells, cells._indices
+            return
+        self._cells = [cell if isinstance(cell, Cell) else Cell(cell) for cell in cells]
+        self._indices = range(len(self._cells))
+
+    @classmethod
+    def _view(cls, cells, indices):
+        view = cls.__new__(cls)
+        view._cells = cells
+        view._indices = indices
+        return view
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self._cells, self._indices[index])
+        return self._cells[self._indices[index]].data
+
+    def __iter__(self):
+        for cell in self.cells():
+            yield cell.data
+
+    def __repr__(self):
+        return f"CellList({len(self)}セル)"
+
+    def cells(self):
+        """Cell を順に返す"""
+        cells = self._cells
+        for i in self._indices:
+            yield cells[i]
+
+    def filter(self, predicate):
+        """predicate(cell: Cell) がTrueのセルだけのビューを返す"""
+        cells = self._cells
+        return self._view(cells, [i for i in self._indices if predicate(cells[i])])
+
+
+def iter_cells(cells):
+    """セルのリスト（dict または Cell）や CellList から Cell を順に返す"""
+    if isinstance(cells, CellList):
+        return cells.cells()
+    return (cell if isinstance(cell, Cell) else Cell(cell) for cell in cells)
+
+
+def _dumps(value, default=None):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def write_json(value, write, default=None):
+    """
+    value をコンパクトなJSON（UTF-8）にして、write(bytes) に少しずつ書く
+
+    全体を1つの文字列にしないので、大きな送信データでも一度に使うメモリはセル1つ分程度で済む。
+    Cell と CellList のセルは覚えておいたJSONをそのまま書き、リストの要素のdict
+    （キューから読み直したセルなど）は1つずつまとめてJSONにする。
+    default は json.dumps と同じ（JSONにできない値を変換する関数）。
+    """
+    if isinstance(value, Cell):
+        write(value.encoded)
+    elif isinstance(value, (CellList, list, tuple)):
+        write(b"[")
+        for i, item in enumerate(iter_cells(value) if isinstance(value, CellList) else value):
+            if i:
+                write(b",")
+            if isinstance(item, dict):
+                write(_dumps(item, default))
+            else:
+                write_json(item, write, default)
+        write(b"]")
+    elif isinstance(value, dict):
+        write(b"{")
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                write(b",")
+            # JSONのキーは文字列（数値・真偽値などは json.dumps と同じく文字列にする）
+            write(_dumps(key if isinstance(key, str) else json.dumps(key)))
+            write(b":")
+            write_json(item, write, default)
+        write(b"}")
+    else:
+        write(_dumps(value, default))
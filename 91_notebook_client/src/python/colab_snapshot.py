@@ -0,0 +1,295 @@
+"""
+Colabノートブック控えモジュール - 送信のたびにブラウザからノートブック全体を取り寄せない
+
+Google Colab では送信ボタンを押すたびに _message.blocking_request('get_ipynb') で
+ブラウザからノートブック全体（出力を含む）を取り寄せていた。大きなノートブックでは
+この往復に時間がかかり、タイムアウトすると空のセル一覧になっていた。
+
+このモジュールは最後に取り寄せたノートブックのセルを控えておき、IPython の
+pre_run_cell / post_run_cell フックで、その後に実行されたセルの内容・実行回数を反映する。
+送信時は控えが使えるか確かめ、使えない場合だけ取り寄せ直す。
+
+実行せずに編集・削除したセルはフックに現れず、ブラウザ側のセルの一覧を軽く確かめる手段もない
+（出力はサンドボックス化された iframe の中で動く）。そのため控えを使うのは取り寄せてから
+max_age 秒（既定10秒）以内だけで、続けて押した送信ボタンや全問題の送信など、
+短い間に重なった送信で取り寄せを1回にまとめるために使う。控えを使えないのは
+
+- まだ取り寄せていない、またはフックを登録できなかった
+- 控えに無いセル（追加したセル）が実行された
+- セルIDが分からず、実行したコードが控えのどのセルとも一致しない（どのセルを書き換えたか分からない）
+- 出力が必要なのに、取り寄せた後に実行し直したセルがある（フックでは出力を受け取れない）
+- 取り寄せてから max_age 秒が過ぎた（その間に実行せずに編集・削除したセルがあるかもしれない）
+
+の場合。取り寄せの所要時間と控えを使えなかった理由は stats と計測（Tracer）に記録する。
+"""
+
+import threading
+import time
+
+from .cell_model import source_text
+from .tracing import get_tracer
+
+# ブラウザからノートブックを取り寄せるときのタイムアウト（秒）
+FETCH_TIMEOUT = 10
+
+# 取り寄せてからこの秒数が過ぎた控えは使わない（実行しないまま編集・削除したセルを拾うため、
+# 続けて押した送信をまとめられる程度に短くする）
+DEFAULT_MAX_AGE = 10.0
+
+# 控えを使えなかった理由
+STALE_NO_SNAPSHOT = "no_snapshot"
+STALE_NO_HOOKS = "no_hooks"
+STALE_NEW_CELL = "new_cell"
+STALE_UNVERIFIABLE = "unverifiable"
+STALE_OUTPUTS = "outputs"
+STALE_EXPIRED = "expired"
+
+
+def _cell_id(cell):
+    """セルID（Colab は metadata.id、nbformat 4.5 以降は id）"""
+    return cell.get("id") or (cell.get("metadata") or {}).get("id")
+
+
+class ColabNotebookSnapshot:
+    """
+    Colabノートブックのセルの控え（スレッドセーフ）
+
+    get_cells() が返すリストは呼び出しごとの新しいリストだが、セルは控えと共有するので変更しないこと。
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, fetch_timeout=FETCH_TIMEOUT):
+        self.max_age = max_age
+        self.fetch_timeout = fetch_timeout
+        self.stats = {"hits": 0, "fetches": 0, "fetch_failures": 0, "fetch_seconds": 0.0,
+                      "max_fetch_seconds": 0.0, "stale": {}, "cell_updates": 0}
+        self.tracer = get_tracer()
+        self._cells = None
+        self._positions = {}        # セルID -> 位置
+        self._sources = {}          # ソース -> 位置（セルIDが分からない実行の照合用）
+        self._fetched_at = None
+        self._stale_reason = None   # 取り寄せた後に控えを使えなくなった理由
+        self._rerun = set()         # 取り寄せた後に実行し直したセルの位置（出力が古い）
+        self._executing = False     # セルの実行中か
+        self._running = None        # 実行中のセルの控え内の位置（控えに反映していなければNone）
+        self._shell = None
+        self._lock = threading.Lock()
+
+    @property
+    def installed(self):
+        return self._shell is not None
+
+    def install(self, shell=None):
+        """
+        IPython のフックを登録する（登録済みなら何もしない）
+
+        setup.sh を再実行してモジュールを読み直した場合は、前のモジュールのフックを外してから登録する。
+
+        Returns:
+            bool: 登録できたらTrue
+        """
+        if self._shell is not None:
+            return True
+        if shell is None:
+            try:
+                from IPython import get_ipython
+            except ImportError:
+                return False
+            shell = get_ipython()
+        if shell is None or not hasattr(shell, "events"):
+            return False
+
+        for event, callback in getattr(shell, "_grading_snapshot_hooks", ()):
+            try:
+                shell.events.unregister(event, callback)
+            except ValueError:
+                pass
+        hooks = [("pre_run_cell", self._pre_run_cell), ("post_run_cell", self._post_run_cell)]
+        for event, callback in hooks:
+            shell.events.register(event, callback)
+        shell._grading_snapshot_hooks = hooks
+        self._shell = shell
+        return True
+
+    def uninstall(self):
+        """フックを外して控えを捨てる"""
+        with self._lock:
+            shell, self._shell = self._shell, None
+            self._cells = None
+        if shell is None:
+            return
+        for event, callback in getattr(shell, "_grading_snapshot_hooks", ()):
+            try:
+                shell.events.unregister(event, callback)
+            except ValueError:
+                pass
+        shell._grading_snapshot_hooks = []
+
+    def invalidate(self):
+        """次の get_cells() で取り寄せ直す"""
+        with self._lock:
+            self._cells = None
+
+    def get_cells(self, need_outputs=True):
+        """
+        ノートブックのセルを取得（控えが使えれば控え、使えなければブラウザから取り寄せる）
+
+        取り寄せに失敗した場合に控えを使うのは、出力が古いだけ（ソースは実行時の記録で最新）で
+        max_age 秒以内の控えに限る。編集・削除が反映されていないかもしれない控えは使わない。
+
+        Args:
+            need_outputs (bool): 出力も必要か（送信前に出力を削除するならFalse）
+
+        Returns:
+            list: セル（取り寄せに失敗し、使える控えも無ければ空のリスト）
+        """
+        installed = self.install()
+        with self._lock:
+            reason = self._check(installed, need_outputs)
+            if reason is None:
+                self.stats["hits"] += 1
+                self.tracer.count("colab_snapshot", result="hit")
+                print(f"✅ Google Colab: {len(self._cells)}セル（実行時の記録から取得）")
+                return list(self._cells)
+            stale = self.stats["stale"]
+            stale[reason] = stale.get(reason, 0) + 1
+            self.tracer.count("colab_snapshot", result="fetch", reason=reason)
+
+        cells = self._fetch(reason)
+        if cells is not None:
+            print(f"✅ Google Colab: {len(cells)}セル取得")
+            return list(cells)
+        with self._lock:
+            # 取り寄せている間に実行されたセルで使えなくなっていないかも確かめる
+            if reason == STALE_OUTPUTS and self._check(installed, need_outputs=False) is None:
+                print(f"⚠️ Google Colab: 取得できなかったため、実行時の記録（{len(self._cells)}セル、"
+                      f"出力は実行前のもの）を使います")
+                return list(self._cells)
+        return []
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, stale=dict(self.stats["stale"]))
+            cached = self._cells is not None
+        requests = stats["hits"] + stats["fetches"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        stats["mean_fetch_seconds"] = stats["fetch_seconds"] / stats["fetches"] if stats["fetches"] else 0.0
+        stats["cached"] = cached
+        return stats
+
+    def _check(self, installed, need_outputs):
+        """控えを使えない理由（使えるならNone）"""
+        if self._cells is None:
+            return STALE_NO_SNAPSHOT
+        if not installed:
+            return STALE_NO_HOOKS
+        if self._stale_reason is not None:
+            return self._stale_reason
+        if need_outputs and self._rerun:
+            return STALE_OUTPUTS
+        if time.monotonic() - self._fetched_at > self.max_age:
+            return STALE_EXPIRED
+        return None
+
+    def _fetch(self, reason):
+        """ブラウザからノートブックを取り寄せて控えを作り直す（失敗したらNone）"""
+        started = time.monotonic()
+        error = None
+        cells = None
+        try:
+            from google.colab import _message
+            notebook_data = _message.blocking_request('get_ipynb', request='', timeout_sec=self.fetch_timeout)
+            # レスポンス構造: {'ipynb': {'cells': [...]}}
+            if (isinstance(notebook_data, dict) and
+                    isinstance(notebook_data.get('ipynb'), dict) and
+                    isinstance(notebook_data['ipynb'].get('cells'), list)):
+                cells = notebook_data['ipynb']['cells']
+            else:
+                error = "Notebook構造が取得できませんでした"
+        except Exception as e:
+            error = f"API エラー: {e}"
+        elapsed = time.monotonic() - started
+
+        tags = {"reason": reason}
+        if error is not None:
+            tags["error"] = error
+            print(f"❌ Google Colab: {error}（{elapsed:.1f}秒）")
+        self.tracer.record("colab_fetch", elapsed, tags)
+
+        with self._lock:
+            self.stats["fetches"] += 1
+            self.stats["fetch_seconds"] += elapsed
+            self.stats["max_fetch_seconds"] = max(self.stats["max_fetch_seconds"], elapsed)
+            if cells is None:
+                self.stats["fetch_failures"] += 1
+                return None
+            self._replace(cells, started)
+        return cells
+
+    def _replace(self, cells, fetched_at):
+        self._cells = list(cells)
+        self._positions = {}
+        self._sources = {}
+        for i, cell in enumerate(self._cells):
+            cell_id = _cell_id(cell)
+            if cell_id:
+                self._positions[cell_id] = i
+            if cell.get("cell_type") == "code":
+                self._sources.setdefault(source_text(cell), i)
+        # 取り寄せの途中に実行が始まったセルは、取り寄せた内容に含まれているか分からない
+        self._stale_reason = STALE_UNVERIFIABLE if self._executing else None
+        self._running = None
+        self._fetched_at = fetched_at
+        self._rerun = set()
+
+    def _pre_run_cell(self, info=None):
+        """セルの実行前（実行するコードを控えに反映）"""
+        raw_cell = getattr(info, "raw_cell", None)
+        cell_id = getattr(info, "cell_id", None)
+        with self._lock:
+            self._executing = True
+            self._running = None
+            if self._cells is None or self._stale_reason is not None:
+                return
+            if raw_cell is None:
+                self._stale_reason = STALE_UNVERIFIABLE
+                return
+            if cell_id:
+                index = self._positions.get(cell_id)
+                if index is None:
+                    self._stale_reason = STALE_NEW_CELL
+                    return
+            else:
+                # セルIDが分からない場合は、控えと同じコードの再実行だけ確かめられる
+                index = self._sources.get(raw_cell)
+                if index is None:
+                    self._stale_reason = STALE_UNVERIFIABLE
+                    return
+            self._running = index
+            self._rerun.add(index)
+            cell = self._cells[index]
+            if source_text(cell) != raw_cell:
+                source = raw_cell.splitlines(keepends=True) if isinstance(cell.get("source"), list) else raw_cell
+                self._sources.pop(source_text(cell), None)
+                self._sources.setdefault(raw_cell, index)
+                self._cells[index] = dict(cell, source=source)
+                self.stats["cell_updates"] += 1
+
+    def _post_run_cell(self, result=None):
+        """セルの実行後（実行回数を控えに反映）"""
+        with self._lock:
+            index, self._running = self._running, None
+            self._executing = False
+            if index is None or self._cells is None or self._stale_reason is not None:
+                return
+            execution_count = getattr(result, "execution_count", None)
+            if execution_count is not None:
+                self._cells[index] = dict(self._cells[index], execution_count=execution_count)
+
+
+# カーネル内で共有するColabNotebookSnapshot
+_snapshot = ColabNotebookSnapshot()
+
+
+def get_colab_snapshot():
+    """カーネル内で共有するColabNotebookSnapshotを取得"""
+    return _snapshot
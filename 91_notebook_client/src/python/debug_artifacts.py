@@ -0,0 +1,198 @@
+"""
+デバッグ用ファイル保存モジュール - 送信データ・採点結果・エラーレスポンスをバックグラウンドで保存
+
+送信ボタンの処理をファイル書き込みで止めないよう、保存はバックグラウンドスレッドで行う。
+保存先は専用ディレクトリ（.grading_debug/）で、コンパクトなJSONをgzip圧縮して書き込み、
+件数・合計サイズの上限を超えたら古いものから削除する。
+
+保存レベル（カーネル内で1つの設定）:
+    off     保存しない
+    errors  エラーレスポンスだけ保存
+    all     送信データ・採点結果・エラーレスポンスを全て保存（既定）
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from .cell_model import write_json
+
+DEFAULT_ARTIFACT_DIR = ".grading_debug"
+DEFAULT_MAX_FILES = 200
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_QUEUE_SIZE = 100   # 書き込み待ちの上限（超えた分は保存せずに捨てる）
+
+# 保存レベル
+LEVEL_OFF = "off"
+LEVEL_ERRORS = "errors"
+LEVEL_ALL = "all"
+LEVELS = (LEVEL_OFF, LEVEL_ERRORS, LEVEL_ALL)
+
+# 保存するファイルの種類
+KIND_REQUEST = "request_packet"
+KIND_RESULT = "grading_result"
+KIND_ERROR = "error_response"
+
+_REQUIRED_LEVEL = {
+    KIND_REQUEST: LEVEL_ALL,
+    KIND_RESULT: LEVEL_ALL,
+    KIND_ERROR: LEVEL_ERRORS,
+}
+
+
+class ArtifactWriter:
+    """デバッグ用ファイルをバックグラウンドスレッドで書き込むクラス"""
+
+    def __init__(self, directory=DEFAULT_ARTIFACT_DIR, level=LEVEL_ALL, compress=True,
+                 max_files=DEFAULT_MAX_FILES, max_bytes=DEFAULT_MAX_BYTES, queue_size=DEFAULT_QUEUE_SIZE):
+        self.directory = directory
+        self.level = level
+        self.compress = compress
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.stats = {"written": 0, "dropped": 0, "errors": 0, "removed": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._thread = None
+
+    def configure(self, level=None, directory=None, compress=None, max_files=None, max_bytes=None):
+        """保存レベル・保存先・圧縮・保持数の設定を変更（Noneの項目は変更しない）"""
+        if level is not None:
+            if level not in LEVELS:
+                raise ValueError(f"保存レベルは {', '.join(LEVELS)} のいずれかを指定してください: {level}")
+            self.level = level
+        if directory is not None:
+            self.directory = directory
+        if compress is not None:
+            self.compress = compress
+        if max_files is not None:
+            self.max_files = max_files
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+
+    def is_enabled(self, kind):
+        """この種類のファイルを現在の保存レベルで保存するか"""
+        required = _REQUIRED_LEVEL.get(kind, LEVEL_ALL)
+        return LEVELS.index(self.level) >= LEVELS.index(required)
+
+    def write(self, kind, data, label=None):
+        """
+        ファイルの保存を予約する（すぐに戻る）
+
+        Args:
+            kind (str): ファイルの種類（KIND_REQUEST 等、ファイル名の先頭になる）
+            data (dict): 保存するデータ（予約後に変更しないこと）
+            label (str): ファイル名に付ける補足（問題番号・試行回数など）
+
+        Returns:
+            str: 保存先のパス（保存しない場合はNone）
+        """
+        if not self.is_enabled(kind):
+            return None
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        name = f"{kind}_{label}_{timestamp}_{sequence}" if label else f"{kind}_{timestamp}_{sequence}"
+        path = os.path.join(self.directory, name + (".json.gz" if self.compress else ".json"))
+        try:
+            self._queue.put_nowait((path, data, self.compress))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return None
+        self._ensure_thread()
+        return path
+
+    def flush(self, timeout=None):
+        """予約済みの保存が全て終わるまで待つ（timeout秒で終わらなければFalse）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="grading-debug-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path, data, compress = self._queue.get()
+            try:
+                self._write_file(path, data, compress)
+                self.stats["written"] += 1
+                self._enforce_retention(os.path.dirname(path))
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ デバッグ用ファイル保存エラー: {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write_file(path, data, compress):
+        # 全体を1つの文字列にせず、ファイル（gzip）へ少しずつ書く
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as raw, \
+                (gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) if compress else raw) as f:
+            write_json(data, f.write, default=str)
+        os.replace(tmp_path, path)
+
+    def _enforce_retention(self, directory):
+        """件数・合計サイズの上限を超えた古いファイルを削除"""
+        entries = []
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not entry.name.endswith((".json", ".json.gz")):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, entry.name, st.st_size, entry.path))
+
+        entries.sort(reverse=True)  # 新しい順
+        total_bytes = 0
+        for index, (_, _, size, path) in enumerate(entries):
+            total_bytes += size
+            if index >= self.max_files or total_bytes > self.max_bytes:
+                try:
+                    os.remove(path)
+                    self.stats["removed"] += 1
+                except OSError:
+                    pass
+
+
+def read_artifact(path):
+    """保存したデバッグ用ファイルを読み込む（gzip圧縮にも対応）"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# カーネル内で共有するArtifactWriter
+_writer = ArtifactWriter()
+
+
+def get_artifact_writer():
+    """カーネル内で共有するArtifactWriterを取得"""
+    return _writer
+
+
+def configure_debug_artifacts(level=None, directory=None, compress=None, max_files=None, max_bytes=None):
+    """デバッグ用ファイル保存の設定を変更（off / errors / all）"""
+    _writer.configure(level=level, directory=directory, compress=compress, max_files=max_files,
+                      max_bytes=max_bytes)
+    return _writer
+
+
+# カーネル終了時に書き込み待ちのファイルを保存しておく
+atexit.register(_writer.flush, 5.0)
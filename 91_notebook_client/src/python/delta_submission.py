@@ -0,0 +1,118 @@
+"""
+差分送信モジュール - 前回の送信成功時から変わったセルだけを送る
+
+前回送信に成功したセルのハッシュを問題ごとに覚えておき、変わっていないセルは
+{"cell_ref": "<ハッシュ>"} という参照に置き換えて送る。サーバー側で参照先が
+見つからない場合（409 cell_cache_miss）は、全セルを送り直す。
+"""
+
+import threading
+
+from .cell_model import Cell, iter_cells
+
+# 差分送信に対応したサーバーが /capabilities で返す機能名
+DELTA_FEATURE = "delta_cells"
+
+# 差分形式の送信データに付ける印
+DELTA_ENCODING = "delta"
+
+
+def cell_hash(cell):
+    """セル内容のハッシュ（キー順に依存しない正規化JSONのSHA-256）"""
+    return (cell if isinstance(cell, Cell) else Cell(cell)).digest
+
+
+def is_cell_ref(cell):
+    """セル参照（ハッシュのみ）かどうか"""
+    return isinstance(cell, dict) and set(cell.keys()) == {"cell_ref"}
+
+
+def resolve_delta_cells(cells, cell_store):
+    """
+    差分形式のセル一覧を元に戻す（ローカル採点サーバー用の参考実装）
+
+    Args:
+        cells (list): セルまたはセル参照のリスト
+        cell_store (dict): ハッシュ -> セル
+
+    Returns:
+        tuple: (resolved_cells: list, missing_hashes: list)
+    """
+    resolved = []
+    missing = []
+    for cell in cells:
+        if is_cell_ref(cell):
+            stored = cell_store.get(cell["cell_ref"])
+            if stored is None:
+                missing.append(cell["cell_ref"])
+            else:
+                resolved.append(stored)
+        else:
+            resolved.append(cell)
+    return resolved, missing
+
+
+class DeltaTracker:
+    """問題ごとに、前回送信に成功したセルのハッシュを覚えておくクラス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sent_hashes = {}
+
+    @staticmethod
+    def make_key(base_url, submission_data):
+        """送信先・学生・課題・ノートブックの組をキーにする"""
+        return (
+            base_url,
+            submission_data.get("student_email"),
+            submission_data.get("assignment_id"),
+            submission_data.get("notebook_path"),
+        )
+
+    def build_delta(self, key, cells):
+        """
+        差分形式のセル一覧を作る
+
+        Returns:
+            tuple: (delta_cells, hashes, changed_count)
+                前回の記録がない場合、delta_cells は None
+                （変わったセルは Cell のまま入れるので、送信時はハッシュと同じJSONを使う）
+        """
+        cells = list(iter_cells(cells))
+        hashes = [cell.digest for cell in cells]
+        with self._lock:
+            known = self._sent_hashes.get(key)
+        if not known:
+            return None, hashes, len(cells)
+
+        delta_cells = []
+        changed = 0
+        for cell, digest in zip(cells, hashes):
+            if digest in known:
+                delta_cells.append({"cell_ref": digest})
+            else:
+                delta_cells.append(cell)
+                changed += 1
+        return delta_cells, hashes, changed
+
+    def remember(self, key, hashes):
+        """送信成功したセルのハッシュを記録"""
+        with self._lock:
+            self._sent_hashes[key] = set(hashes)
+
+    def forget(self, key=None):
+        """記録を消す（key省略時は全て）"""
+        with self._lock:
+            if key is None:
+                self._sent_hashes.clear()
+            else:
+                self._sent_hashes.pop(key, None)
+
+
+# カーネル内の全GradingClientで共有する記録
+_shared_tracker = DeltaTracker()
+
+
+def get_shared_delta_tracker():
+    """カーネル内で共有する DeltaTracker を取得"""
+    return _shared_tracker
@@ -0,0 +1,151 @@
+"""
+障害注入モジュール - ローカル採点サーバーで遅延・エラー・切断を再現する
+
+本番の採点システムでしか起きない状況（応答の遅れ、5xx、429/503 と Retry-After、
+少しずつしか届かない応答、接続のリセット）をローカル採点サーバーで起こし、
+リトライ・タイムアウト・表示の処理を試せるようにする。
+
+使用例:
+    faults = FaultInjector(latency=("lognormal", 0.8, 0.5), error_rate=0.05, throttle_rate=0.1)
+    faults.push("reset", "unavailable")   # 次の2回は必ず切断・503
+    server = LocalGradingServer(faults=faults).start()
+
+動作の種類:
+    ok           通常の応答
+    error        error_status（既定500）を返す
+    throttle     429 + Retry-After
+    unavailable  503 + Retry-After
+    slow_drip    通常の応答を drip_chunk バイトずつ drip_interval 秒おきに返す
+    reset        応答せずに接続をリセットする
+"""
+
+import math
+import random
+import threading
+
+ACTION_OK = "ok"
+ACTION_ERROR = "error"
+ACTION_THROTTLE = "throttle"
+ACTION_UNAVAILABLE = "unavailable"
+ACTION_SLOW_DRIP = "slow_drip"
+ACTION_RESET = "reset"
+ACTIONS = (ACTION_OK, ACTION_ERROR, ACTION_THROTTLE, ACTION_UNAVAILABLE, ACTION_SLOW_DRIP, ACTION_RESET)
+
+# 障害を注入する対象のパス（/capabilities やジョブの状態取得は対象外）
+DEFAULT_FAULT_PATHS = ("/grade", "/grade_batch", "/jobs")
+
+
+def make_latency(spec):
+    """
+    遅延の指定から、乱数生成器を受け取って秒数を返す関数を作る
+
+    Args:
+        spec: 次のいずれか
+            None / 0                       遅延なし
+            1.5                            常に1.5秒
+            ("uniform", 0.5, 2.0)          0.5〜2.0秒の一様分布
+            ("normal", 1.0, 0.3)           平均1.0秒・標準偏差0.3秒（負の値は0）
+            ("lognormal", 0.8, 0.5)        中央値0.8秒・σ0.5の対数正規分布（裾の長い遅延）
+            ("exponential", 1.0)           平均1.0秒の指数分布
+            callable(rng) -> float         任意の関数
+            "uniform:0.5:2.0"              上のタプルと同じ指定の文字列形式（コマンドライン用）
+    """
+    if not spec:
+        return lambda rng: 0.0
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+    if isinstance(spec, str):
+        name, *params = spec.split(":")
+        if not params:
+            return make_latency(float(name))
+        spec = (name, *(float(p) for p in params))
+
+    name, *params = spec
+    if name == "uniform":
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if name == "normal":
+        mean, stddev = params
+        return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    if name == "lognormal":
+        median, sigma = params
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    if name == "exponential":
+        (mean,) = params
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"未対応の遅延分布です: {name}")
+
+
+class FaultInjector:
+    """リクエストごとに遅延と障害の種類を決めるクラス（スレッドセーフ）"""
+
+    def __init__(self, latency=None, error_rate=0.0, error_status=500, throttle_rate=0.0,
+                 unavailable_rate=0.0, retry_after=1, slow_drip_rate=0.0, drip_interval=0.2, drip_chunk=256,
+                 reset_rate=0.0, paths=DEFAULT_FAULT_PATHS, seed=None):
+        """
+        Args:
+            latency: 応答までの遅延（make_latency の指定）
+            error_rate / throttle_rate / unavailable_rate / slow_drip_rate / reset_rate (float):
+                各障害を起こす確率（合計1以下）
+            retry_after (int): 429/503 に付ける Retry-After の秒数（Noneなら付けない）
+            paths (tuple): 障害を注入するパス
+            seed (int): 乱数のシード（同じ結果を再現したい場合）
+        """
+        self.latency = make_latency(latency)
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.drip_interval = drip_interval
+        self.drip_chunk = drip_chunk
+        self.paths = tuple(paths)
+        self.rates = [
+            (ACTION_ERROR, error_rate),
+            (ACTION_THROTTLE, throttle_rate),
+            (ACTION_UNAVAILABLE, unavailable_rate),
+            (ACTION_SLOW_DRIP, slow_drip_rate),
+            (ACTION_RESET, reset_rate),
+        ]
+        if sum(rate for _, rate in self.rates) > 1.0:
+            raise ValueError("障害の確率の合計が1を超えています")
+        self.rng = random.Random(seed)
+        self.stats = {action: 0 for action in ACTIONS}
+        self._script = []
+        self._lock = threading.Lock()
+
+    def push(self, *actions):
+        """次のリクエストから順に、確率に関係なく起こす動作を予約する（台本）"""
+        for action in actions:
+            if action not in ACTIONS:
+                raise ValueError(f"未対応の動作です: {action}（{', '.join(ACTIONS)}）")
+        with self._lock:
+            self._script.extend(actions)
+
+    def applies_to(self, path):
+        return path in self.paths
+
+    def decide(self, path):
+        """
+        このリクエストの動作を決める
+
+        Returns:
+            tuple: (action: str, delay: float) delay は応答前に待つ秒数
+        """
+        with self._lock:
+            delay = self.latency(self.rng)
+            if self._script:
+                action = self._script.pop(0)
+            else:
+                action = ACTION_OK
+                draw = self.rng.random()
+                for candidate, rate in self.rates:
+                    if draw < rate:
+                        action = candidate
+                        break
+                    draw -= rate
+            self.stats[action] += 1
+        return action, delay
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
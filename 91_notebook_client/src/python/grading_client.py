@@ -3,34 +3,204 @@
 """
 
 import requests
-import time
 import json
-from datetime import datetime
+import contextlib
+import math
+import random
+import concurrent.futures
 import threading
+import uuid
+from datetime import datetime, timedelta
 from IPython.display import display, HTML, clear_output
 import ipywidgets as widgets
 import asyncio
+from .http_transport import get_shared_transport, CancelToken
+from .payload_codec import encode_json_body, available_encodings, COMPRESSION_THRESHOLD
+from .retry_policy import RetryPolicy
+from .result_cache import ResultCache
+from .job_store import JobStore
+from .submission_queue import SubmissionQueue, get_queue_flusher
+from .admission_control import get_admission_controller
+from .tracing import get_tracer
+from .ui_scheduler import get_ui_scheduler
+from .debug_artifacts import get_artifact_writer, KIND_REQUEST, KIND_ERROR
+from .delta_submission import DeltaTracker, get_shared_delta_tracker, DELTA_FEATURE, DELTA_ENCODING
 
 # Geminiのレスポンスが30秒超えることがあるため、長くしました
 REQUEST_TIMEOUT = 180
 
+# 圧縮を受け付けなかったサーバー（URL単位で記録し、以降は無圧縮で送る）
+_rejected_encodings = {}
+
+# サーバーが対応している機能（URL単位で /capabilities の結果を記録）
+_server_features = {}
+CAPABILITIES_TIMEOUT = 5
+
+# ジョブ方式（POST /jobs → GET /jobs/{id} で結果取得）の設定
+JOBS_FEATURE = "jobs"
+JOB_POLL_WAIT = 25          # 1回のロングポーリングでサーバーに待ってもらう秒数
+JOB_WAIT_TIMEOUT = 900      # 採点結果を待つ最大秒数
+
+# ストリーミング方式（問題ごとの採点結果をNDJSONで逐次受信）の設定
+STREAM_FEATURE = "stream"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# まとめて採点（全問題を1回で送信）の設定
+BATCH_FEATURE = "batch"
+BATCH_ASSIGNMENT_ID = "practice_problem_all"
+
+# リトライの上限に達した場合・混雑で送信を控えた場合のエラー（送信キューに保存する対象）
+RETRY_EXHAUSTED_ERROR = "最大リトライ回数に達しました"
+SERVICE_BUSY_ERROR = "採点システムが混雑しているため送信を保留しました"
+QUEUEABLE_ERRORS = (RETRY_EXHAUSTED_ERROR, SERVICE_BUSY_ERROR)
+
+# 送信中の処理（送信先・メールアドレス・問題ごと、カーネル内の全ボタンで共有）
+_in_flight_submissions = {}
+SUPERSEDED_ERROR = "新しい内容の送信に置き換えられました"
+
+# 送信の取り消し（送信ID -> 送信中の通信、カーネル内で共有）
+_active_submissions = {}
+CANCEL_FEATURE = "cancel"
+CANCEL_NOTIFY_TIMEOUT = 5
+SUBMISSION_ID_HEADER = "X-Submission-Id"
+CANCELLED_ERROR = "送信処理がユーザーによってキャンセルされました"
+
+# 計測結果の書き出し先
+TRACE_FILE = "grading_trace.jsonl"
+METRICS_FILE = "grading_metrics.prom"
+
+
+def _server_grading_seconds(response):
+    """Server-Timing ヘッダー（grade;dur=ミリ秒）からサーバーの採点時間を取り出す"""
+    for entry in response.headers.get("Server-Timing", "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name != "grade":
+            continue
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    return float(value) / 1000
+                except ValueError:
+                    return None
+    return None
+
+
+def run_coroutine(coro):
+    """
+    コルーチンをカーネルのイベントループ上で実行する
+    
+    Jupyter/Colab ではカーネルのイベントループが動いているので、Taskとして登録して
+    すぐに戻る。イベントループが動いていない環境（通常のスクリプト等）では
+    その場で完了まで実行し、完了済みのFutureを返す。
+    
+    Returns:
+        asyncio.Task または concurrent.futures.Future
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        return loop.create_task(coro)
+    
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(asyncio.run(coro))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+def _is_cell_cache_miss(response):
+    """差分送信で参照したセルがサーバーに無かったかどうか"""
+    try:
+        return response.json().get("error") == "cell_cache_miss"
+    except ValueError:
+        return False
+
+
+def _is_encoding_rejected(response):
+    """
+    圧縮したボディをサーバーが受け付けなかったかどうか
+
+    415 か、本文で Content-Encoding に触れている 400 だけを圧縮の拒否とみなす
+    （送信データの検証エラーなど、ほかの 400 で送り直したり圧縮をやめたりしない）。
+    """
+    if response.status_code == 415:
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        return "content-encoding" in response.text.lower()
+    except Exception:
+        return False
+
+
+def _is_client_failure(exc):
+    """
+    通信ではなくクライアント側の処理で起きた例外か（不正な応答の解釈失敗・バグなど）
+
+    送り直しても同じ結果になるので、リトライも送信キューへの保存もしない。
+    """
+    invalid_json = getattr(requests.exceptions, "InvalidJSONError", ())
+    return not isinstance(exc, requests.exceptions.RequestException) or isinstance(exc, invalid_json)
+
+
+def _output_scope(output):
+    """Outputウィジェットが指定されていればその中に表示する"""
+    if output is None:
+        return contextlib.nullcontext()
+    return output
+
 class GradingClient:
     """自動採点システムとの通信を管理するクラス"""
     
-    def __init__(self, base_url="http://localhost:8080"):
+    def __init__(self, base_url="http://localhost:8080", transport=None):
         self.base_url = base_url
         self.notebook_path = None
         self.headers = {'Content-Type': 'application/json'}
-        self.cancel_retry = False
+        # 接続プール（指定がなければカーネル内で共有するものを使う）
+        self._shared_transport = transport is None
+        self.transport = transport if transport is not None else get_shared_transport()
         
-        # リトライ処理用のクラスフィールド
-        self.current_submission_data = None
-        self.current_attempt = 0
-        self.max_retries = 3
-        # self.retry_delay = 10
-        self.retry_delay = 20
-        self.success_callback = None
-        self.error_callback = None
+        # リクエストボディ圧縮の設定
+        self.compression_enabled = True
+        self.compression_threshold = COMPRESSION_THRESHOLD
+        self.last_payload_stats = None
+        
+        # 差分送信（サーバーが対応している場合のみ使う）
+        self.delta_enabled = True
+        self.delta_tracker = get_shared_delta_tracker()
+        
+        # 採点結果キャッシュ（同じ内容の再送信は保存済みの結果を表示）
+        self.result_cache = ResultCache()
+        self.result_cache_enabled = True
+        
+        # ジョブ方式（サーバーが対応している場合のみ使う）
+        self.job_mode_enabled = True
+        self.job_store = JobStore()
+        self.job_wait_timeout = JOB_WAIT_TIMEOUT
+        
+        # ストリーミング方式（サーバーが対応している場合は最優先で使う）
+        self.streaming_enabled = True
+        self.last_stream_stats = None
+        
+        # 送信キュー（送信できなかった解答を保存し、接続が回復したら自動で送る）
+        self.offline_queue_enabled = True
+        self.submission_queue = SubmissionQueue()
+        
+        # 送信制御（送信頻度の制限とサーキットブレーカー、送信先URLごとに共有）
+        self.admission_control_enabled = True
+        
+        # 段階ごとの所要時間の計測（カーネル内で共有、既定は無効）
+        self.tracer = get_tracer()
+        
+        # リトライ方針（バックオフ・締め切り等はRetryPolicyで管理）
+        self.retry_policy = RetryPolicy(max_attempts=4, deadline=REQUEST_TIMEOUT + 120,
+                                        max_attempt_timeout=REQUEST_TIMEOUT)
+        self._cancel_events = set()
+        self.last_submission_id = None
     
     def set_grading_system_url(self, url):
         """採点システムのURLを設定"""
@@ -50,6 +220,296 @@ class GradingClient:
         """現在のノートブックパスを取得"""
         return self.notebook_path
     
+    def _get_transport(self):
+        """HTTPトランスポートを取得（共有トランスポートがクローズ済みなら取り直す）"""
+        if self._shared_transport and self.transport.is_closed():
+            self.transport = get_shared_transport()
+        return self.transport
+    
+    def configure_connection_pool(self, pool_connections=None, pool_maxsize=None, pool_block=None):
+        """接続プールの上限を変更（共有トランスポートの場合は全ウィジェットに反映）"""
+        self._get_transport().configure_pool(pool_connections, pool_maxsize, pool_block)
+    
+    def get_connection_stats(self):
+        """接続再利用の統計を取得"""
+        return self._get_transport().get_stats()
+    
+    def close(self):
+        """保持しているHTTP接続を閉じる"""
+        self.transport.close()
+    
+    def set_retry_policy(self, retry_policy):
+        """リトライ方針（RetryPolicyまたはその派生クラス）を設定"""
+        self.retry_policy = retry_policy
+    
+    def get_retry_policy(self):
+        """現在のリトライ方針を取得"""
+        return self.retry_policy
+    
+    def set_admission_control(self, enabled=True):
+        """送信制御（送信頻度の制限・混雑時の送信停止）の有効/無効を設定"""
+        self.admission_control_enabled = enabled
+    
+    def get_admission_controller(self):
+        """送信先URLの送信制御を取得（無効ならNone）"""
+        if not self.admission_control_enabled:
+            return None
+        return get_admission_controller(self.base_url)
+    
+    def admit_request(self):
+        """
+        サーキットブレーカーが送信を許可するか
+        
+        送信停止中ならFalse。停止から一定時間経っていれば、試しの1件だけTrueを返す。
+        """
+        admission = self.get_admission_controller()
+        return admission is None or admission.breaker.allow_request()
+    
+    def get_service_busy_seconds(self):
+        """混雑で送信を止めている場合、再開までの秒数（止めていなければ0）"""
+        admission = self.get_admission_controller()
+        return 0.0 if admission is None else admission.breaker.retry_after()
+    
+    def _acquire_send_slot(self, path, timeout):
+        """
+        送信頻度・同時送信数の枠を確保（確保できなければFalse）
+        
+        確保できなかった場合は送信しないので、admit_request() で得た試しの送信枠も返す。
+        """
+        admission = self.get_admission_controller()
+        if admission is None or admission.bucket(path).acquire(timeout=timeout):
+            return True
+        admission.breaker.record_neutral()
+        return False
+    
+    def _record_send_result(self, path, response=None, exc=None, cancel_token=None):
+        """
+        送信結果を送信制御に記録し、枠を返す（response も exc も無ければ枠を返すだけ）
+        
+        取り消しで切断した送信の例外は、混雑・障害には数えない（枠を返すだけ）。
+        """
+        admission = self.get_admission_controller()
+        if admission is None:
+            return
+        if response is not None:
+            admission.record_result(path, response.status_code, response.headers)
+        elif cancel_token is not None and cancel_token.cancelled:
+            admission.record_result(path)
+        else:
+            admission.record_result(path, exc=exc)
+    
+    def set_tracing(self, enabled=True, capacity=None):
+        """段階ごとの所要時間の計測を有効/無効にする（capacity は保持する記録の件数）"""
+        self.tracer.set_enabled(enabled, capacity)
+    
+    def get_trace_summary(self):
+        """段階ごとの件数・合計・平均（秒）"""
+        return self.tracer.get_summary()
+    
+    def export_traces(self, path=TRACE_FILE):
+        """計測記録をJSON Lines形式で書き出す"""
+        count = self.tracer.export_jsonl(path)
+        print(f"📝 計測記録を書き出しました: {path} ({count} 件)")
+        return path
+    
+    def export_metrics(self, path=METRICS_FILE):
+        """計測の集計（所要時間のヒストグラムとカウンター）をPrometheus形式で書き出す"""
+        self.tracer.export_prometheus(path)
+        print(f"📈 計測の集計を書き出しました: {path}")
+        return path
+    
+    def set_debug_artifacts(self, level):
+        """デバッグ用ファイルの保存レベルを設定（off / errors / all、カーネル内で共有）"""
+        get_artifact_writer().configure(level=level)
+    
+    def set_compression(self, enabled=True, threshold=None):
+        """リクエストボディ圧縮の有効/無効と閾値（バイト）を設定"""
+        self.compression_enabled = enabled
+        if threshold is not None:
+            self.compression_threshold = threshold
+    
+    def _get_allowed_encodings(self):
+        """このサーバーに対して使ってよい圧縮形式"""
+        if not self.compression_enabled:
+            return []
+        rejected = _rejected_encodings.get(self.base_url, set())
+        return [e for e in available_encodings() if e not in rejected]
+    
+    def get_server_features(self, refresh=False):
+        """
+        採点サーバーが対応している機能を取得（GET /capabilities、URL単位でキャッシュ）
+        
+        対応していないサーバー（404など）の場合は空のセットを返す。
+        
+        Returns:
+            set: 機能名のセット
+        """
+        if not refresh and self.base_url in _server_features:
+            return _server_features[self.base_url]
+        try:
+            response = self._get_transport().get(
+                f"{self.base_url}/capabilities", timeout=CAPABILITIES_TIMEOUT
+            )
+        except requests.exceptions.RequestException:
+            return set()  # 通信できない場合は記録せず、次回また問い合わせる
+        features = set()
+        if response.status_code == 200:
+            try:
+                features = set(response.json().get("features", []))
+            except ValueError:
+                features = set()
+        _server_features[self.base_url] = features
+        return features
+    
+    def set_result_cache(self, enabled=True, result_cache=None):
+        """採点結果キャッシュの有効/無効と、使用するキャッシュを設定"""
+        self.result_cache_enabled = enabled
+        if result_cache is not None:
+            self.result_cache = result_cache
+    
+    def clear_result_cache(self):
+        """採点結果キャッシュを全て削除"""
+        self.result_cache.invalidate()
+    
+    def set_job_mode(self, enabled=True, wait_timeout=None):
+        """ジョブ方式の有効/無効と、結果を待つ最大秒数を設定"""
+        self.job_mode_enabled = enabled
+        if wait_timeout is not None:
+            self.job_wait_timeout = wait_timeout
+    
+    def set_streaming(self, enabled=True):
+        """ストリーミング方式（採点が終わった問題から順に表示）の有効/無効を設定"""
+        self.streaming_enabled = enabled
+    
+    def set_offline_queue(self, enabled=True, submission_queue=None):
+        """送信キュー（送信できなかった解答の自動再送）の有効/無効と、使用するキューを設定"""
+        self.offline_queue_enabled = enabled
+        if submission_queue is not None:
+            self.submission_queue = submission_queue
+    
+    def get_queue_flusher(self):
+        """送信キューを送り出すQueueFlusherを取得（送信先URLごとに共有）"""
+        def on_created(flusher):
+            flusher.add_listener(self._on_queue_entry_sent)
+        return get_queue_flusher(self, self.submission_queue, on_created)
+    
+    def start_queue_flusher(self):
+        """送信キューのバックグラウンド送信を開始（キューが空なら何もしない）"""
+        if not self.submission_queue.has_pending(self.base_url):
+            return None
+        return self.get_queue_flusher().start()
+    
+    def get_queue_entries(self, student_email=None, problem_number=None):
+        """送信キューの内容（送信データ本体を除く）を取得"""
+        return self.submission_queue.list_entries(self.base_url, student_email, problem_number)
+    
+    def _on_queue_entry_sent(self, entry, success, result, error_msg):
+        """送信キューから送れた採点結果を、採点結果キャッシュに保存"""
+        if not success or not self.result_cache_enabled:
+            return
+        submission_data = entry["submission_data"]
+        cache_key = ResultCache.make_key(
+            entry["base_url"], submission_data.get("student_email"), submission_data.get("assignment_id"),
+            submission_data.get("notebook_path"), submission_data["notebook"]["cells"]
+        )
+        self.result_cache.put(cache_key, result)
+    
+    def set_delta_submission(self, enabled=True):
+        """差分送信の有効/無効を設定"""
+        self.delta_enabled = enabled
+    
+    def _post_submission(self, path, submission_data, timeout=REQUEST_TIMEOUT, stream=False, extra_headers=None,
+                         trace_tags=None, cancel_token=None):
+        """
+        送信データをPOSTする（サーバーが対応していれば差分送信）
+        
+        前回送信に成功したセルはハッシュ参照だけを送る。サーバーが参照を
+        解決できなかった場合（409 cell_cache_miss）は全セルを送り直す。
+        """
+        cells = submission_data["notebook"]["cells"]
+        key = DeltaTracker.make_key(self.base_url, submission_data)
+        hashes = None
+        delta_stats = None
+        response = None
+        
+        if self.delta_enabled and DELTA_FEATURE in self.get_server_features():
+            delta_cells, hashes, changed = self.delta_tracker.build_delta(key, cells)
+            if delta_cells is not None:
+                delta_data = dict(submission_data)
+                delta_data["notebook"] = dict(submission_data["notebook"], cells=delta_cells)
+                delta_data["cell_encoding"] = DELTA_ENCODING
+                delta_stats = {"changed_cells": changed, "total_cells": len(cells), "cache_miss": False}
+                response = self._post_json(path, delta_data, timeout=timeout, stream=stream,
+                                           extra_headers=extra_headers, trace_tags=trace_tags,
+                                           cancel_token=cancel_token)
+                if response.status_code == 409 and _is_cell_cache_miss(response):
+                    self.delta_tracker.forget(key)
+                    delta_stats["cache_miss"] = True
+                    response.close()  # stream=True の場合も接続をプールに戻す
+                    response = None
+        
+        if response is None:
+            response = self._post_json(path, submission_data, timeout=timeout, stream=stream,
+                                       extra_headers=extra_headers, trace_tags=trace_tags,
+                                       cancel_token=cancel_token)
+        # ジョブ方式では受け付けた時点（202）でサーバーがセルを記録している
+        if response.status_code in (200, 202) and hashes is not None:
+            self.delta_tracker.remember(key, hashes)
+        response.delta_stats = delta_stats
+        return response
+    
+    def _post_json(self, path, data, timeout=REQUEST_TIMEOUT, stream=False, extra_headers=None, trace_tags=None,
+                   cancel_token=None):
+        """
+        JSONを（必要なら圧縮して）POSTする
+        
+        サーバーが圧縮形式を受け付けなかった場合（415、または Content-Encoding に触れた 400）は、
+        その形式を記録して無圧縮で送り直す。
+        
+        Args:
+            trace_tags (dict): 計測記録に付ける情報（試行回数など）
+            cancel_token (CancelToken): 送信を中断するためのトークン（送信IDもヘッダーで送る）
+        """
+        url = f"{self.base_url}{path}"
+        if cancel_token is not None and cancel_token.submission_id:
+            extra_headers = dict(extra_headers or {}, **{SUBMISSION_ID_HEADER: cancel_token.submission_id})
+        trace_tags = dict(trace_tags or {}, path=path)
+        with self.tracer.span("serialize", **trace_tags) as span:
+            body, headers, stats = encode_json_body(
+                data, self._get_allowed_encodings(), self.compression_threshold
+            )
+            span.set_tag("raw_bytes", stats["raw_bytes"])
+            span.set_tag("encoding", stats["encoding"])
+        request_headers = dict(self.headers)
+        request_headers.update(extra_headers or {})
+        request_headers.update(headers)
+        with self.tracer.span("network", sent_bytes=stats["sent_bytes"], **trace_tags) as span:
+            response = self._get_transport().post(url, data=body, headers=request_headers, timeout=timeout,
+                                                  stream=stream, cancel_token=cancel_token)
+            span.set_tag("status", response.status_code)
+        
+        if stats["encoding"] != "identity" and _is_encoding_rejected(response):
+            rejected_encoding = stats["encoding"]
+            _rejected_encodings.setdefault(self.base_url, set()).add(rejected_encoding)
+            body, headers, stats = encode_json_body(data, [], self.compression_threshold)
+            stats["rejected_encoding"] = rejected_encoding
+            response.close()
+            request_headers = dict(self.headers)
+            request_headers.update(extra_headers or {})
+            request_headers.update(headers)
+            with self.tracer.span("network", sent_bytes=stats["sent_bytes"], **trace_tags) as span:
+                response = self._get_transport().post(url, data=body, headers=request_headers, timeout=timeout,
+                                                      stream=stream, cancel_token=cancel_token)
+                span.set_tag("status", response.status_code)
+        
+        if self.tracer.enabled:
+            grading_seconds = _server_grading_seconds(response)
+            if grading_seconds is not None:
+                self.tracer.record("server_grading", grading_seconds, trace_tags)
+        self.last_payload_stats = stats
+        response.payload_stats = stats
+        return response
+    
     def create_submission_data(self, student_email, problem_number, notebook_cells):
         """送信データを構築"""
         return {
@@ -67,27 +527,49 @@ class GradingClient:
             }
         }
     
+    def create_batch_submission_data(self, student_email, problem_cells):
+        """
+        全問題まとめて採点用の送信データを構築
+        
+        各問題の送信対象セルは同じノートブックの先頭部分なので、最も長いものを1回だけ送り、
+        問題ごとには先頭から何セルが対象かを cell_count で示す。
+        
+        Args:
+            problem_cells (dict): 問題番号 -> 送信対象セルのリスト
+        """
+        all_cells = max(problem_cells.values(), key=len)
+        submission_data = self.create_submission_data(student_email, None, all_cells)
+        submission_data["assignment_id"] = BATCH_ASSIGNMENT_ID
+        submission_data["problems"] = [
+            {
+                "problem_number": problem_number,
+                "assignment_id": f"practice_problem_{problem_number}",
+                "cell_count": len(cells),
+            }
+            for problem_number, cells in problem_cells.items()
+        ]
+        return submission_data
+    
     def save_submission_data_to_file(self, submission_data, problem_number):
-        """送信データを自動保存（デバッグ用）"""
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"request_packet_p{problem_number:02d}_{timestamp}.json"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(submission_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"🔍 送信データ保存: {filename} ({len(json.dumps(submission_data)):,} bytes)")
-            return filename
-            
-        except Exception as save_error:
-            print(f"⚠️ 自動保存エラー: {save_error}")
-            return None
+        """
+        送信データを自動保存（デバッグ用、problem_number が None なら全問題まとめて送信）
+        
+        保存はバックグラウンドで行うので、送信処理は書き込みを待たない。
+        
+        Returns:
+            str: 保存先のパス（保存レベルが all 以外ならNone）
+        """
+        label = "pall" if problem_number is None else f"p{problem_number:02d}"
+        with self.tracer.span("save_debug_file", problem_number=problem_number):
+            filename = get_artifact_writer().write(KIND_REQUEST, submission_data, label)
+        if filename:
+            print(f"🔍 送信データ保存: {filename}")
+        return filename
     
     def _save_error_response_to_file(self, response, attempt):
         """エラーレスポンスを詳細に保存（デバッグ用）"""
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"error_response_attempt{attempt}_{timestamp}.json"
             
             error_data = {
                 "timestamp": timestamp,
@@ -99,10 +581,9 @@ class GradingClient:
                 "request_headers": dict(response.request.headers) if response.request else None
             }
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(error_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"🔍 エラーレスポンス保存: {filename}")
+            filename = get_artifact_writer().write(KIND_ERROR, error_data, f"attempt{attempt}")
+            if filename:
+                print(f"🔍 エラーレスポンス保存: {filename}")
             return filename, error_data
             
         except Exception as save_error:
@@ -168,138 +649,115 @@ class GradingClient:
             print(f"   ステータスコード: {error_data['status_code']}")
             print(f"   レスポンス: {error_data['response_text'][:500]}...")
     
-    def show_retry_countdown_with_cancel2(self, retry_delay, attempt, max_retries, test_c_send, test_c_cancel):
-        """リトライのカウントダウンとキャンセル機能を表示（コールバック方式）"""
-        try:
-            import threading
-            from time import time
-
-            print(f"🔄 送信関数 test_c_send を呼び出します...(1)")
-            result = self.test_c_send()
-            if result:  # 成功なら
-                return  # その場で終了。必要な処理は送信処理の中で実装しておいてください。
-
-            # リトライ回数を進めておく
-            attempt += 1
-
-            # リトライキャンセルフラグをリセット
-            self.cancel_retry = False
-            
-            print(f"🔄 リトライ {attempt}/{max_retries} を {retry_delay} 秒後に実行します...")
-            print("━" * 50)
-            print("⚠️ リトライをキャンセルする方法:")
-            print("1. 🛑 下のキャンセルボタンを押す")
-            print("2. 🔴 または Kernel → Interrupt を選択")
-            print("━" * 50)
-            
-            # プログレスバーとキャンセルボタン
-            progress_bar = widgets.IntProgress(
-                value=0,
-                min=0,
-                max=retry_delay,
-                description=f'リトライ待機中 ({attempt}/{max_retries}):',
-                bar_style='warning',
-                orientation='horizontal'
-            )
-            
-            cancel_button = widgets.Button(
-                description="❌ キャンセル",
-                button_style='danger',
-                layout=widgets.Layout(width='120px')
+    async def _retry_countdown(self, retry_delay, attempt, max_retries, cancel_event, on_cancel=None):
+        """
+        リトライまでのカウントダウンとキャンセルボタンを表示（コルーチン）
+        
+        Args:
+            retry_delay (float): 次の送信までの待ち秒数（リトライ方針が決めた実際の値）
+        
+        Returns:
+            bool: カウントダウン完了ならTrue、キャンセルされたらFalse
+        """
+        next_attempt_at = datetime.now() + timedelta(seconds=retry_delay)
+        print(f"🔄 リトライ {attempt}/{max_retries} を {retry_delay:.1f} 秒後（{next_attempt_at:%H:%M:%S}）に実行します...")
+        print("━" * 50)
+        print("⚠️ リトライをキャンセルする方法:")
+        print("1. 🛑 下のキャンセルボタンを押す")
+        print("2. 🔴 または Kernel → Interrupt を選択")
+        print("━" * 50)
+        
+        # プログレスバーとキャンセルボタン
+        progress_bar = widgets.FloatProgress(
+            value=0,
+            min=0,
+            max=max(retry_delay, 0.1),
+            description=f'リトライ待機中 ({attempt}/{max_retries}):',
+            bar_style='warning',
+            orientation='horizontal'
+        )
+        
+        cancel_button = widgets.Button(
+            description="❌ キャンセル",
+            button_style='danger',
+            layout=widgets.Layout(width='120px')
+        )
+        
+        scheduler = get_ui_scheduler()
+        
+        # キャンセルボタンのイベントハンドラ
+        def on_cancel_clicked(_):
+            cancel_event.set()
+            scheduler.update(cancel_button, disabled=True, description="キャンセル済み")
+            scheduler.update(progress_bar, bar_style='danger', description='キャンセル済み:')
+            print("🚫 リトライがキャンセルされました！")
+            if on_cancel:
+                on_cancel()
+        
+        cancel_button.on_click(on_cancel_clicked)
+        
+        # UIを表示
+        display(widgets.VBox([progress_bar, cancel_button]))
+        
+        # 残り秒数の表示はカーネル内で共有のスケジューラーが1秒ごとに進める
+        # （複数のボタンが同時に待機していても、タイマーは1つだけ）
+        def on_tick(remaining, elapsed):
+            scheduler.update(
+                progress_bar,
+                value=min(elapsed, retry_delay),
+                description=f'リトライまであと {math.ceil(remaining)} 秒 ({attempt}/{max_retries}):'
             )
-            
-            # キャンセルボタンのイベントハンドラ
-            def on_cancel_clicked(_):
-                self.cancel_retry = True
-                cancel_button.disabled = True
-                cancel_button.description = "キャンセル済み"
-                progress_bar.bar_style = 'danger'
-                progress_bar.description = 'キャンセル済み:'
-                print("🚫 リトライがキャンセルされました！")
-                if test_c_cancel:
-                    self.test_c_cancel()
-            
-            cancel_button.on_click(on_cancel_clicked)
-            
-            # UIを表示
-            ui_box = widgets.VBox([progress_bar, cancel_button])
-            display(ui_box)
-            
-            start_time = time()
-            
-            # 1秒間隔でのタイマーコールバック
-            def on_timer():
-                if self.cancel_retry:
-                    return  # キャンセル済みなら何もしない
-                
-                # 経過時間を計算してプログレスバーを更新
-                elapsed = time() - start_time
-                remaining_seconds = max(0, retry_delay - int(elapsed))
-                progress_value = min(int(elapsed), retry_delay)
-                
-                progress_bar.value = progress_value
-                progress_bar.description = f'リトライまであと {remaining_seconds} 秒 ({attempt}/{max_retries}):'
-                
-                # 時間が経過していない場合は次のタイマーをセット
-                if elapsed < retry_delay:
-
-                    # 再度タイマーを開始
-                    countdown_timer = threading.Timer(1.0, on_timer)
-                    countdown_timer.start()
-
-                else:
-
-                    # 送信リトライまでのカウントダウン完了
-                    progress_bar.value = retry_delay
-                    progress_bar.bar_style = 'success'
-                    progress_bar.description = f'リトライ {attempt}/{max_retries} 実行中:'
-                    cancel_button.disabled = True
-                    print(f"⏰ リトライ {attempt}/{max_retries} を実行します...")
-                    print(f"🔄 送信関数 show_retry_countdown_with_cancel2 を呼び出します...(1)")
-
-                    # リトライ回数がMaxに達したかどうかをチェックする
-                    if attempt >= max_retries:
-                        return
-
-                    # あまりよろしくはないが、再帰的に呼び出す。
-                    # こうすることで、再送信処理、引き続きリトライボタンの表示等が行える
-                    self.show_retry_countdown_with_cancel2(retry_delay, attempt, max_retries,
-                                                           test_c_send, test_c_cancel)
-
-            # 最初のタイマーを開始
-            countdown_timer = threading.Timer(1.0, on_timer)
-            countdown_timer.start()
-            
-            # コールバック方式なので戻り値は不要
-            
-        except Exception as e:
-            print(f"⚠️ リトライUI表示エラー: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            # 最もシンプルなフォールバック
-            print(f"📝 {retry_delay}秒後にリトライします...")
-            print("🛑 キャンセルする場合は Kernel → Interrupt を選択してください")
-            
-            # time.sleep(retry_delay)
-            # if on_complete_callback:
-            #    on_complete_callback()
-
-    def test_c_send(self):
+        
+        countdown = scheduler.countdown(retry_delay, on_tick)
+        cancel_waiter = asyncio.ensure_future(cancel_event.wait())
+        try:
+            await asyncio.wait({countdown.future, cancel_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancel_waiter.cancel()
+            countdown.cancel()
+        if cancel_event.is_set():
+            return False  # キャンセル済み
+        
+        # 送信リトライまでのカウントダウン完了
+        scheduler.update(
+            progress_bar,
+            value=progress_bar.max,
+            bar_style='success',
+            description=f'リトライ {attempt}/{max_retries} 実行中:'
+        )
+        scheduler.update(cancel_button, disabled=True)
+        print(f"⏰ リトライ {attempt}/{max_retries} を実行します...")
+        return True
+    
+    async def test_c_send(self):
         print("test_c_send() 送信処理のテストです。実際には送らず、sleep(3)します")
-        time.sleep(3)
+        await asyncio.sleep(3)
         print("test_c_send() 送信処理ダミー完了。sleep(3)しますた")
+        return False
 
     def test_c_cancel(self):
         print("test_c_cancel() 送信キャンセル終了処理のテストです")
 
+    async def _test_retry_loop(self, max_retry, retry_delay):
+        """通信処理を実行しないリトライ処理のテスト"""
+        cancel_event = asyncio.Event()
+        attempt = 0
+        while True:
+            print(f"🔄 送信関数 test_c_send を呼び出します...")
+            if await self.test_c_send():
+                return True
+            attempt += 1
+            if attempt > max_retry:
+                print(f"❌ 最大リトライ回数({max_retry})に達しました")
+                return False
+            if not await self._retry_countdown(retry_delay, attempt, max_retry, cancel_event, self.test_c_cancel):
+                return False
+
     def test_cancel_button(self, max_retry, retry_delay):
         """キャンセルボタンのテスト関数"""
         try:
             print("🧪 キャンセルボタンのテストを開始します...")
             
-            self.cancel_retry = False
-            
             test_button = widgets.Button(
                 description="🧪 テストボタン",
                 button_style='warning',
@@ -309,14 +767,12 @@ class GradingClient:
             status_label = widgets.Label(value="ボタンを押してテストしてください")
             
             def on_test_clicked(_):
-                self.cancel_retry = True
                 status_label.value = "✅ ボタンが正常に動作しています！"
                 test_button.disabled = True
                 print("✅ テスト成功: ボタンクリックが検出されました")
 
                 # 通信処理を実行しないテスト版
-                # 第二引数に現在のリトライ数を渡すが、最初は０。なぜならリトライしていないため。
-                self.show_retry_countdown_with_cancel2(retry_delay, 0, max_retry, self.test_c_send, self.test_c_cancel)
+                run_coroutine(self._test_retry_loop(max_retry, retry_delay))
 
             test_button.on_click(on_test_clicked)
             
@@ -330,206 +786,546 @@ class GradingClient:
             import traceback
             traceback.print_exc()
     
-    def _show_retry_countdown_with_cancel(self, retry_delay, attempt, max_retries, send_func, cancel_func):
-        """実際の送信処理用のリトライカウントダウン（show_retry_countdown_with_cancel2と同じ設計）"""
+    def _send_request(self, submission_data, timeout=REQUEST_TIMEOUT, path="/grade", attempt=0, cancel_token=None):
+        """
+        採点システムへ1回だけ送信する（ブロッキング。executorスレッドから呼ばれる）
+        
+        cancel_token.cancel() が呼ばれると、応答を待たずに通信を切断して戻る。
+        
+        Returns:
+            tuple: (success: bool, result: dict, error_msg: str, response, exc)
+        """
+        if not self._acquire_send_slot(path, timeout):
+            return False, None, SERVICE_BUSY_ERROR, None, None
+        trace_tags = {"assignment_id": submission_data.get("assignment_id"), "attempt": attempt + 1}
+        try:
+            response = self._post_submission(path, submission_data, timeout=timeout, trace_tags=trace_tags,
+                                             cancel_token=cancel_token)
+        except requests.exceptions.RequestException as e:
+            self._record_send_result(path, exc=e, cancel_token=cancel_token)
+            return False, None, f"ネットワークエラー: {str(e)}", None, e
+        except BaseException:
+            # 送信データの変換エラーなど（届いたか分からないので、障害とは数えずに枠を返す）
+            self._record_send_result(path)
+            raise
+        self._record_send_result(path, response)
+        
+        if response.status_code in (200, 202):
+            return True, response.json(), None, response, None
+        return False, None, f"HTTP {response.status_code}: {response.text}", response, None
+    
+    async def _send_attempt(self, submission_data, budget, path="/grade", cancel_token=None):
+        """
+        1回分の送信（HTTP通信はexecutorで実行し、イベントループを止めない）
+        
+        Returns:
+            tuple: (success: bool, result: dict, error_msg: str, response, exc)
+        """
+        attempt = budget.attempt
+        timeout = budget.attempt_timeout()
+        if attempt == 0:
+            print(f"🔄 送信処理を実行します...")
+        else:
+            print(f"🔄 送信処理を実行します... (試行 {attempt + 1}/{budget.policy.max_attempts})")
+        print(f"📡 送信処理実行中...（タイムアウト {timeout:.0f} 秒）")
+        
+        budget.record_attempt()
+        loop = asyncio.get_running_loop()
         try:
-            import threading
-            from time import time
-
-            # 最初の送信処理を実行
-            # print(f"🔄 送信処理を実行します... (試行 {attempt + 1}/{max_retries + 1})") # リトライしていないうちから回数表示するの辞めたい。
-            if attempt == 0:
-                print(f"🔄 送信処理を実行します...")
-            else:
-                print(f"🔄 送信処理を実行します... (試行 {attempt + 1}/{max_retries + 1})")
-
-            result = send_func()
-            if result:  # 成功なら
-                return  # その場で終了。必要な処理は送信処理の中で実装済み
-
-            # リトライ回数を進めておく
-            attempt += 1
-
-            # 最大リトライ回数チェック
-            # if attempt >= max_retries:
-            if attempt > max_retries:  # 超えた段階で終了とすること。
-                print(f"❌ 最大リトライ回数({max_retries})に達しました")
-                if self.error_callback:
-                    self.error_callback("最大リトライ回数に達しました")
-                return
-
-            # リトライキャンセルフラグをリセット
-            self.cancel_retry = False
-            
-            # print(f"🔄 リトライ {attempt + 1}/{max_retries} を {retry_delay} 秒後に実行します...")  # attempt+=1 してしまっているから多いです。
-            print(f"🔄 リトライ {attempt}/{max_retries} を {retry_delay} 秒後に実行します...")
-            print("━" * 50)
-            print("⚠️ リトライをキャンセルする方法:")
-            print("1. 🛑 下のキャンセルボタンを押す")
-            print("2. 🔴 または Kernel → Interrupt を選択")
-            print("━" * 50)
-            
-            # プログレスバーとキャンセルボタン
-            progress_bar = widgets.IntProgress(
-                value=0,
-                min=0,
-                max=retry_delay,
-                # description=f'リトライ待機中 ({attempt + 1}/{max_retries}):',  # attempt+=1 してしまっているから多いです。
-                description=f'リトライ待機中 ({attempt}/{max_retries}):',
-                bar_style='warning',
-                orientation='horizontal'
+            success, result, error_msg, response, exc = await loop.run_in_executor(
+                None, self._send_request, submission_data, timeout, path, attempt, cancel_token
             )
+        except Exception as e:
+            print(f"❌ 送信失敗: 予期しないエラー: {str(e)}")
+            return False, None, f"予期しないエラー: {str(e)}", None, e
+        
+        if response is not None:
+            self._print_payload_stats(response.payload_stats, response.delta_stats)
+        if success:
+            return True, result, None, response, None
+        
+        if response is not None:
+            # エラーレスポンスの詳細保存
+            filename, error_data = self._save_error_response_to_file(response, attempt)
+            print(f"❌ 送信エラー: {error_msg}")
             
-            cancel_button = widgets.Button(
-                description="❌ キャンセル",
-                button_style='danger',
-                layout=widgets.Layout(width='120px')
+            # エラー詳細をWidgetで表示
+            if error_data:
+                self._display_error_details_widget(error_data, filename or "保存していません")
+        else:
+            print(f"❌ 送信失敗: {error_msg}")
+        return False, None, error_msg, response, exc
+    
+    def _stream_request(self, submission_data, timeout, on_event, attempt=0, cancel_token=None):
+        """
+        採点システムへ送信し、NDJSONの採点結果を1行ずつ受信する（executorスレッドから呼ばれる）
+        
+        Args:
+            on_event (callable): 受信したイベント（dict）ごとに呼ばれる関数
+        
+        Returns:
+            tuple: (success: bool, result: dict, error_msg: str, response, exc)
+        """
+        if not self._acquire_send_slot("/grade", timeout):
+            return False, None, SERVICE_BUSY_ERROR, None, None
+        trace_tags = {"assignment_id": submission_data.get("assignment_id"), "attempt": attempt + 1}
+        try:
+            response = self._post_submission(
+                "/grade", submission_data, timeout=timeout, stream=True,
+                extra_headers={"Accept": NDJSON_CONTENT_TYPE}, trace_tags=trace_tags, cancel_token=cancel_token
             )
+        except requests.exceptions.RequestException as e:
+            self._record_send_result("/grade", exc=e, cancel_token=cancel_token)
+            return False, None, f"ネットワークエラー: {str(e)}", None, e
+        except BaseException:
+            self._record_send_result("/grade")
+            raise
+        self._record_send_result("/grade", response)
+        
+        # どの経路で戻っても、応答を閉じて接続をプールに戻し、トークンからソケットを外す
+        try:
+            if response.status_code != 200:
+                return False, None, f"HTTP {response.status_code}: {response.text}", response, None
+            if not response.headers.get("Content-Type", "").startswith(NDJSON_CONTENT_TYPE):
+                return True, response.json(), None, response, None  # サーバーが通常の応答を返した
             
-            # キャンセルボタンのイベントハンドラ
-            def on_cancel_clicked(_):
-                self.cancel_retry = True
-                cancel_button.disabled = True
-                cancel_button.description = "キャンセル済み"
-                progress_bar.bar_style = 'danger'
-                progress_bar.description = 'キャンセル済み:'
-                print("🚫 リトライがキャンセルされました！")
-                if cancel_func:
-                    cancel_func()
-            
-            cancel_button.on_click(on_cancel_clicked)
-            
-            # UIを表示
-            ui_box = widgets.VBox([progress_bar, cancel_button])
-            display(ui_box)
-            
-            start_time = time()
+            header = {}
+            problems = []
+            result = None
+            # 採点が終わった問題から届くので、受信時間にはサーバーの採点時間が含まれる
+            with self.tracer.span("receive_stream", **trace_tags) as receive_span:
+                try:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        on_event(event)
+                        event_type = event.get("type")
+                        if event_type == "start":
+                            header = event
+                        elif event_type == "problem":
+                            problems.append(event.get("problem", {}))
+                        elif event_type == "end":
+                            result = {
+                                "student_email": header.get("student_email"),
+                                "assignment_id": header.get("assignment_id"),
+                                "timestamp": header.get("timestamp"),
+                                "notebook_results": {
+                                    "problems": problems,
+                                    "overall_feedback": event.get("overall_feedback", ""),
+                                    "execution_log": event.get("execution_log", ""),
+                                },
+                            }
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    # 途中で切れた場合は通信エラーとして扱い、リトライ対象にする
+                    receive_span.set_tag("error", type(e).__name__)
+                    e = requests.exceptions.ConnectionError(str(e))
+                    return False, None, f"採点結果の受信中に切断されました: {e}", None, e
+                finally:
+                    receive_span.set_tag("problems", len(problems))
+        finally:
+            response.close()
+            if cancel_token is not None:
+                cancel_token.release()
+        
+        if result is None:
+            e = requests.exceptions.ConnectionError("採点結果の受信が途中で終了しました")
+            return False, None, str(e), None, e
+        return True, result, None, response, None
+    
+    async def _send_stream_attempt(self, submission_data, budget, on_stream_event=None, cancel_token=None):
+        """
+        1回分のストリーミング送信（コルーチン）
+        
+        受信スレッドから届いたイベントをイベントループ側で on_stream_event に渡し、
+        採点が終わった問題から順に表示できるようにする。
+        
+        Returns:
+            tuple: (success: bool, result: dict, error_msg: str, response, exc)
+        """
+        attempt = budget.attempt
+        timeout = budget.attempt_timeout()
+        if attempt == 0:
+            print(f"🔄 送信処理を実行します...")
+        else:
+            print(f"🔄 送信処理を実行します... (試行 {attempt + 1}/{budget.policy.max_attempts})")
+        print(f"📡 送信処理実行中...（採点が終わった問題から順に表示します）")
+        
+        budget.record_attempt()
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        started_at = loop.time()
+        first_score_at = None
+        
+        def on_event(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        
+        def dispatch(event):
+            nonlocal first_score_at
+            if event.get("type") == "problem" and first_score_at is None:
+                first_score_at = loop.time()
+            if on_stream_event:
+                on_stream_event(event)
+        
+        request_future = loop.run_in_executor(None, self._stream_request, submission_data, timeout, on_event,
+                                              attempt, cancel_token)
+        while True:
+            get_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({get_event, request_future}, return_when=asyncio.FIRST_COMPLETED)
+            if get_event in done:
+                dispatch(get_event.result())
+                continue
+            get_event.cancel()
+            # 受信スレッドの終了後に届いたイベントを処理してから終える
+            await asyncio.sleep(0)
+            while not events.empty():
+                dispatch(events.get_nowait())
+            break
+        
+        try:
+            success, result, error_msg, response, exc = request_future.result()
+        except Exception as e:
+            print(f"❌ 送信失敗: 予期しないエラー: {str(e)}")
+            return False, None, f"予期しないエラー: {str(e)}", None, e
+        
+        finished_at = loop.time()
+        if first_score_at is not None:
+            self.tracer.record("time_to_first_score", first_score_at - started_at,
+                               {"assignment_id": submission_data.get("assignment_id"), "attempt": attempt + 1})
+        self.last_stream_stats = {
+            "time_to_first_score": None if first_score_at is None else first_score_at - started_at,
+            "total_time": finished_at - started_at,
+        }
+        if response is not None:
+            self._print_payload_stats(response.payload_stats, response.delta_stats)
+        if success:
+            if first_score_at is not None:
+                print(f"⏱️ 最初の得点表示まで {first_score_at - started_at:.2f} 秒"
+                      f"（全体 {finished_at - started_at:.2f} 秒）")
+            return True, result, None, response, None
+        
+        if response is not None:
+            # エラーレスポンスの詳細保存
+            filename, error_data = self._save_error_response_to_file(response, attempt)
+            print(f"❌ 送信エラー: {error_msg}")
             
-            # 1秒間隔でのタイマーコールバック
-            def on_timer():
-                if self.cancel_retry:
-                    return  # キャンセル済みなら何もしない
+            # エラー詳細をWidgetで表示
+            if error_data:
+                self._display_error_details_widget(error_data, filename or "保存していません")
+        else:
+            print(f"❌ 送信失敗: {error_msg}")
+        return False, None, error_msg, response, exc
+    
+    async def _send_to_grading_system_with_retry(self, submission_data, retry_policy=None, problem_number=None,
+                                                 on_stream_event=None, path=None):
+        """
+        リトライ機能付きでCloudRunの自動採点システムに送信（コルーチン）
+        
+        サーバーがストリーミング方式に対応していれば、採点が終わった問題から順に受信する。
+        ジョブ方式に対応していれば POST /jobs でジョブを登録し、
+        採点結果はロングポーリングで受け取る（途中で接続が切れても採点はやり直さない）。
+        
+        Args:
+            submission_data (dict): 送信データ
+            retry_policy (RetryPolicy): リトライ方針（Noneならクラスの設定値）
+            problem_number (int): 問題番号（ジョブの記録用）
+            on_stream_event (callable): ストリーミング方式で受信したイベントを受け取る関数
+            path (str): 送信先のパス（指定した場合はストリーミング・ジョブ方式を使わない）
+        
+        Returns:
+            tuple: (success: bool, result_data: dict, error_message: str)
+        """
+        policy = retry_policy or self.retry_policy
+        budget = policy.start()
+        
+        loop = asyncio.get_running_loop()
+        if path is None:
+            features = await loop.run_in_executor(None, self.get_server_features)
+            use_stream = self.streaming_enabled and STREAM_FEATURE in features
+            use_jobs = not use_stream and self.job_mode_enabled and JOBS_FEATURE in features
+            path = "/jobs" if use_jobs else "/grade"
+        else:
+            use_stream = use_jobs = False
+        
+        # 送信IDを付けて登録し、cancel_submission() から通信ごと中断できるようにする
+        cancel_event = asyncio.Event()
+        cancel_token = CancelToken(uuid.uuid4().hex)
+        self.last_submission_id = cancel_token.submission_id
+        _active_submissions[cancel_token.submission_id] = {
+            "base_url": self.base_url,
+            "student_email": submission_data.get("student_email"),
+            "assignment_id": submission_data.get("assignment_id"),
+            "token": cancel_token,
+            "cancel_event": cancel_event,
+            "loop": loop,
+        }
+        self._cancel_events.add(cancel_event)
+        try:
+            while True:
+                if cancel_event.is_set():
+                    return False, None, CANCELLED_ERROR
                 
-                # 経過時間を計算してプログレスバーを更新
-                elapsed = time() - start_time
-                remaining_seconds = max(0, retry_delay - int(elapsed))
-                progress_value = min(int(elapsed), retry_delay)
+                # 待っている間に締め切りが近づいた場合は、再送を始める前に諦める（初回は必ず送る）
+                if budget.attempt and not budget.can_attempt():
+                    print(f"❌ リトライの上限（{policy.max_attempts}回 / {policy.deadline:.0f}秒）に達しました")
+                    return False, None, RETRY_EXHAUSTED_ERROR
                 
-                progress_bar.value = progress_value
-                # progress_bar.description = f'リトライまであと {remaining_seconds} 秒 ({attempt + 1}/{max_retries}):'   # attempt+=1 してしまっているから多いです。
-                progress_bar.description = f'リトライまであと {remaining_seconds} 秒 ({attempt}/{max_retries}):'
+                # 5xx・タイムアウトが続いている間は送信せず、送信キューに回す
+                if not self.admit_request():
+                    print(f"🚦 採点システムが混雑しているため送信を控えます"
+                          f"（約 {self.get_service_busy_seconds():.0f} 秒後に再開）")
+                    return False, None, SERVICE_BUSY_ERROR
                 
-                # 時間が経過していない場合は次のタイマーをセット
-                if elapsed < retry_delay:
-                    # 再度タイマーを開始
-                    countdown_timer = threading.Timer(1.0, on_timer)
-                    countdown_timer.start()
+                if use_stream:
+                    success, result, error_msg, response, exc = await self._send_stream_attempt(
+                        submission_data, budget, on_stream_event, cancel_token
+                    )
                 else:
-                    # 送信リトライまでのカウントダウン完了
-                    progress_bar.value = retry_delay
-                    progress_bar.bar_style = 'success'
-                    # progress_bar.description = f'リトライ {attempt + 1}/{max_retries} 実行中:'   # attempt+=1 してしまっているから多いです。
-                    progress_bar.description = f'リトライ {attempt}/{max_retries} 実行中:'
-                    cancel_button.disabled = True
-                    # print(f"⏰ リトライ {attempt + 1}/{max_retries} を実行します...")   # attempt+=1 してしまっているから多いです。
-                    print(f"⏰ リトライ {attempt}/{max_retries} を実行します...")
-                    
-                    # 再帰的にリトライ実行
-                    self._show_retry_countdown_with_cancel(
-                        retry_delay, attempt, max_retries, send_func, cancel_func
+                    success, result, error_msg, response, exc = await self._send_attempt(
+                        submission_data, budget, path, cancel_token
                     )
-
-            # 最初のタイマーを開始
-            countdown_timer = threading.Timer(1.0, on_timer)
-            countdown_timer.start()
+                if cancel_event.is_set():
+                    print("🚫 送信処理がキャンセルされました（通信を切断しました）")
+                    return False, None, CANCELLED_ERROR
+                if success and use_jobs:
+                    job_id = result["job_id"]
+                    self.job_store.add(
+                        job_id, self.base_url, submission_data.get("student_email"),
+                        problem_number, submission_data.get("assignment_id")
+                    )
+                    print(f"🎫 採点ジョブを登録しました: {job_id}")
+                    with self.tracer.span("job_wait", assignment_id=submission_data.get("assignment_id")):
+                        return await self._wait_for_job(job_id, cancel_event, cancel_token)
+                if success:
+                    return True, result, None
+                if error_msg == SERVICE_BUSY_ERROR:
+                    print("🚦 採点システムが混雑しているため送信を控えます（送信枠を確保できませんでした）")
+                    return False, None, SERVICE_BUSY_ERROR
+                
+                # 次の送信までの待ち時間をリトライ方針に決めてもらう
+                if response is not None:
+                    delay = budget.next_delay(response.status_code, response.headers.get("Retry-After"))
+                else:
+                    delay = budget.next_delay(exc=exc)
+                
+                if delay is None:
+                    if response is not None and not policy.is_retryable_status(response.status_code):
+                        print(f"❌ 再送しても解決しないエラーのため送信を中止します (HTTP {response.status_code})")
+                        return False, None, error_msg
+                    if response is None and exc is not None and _is_client_failure(exc):
+                        print("❌ 送信処理中のエラーのため送信を中止します（再送・送信キューへの保存はしません）")
+                        return False, None, error_msg
+                    print(f"❌ リトライの上限（{policy.max_attempts}回 / {policy.deadline:.0f}秒）に達しました")
+                    return False, None, RETRY_EXHAUSTED_ERROR
+                
+                def on_cancel():
+                    print("🚫 送信処理がキャンセルされました")
+                
+                if not await self._retry_countdown(delay, budget.attempt, policy.max_retries, cancel_event, on_cancel):
+                    return False, None, CANCELLED_ERROR
+        finally:
+            self._cancel_events.discard(cancel_event)
+            _active_submissions.pop(cancel_token.submission_id, None)
+    
+    def _fetch_job_status(self, job_id, etag=None, wait=JOB_POLL_WAIT, cancel_token=None):
+        """ジョブの状態を取得（ETagが変わるまでサーバー側で最大wait秒待つ）"""
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        return self._get_transport().get(
+            f"{self.base_url}/jobs/{job_id}",
+            params={"wait": wait},
+            headers=headers,
+            timeout=wait + 30,
+            cancel_token=cancel_token
+        )
+    
+    async def _wait_for_job(self, job_id, cancel_event=None, cancel_token=None):
+        """
+        採点ジョブの完了を待つ（コルーチン）
+        
+        ロングポーリングで状態を取得し、変化がなければ304で待ち続ける。
+        接続が切れた場合は間隔を空けて問い合わせ直すだけで、採点はやり直さない。
+        
+        Returns:
+            tuple: (success: bool, result_data: dict, error_message: str)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.job_wait_timeout
+        etag = None
+        last_status = None
+        failures = 0
+        
+        while loop.time() < deadline:
+            if cancel_event is not None and cancel_event.is_set():
+                return False, None, CANCELLED_ERROR
             
-        except Exception as e:
-            print(f"⚠️ リトライUI表示エラー: {e}")
-            import traceback
-            traceback.print_exc()
+            try:
+                response = await loop.run_in_executor(
+                    None, self._fetch_job_status, job_id, etag, JOB_POLL_WAIT, cancel_token
+                )
+            except requests.exceptions.RequestException as e:
+                response = None
+                if cancel_event is not None and cancel_event.is_set():
+                    self.job_store.remove(job_id)
+                    print("🚫 送信処理がキャンセルされました（採点結果の待機を中止しました）")
+                    return False, None, CANCELLED_ERROR
+                print(f"⚠️ 採点結果の取得に失敗しました（再接続します）: {e}")
             
-            # 最もシンプルなフォールバック
-            print(f"📝 {retry_delay}秒後にリトライします...")
-            print("🛑 キャンセルする場合は Kernel → Interrupt を選択してください")
+            if response is not None and response.status_code == 304:
+                failures = 0
+                continue
+            
+            if response is not None and response.status_code == 404:
+                self.job_store.remove(job_id)
+                return False, None, "採点ジョブが見つかりません（期限切れの可能性があります）"
+            
+            if response is not None and response.status_code == 200:
+                failures = 0
+                etag = response.headers.get("ETag")
+                job = response.json()
+                status = job.get("status")
+                if status == "done":
+                    self.job_store.remove(job_id)
+                    return True, job.get("result"), None
+                if status == "failed":
+                    self.job_store.remove(job_id)
+                    return False, None, job.get("error", "採点に失敗しました")
+                if status == "cancelled":
+                    self.job_store.remove(job_id)
+                    return False, None, CANCELLED_ERROR
+                if status != last_status:
+                    print(f"⏳ 採点待ち: {status}")
+                    last_status = status
+                continue
+            
+            # 通信エラー・サーバーエラーは少し待ってから問い合わせ直す
+            failures += 1
+            delay = random.uniform(0, min(30.0, 2.0 ** failures))
+            if cancel_event is not None:
+                try:
+                    await asyncio.wait_for(cancel_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(delay)
+        
+        return False, None, f"採点結果を {self.job_wait_timeout} 秒待ちましたが完了しませんでした（ジョブID: {job_id}）"
+    
+    async def resume_pending_jobs_async(self, student_email=None, problem_number=None, output=None):
+        """
+        採点待ちのまま残っているジョブ（カーネル再起動前に送信したもの等）の結果を待って表示
+        
+        Returns:
+            list: ジョブごとの (success: bool, result_data: dict, error_message: str)
+        """
+        results = []
+        jobs = self.job_store.list_jobs(self.base_url, student_email, problem_number)
+        with _output_scope(output):
+            for job in jobs:
+                print(f"🔁 採点待ちのジョブを再開します: {job['job_id']}（練習プログラム{job.get('problem_number')}）")
+                success, result, error_msg = await self._wait_for_job(job["job_id"])
+                if success:
+                    self._handle_submission_success(result, job.get("student_email"), job.get("problem_number"), None)
+                else:
+                    self._handle_submission_error(error_msg)
+                results.append((success, result, error_msg))
+        return results
+    
+    def resume_pending_jobs(self, student_email=None, problem_number=None, output=None):
+        """採点待ちジョブの再開をイベントループ上で開始し、Futureを返す"""
+        return run_coroutine(self.resume_pending_jobs_async(student_email, problem_number, output))
     
+    def cancel_all_retries(self):
+        """このクライアントで送信中・リトライ待機中の処理を全てキャンセル（送信中の通信も切断）"""
+        for cancel_event in list(self._cancel_events):
+            cancel_event.set()
+        for submission_id, record in list(_active_submissions.items()):
+            if record["cancel_event"] in self._cancel_events:
+                self.cancel_submission(submission_id)
     
-    def _send_to_grading_system_with_retry(self, submission_data, max_retries=3, retry_delay=20, success_callback=None, error_callback=None):
+    def cancel_submission(self, submission_id=None, student_email=None, problem_number=None):
         """
-        リトライ機能付きでCloudRunの自動採点システムに送信（新しい送信処理コールバック方式）
+        送信中の処理を取り消す（カーネル内の全ボタンの送信が対象）
+        
+        応答待ち・受信中の通信はすぐに切断して接続プールの枠を空け、サーバーが
+        取り消しに対応していれば POST /submissions/{送信ID}/cancel で採点の中止を依頼する。
+        引数を全て省略すると、送信中の全ての処理を取り消す。
         
         Args:
-            submission_data (dict): 送信データ
-            max_retries (int): 最大リトライ回数
-            retry_delay (int): リトライ間隔（秒）
-            success_callback (callable): 成功時のコールバック関数
-            error_callback (callable): エラー時のコールバック関数
-        """
-        # クラスフィールドに設定を保存
-        self.current_submission_data = submission_data
-        self.max_retries = max_retries
-        self.retry_delay = retry_delay
-        self.cancel_retry = False
-        
-        # コールバックを設定
-        self.success_callback = success_callback
-        self.error_callback = error_callback
-        
-        # 送信処理を定義（実際のHTTP通信を行う）
-        def send_request():
+            submission_id (str): 送信ID（last_submission_id 等）
+            student_email (str): このメールアドレスの送信だけを取り消す
+            problem_number (int): この問題の送信だけを取り消す（"all" なら全問題まとめて送信）
+        
+        Returns:
+            int: 取り消した送信の数
+        """
+        assignment_id = None if problem_number is None else f"practice_problem_{problem_number}"
+        cancelled = 0
+        for active_id, record in list(_active_submissions.items()):
+            if submission_id is not None and active_id != submission_id:
+                continue
+            if student_email is not None and record["student_email"] != student_email:
+                continue
+            if assignment_id is not None and record["assignment_id"] != assignment_id:
+                continue
+            if record["token"].cancelled:
+                continue
+            record["loop"].call_soon_threadsafe(record["cancel_event"].set)
+            record["token"].cancel()
+            self._notify_cancel(record["base_url"], active_id)
+            cancelled += 1
+        return cancelled
+    
+    def _notify_cancel(self, base_url, submission_id):
+        """サーバーに採点の中止を依頼する（バックグラウンドで送り、結果は待たない）"""
+        if CANCEL_FEATURE not in _server_features.get(base_url, ()):
+            return
+        
+        def notify():
             try:
-                print(f"📡 送信処理実行中...")
-                
-                response = requests.post(
-                    f"{self.base_url}/grade",
-                    json=self.current_submission_data,
-                    headers=self.headers,
-                    timeout=REQUEST_TIMEOUT
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if self.success_callback:
-                        self.success_callback(result)
-                    return True  # 成功
-                else:
-                    # エラーレスポンスの詳細保存
-                    filename, error_data = self._save_error_response_to_file(response, 0)
-                    error_msg = f"HTTP {response.status_code}: {response.text}"
-                    print(f"❌ 送信エラー: {error_msg}")
-                    
-                    # エラー詳細をWidgetで表示
-                    if error_data and filename:
-                        self._display_error_details_widget(error_data, filename)
-                    
-                    return False  # 失敗
-                    
-            except requests.exceptions.RequestException as e:
-                error_msg = f"ネットワークエラー: {str(e)}"
-                print(f"❌ 送信失敗: {error_msg}")
-                return False  # 失敗
-            except Exception as e:
-                error_msg = f"予期しないエラー: {str(e)}"
-                print(f"❌ 送信失敗: {error_msg}")
-                return False  # 失敗
-        
-        # キャンセル処理
-        def cancel_process():
-            print("🚫 送信処理がキャンセルされました")
-            if self.error_callback:
-                self.error_callback("送信処理がユーザーによってキャンセルされました")
-        
-        # 新しいカウントダウン方式で送信開始（試行回数は0から開始）
-        self._show_retry_countdown_with_cancel(
-            self.retry_delay, 0, self.max_retries, send_request, cancel_process
-        )
+                self._get_transport().post(f"{base_url}/submissions/{submission_id}/cancel",
+                                           timeout=CANCEL_NOTIFY_TIMEOUT).close()
+            except requests.exceptions.RequestException:
+                pass
+        
+        threading.Thread(target=notify, name="grading-cancel-notify", daemon=True).start()
     
-    def _handle_submission_success(self, result, student_email, problem_number, notebook_cells):
-        """送信成功時の処理"""
+    def _print_payload_stats(self, stats, delta_stats=None):
+        """送信サイズを表示"""
+        if delta_stats:
+            if delta_stats["cache_miss"]:
+                print("🧩 差分送信: サーバーに前回のセルが残っていなかったため、全セルを送り直しました")
+            else:
+                print(f"🧩 差分送信: 変更 {delta_stats['changed_cells']}/{delta_stats['total_cells']} セル")
+        if not stats:
+            return
+        if stats.get("rejected_encoding"):
+            print(f"⚠️ サーバーが {stats['rejected_encoding']} 圧縮を受け付けなかったため、無圧縮で再送しました")
+        if stats["encoding"] == "identity":
+            print(f"📦 送信サイズ: {stats['sent_bytes']:,} bytes（無圧縮）")
+        else:
+            ratio = stats["sent_bytes"] / stats["raw_bytes"] * 100
+            print(f"📦 送信サイズ: {stats['sent_bytes']:,} bytes（圧縮前 {stats['raw_bytes']:,} bytes, {stats['encoding']}, {ratio:.1f}%）")
+    
+    def _handle_submission_success(self, result, student_email, problem_number, notebook_cells, cached_at=None,
+                                   rendered=False):
+        """
+        送信成功時の処理
+        
+        cached_at が指定されていればキャッシュの結果。rendered がTrueなら
+        ストリーミング受信中に表示済みなので、結果の保存だけ行う。
+        """
+        if cached_at is not None:
+            self._handle_cached_result(result, problem_number, cached_at)
+            return
+        
         print(f"✅ 送信完了！")
         print(f"   メールアドレス: {student_email}")
         print(f"   ノートブック: {self.notebook_path}")
         print(f"   問題番号: {problem_number}")
-        print(f"   送信セル数: {len(notebook_cells)}")
+        if notebook_cells is not None:
+            print(f"   送信セル数: {len(notebook_cells)}")
         print("")
         print("🎉 採点が完了しました")
         
@@ -541,7 +1337,9 @@ class GradingClient:
             # 結果をファイルに保存
             _ = viewer.save_result_to_file(result)
 
-            viewer.display_grading_result_with_details(result, problem_number)
+            if not rendered:
+                with self.tracer.span("render", problem_number=problem_number):
+                    viewer.display_grading_result_with_details(result, problem_number)
         except Exception as e:
             import traceback
             print(f"⚠️ 採点結果表示エラー: {e}")
@@ -549,52 +1347,378 @@ class GradingClient:
             print(f"📋 トレースバック:")
             traceback.print_exc()
     
+    def _handle_cached_result(self, result, problem_number, cached_at):
+        """キャッシュ済みの採点結果を表示"""
+        print("💾 前回の送信と内容が同じため、保存済みの採点結果を表示します")
+        print("   もう一度採点したい場合は「再採点」にチェックを入れて送信してください")
+        try:
+            from .result_viewer import ResultViewer
+            with self.tracer.span("render", problem_number=problem_number, cached=True):
+                ResultViewer().display_grading_result_with_details(result, problem_number, cached_at=cached_at)
+        except Exception as e:
+            import traceback
+            print(f"⚠️ 採点結果表示エラー: {e}")
+            traceback.print_exc()
+    
     def _handle_submission_error(self, error_msg):
         """送信失敗時の処理"""
         print(f"❌ 送信失敗: {error_msg}")
         print("   ネットワーク接続とCloudRunサービスの状態を確認してください")
     
-    def submit_assignment(self, student_email, problem_number, notebook_cells, auto_save=True):
+    async def submit_assignment_async(self, student_email, problem_number, notebook_cells, auto_save=True, output=None,
+                                      force_regrade=False):
         """
-        課題を自動採点システムに送信
+        課題を自動採点システムに送信（コルーチン）
         
         Args:
             student_email (str): 学生のメールアドレス
             problem_number (int): 問題番号
             notebook_cells (list): ノートブックセルデータ
             auto_save (bool): 送信前の自動保存を行うか
+            output (widgets.Output): 表示先のOutputウィジェット（Noneなら現在のセル）
+            force_regrade (bool): 保存済みの採点結果を使わずに必ず採点し直すか
         
         Returns:
             tuple: (success: bool, result_data: dict, error_message: str)
         """
-        try:
-            print(f"📤 練習プログラム{problem_number}の解答を送信中...")
-            
-            # 送信データの構築
-            submission_data = self.create_submission_data(student_email, problem_number, notebook_cells)
-            
-            # 自動保存（オプション）
-            if auto_save:
-                self.save_submission_data_to_file(submission_data, problem_number)
-            
-            # 成功時のコールバック（クロージャで変数をキャプチャ）
-            def on_success(result):
-                self._handle_submission_success(result, student_email, problem_number, notebook_cells)
+        with _output_scope(output):
+            try:
+                print(f"📤 練習プログラム{problem_number}の解答を送信中...")
+                
+                # 送信データの構築
+                submission_data = self.create_submission_data(student_email, problem_number, notebook_cells)
+                
+                # 同じ内容を採点済みならキャッシュの結果を使う
+                cache_key = None
+                if self.result_cache_enabled:
+                    cache_key = ResultCache.make_key(
+                        self.base_url, student_email, submission_data["assignment_id"], self.notebook_path,
+                        notebook_cells
+                    )
+                    cached = None if force_regrade else self.result_cache.get(cache_key)
+                    if cached:
+                        self.tracer.count("result_cache_hits")
+                        self._handle_submission_success(
+                            cached["result"], student_email, problem_number, notebook_cells,
+                            cached_at=cached["cached_at"]
+                        )
+                        return True, cached["result"], None
+                
+                # 自動保存（オプション）
+                if auto_save:
+                    self.save_submission_data_to_file(submission_data, problem_number)
+                
+                # ストリーミング方式では、採点が終わった問題から順に表示する
+                stream_views = []
+                
+                def on_stream_event(event):
+                    if event.get("type") == "start":
+                        from .result_viewer import ResultViewer
+                        if stream_views:
+                            stream_views[-1].interrupt()
+                        stream_views.append(ResultViewer().create_streaming_view(problem_number))
+                    elif stream_views:
+                        stream_views[-1].handle_event(event)
+                
+                # リトライ機能付きで送信
+                success, result, error_msg = await self._send_to_grading_system_with_retry(
+                    submission_data, problem_number=problem_number, on_stream_event=on_stream_event
+                )
+                
+                if success:
+                    if cache_key is not None:
+                        self.result_cache.put(cache_key, result)
+                    # 送信キューに古い内容が残っていれば、今回届いたので削除
+                    self.submission_queue.remove(self.base_url, student_email, submission_data["assignment_id"])
+                    self._handle_submission_success(result, student_email, problem_number, notebook_cells,
+                                                    rendered=bool(stream_views) and stream_views[-1].finished)
+                elif error_msg in QUEUEABLE_ERRORS and self.offline_queue_enabled:
+                    if error_msg == SERVICE_BUSY_ERROR:
+                        print("🚦 採点システムが混雑しています")
+                    else:
+                        self._handle_submission_error(error_msg)
+                    if self.submission_queue.enqueue(self.base_url, submission_data, problem_number, error_msg):
+                        print("📮 解答を送信キューに保存しました")
+                        print("   接続・混雑が回復したら自動で送信します（同じ問題は最新の内容だけを送ります）")
+                        self.get_queue_flusher().start()
+                else:
+                    self._handle_submission_error(error_msg)
+                return success, result, error_msg
+                
+            except asyncio.CancelledError as e:
+                if SUPERSEDED_ERROR not in e.args:
+                    raise
+                print("🚫 新しい内容の送信に置き換えられたため、この送信を取り消しました")
+                return False, None, SUPERSEDED_ERROR
+            except Exception as e:
+                import traceback
+                error_msg = f"予期しないエラー: {str(e)}"
+                print(f"❌ {error_msg}")
+                print(f"📋 トレースバック:")
+                traceback.print_exc()
+                return False, None, error_msg
+    
+    async def submit_all_problems_async(self, student_email, problem_cells, auto_save=True, output=None,
+                                        force_regrade=False):
+        """
+        全問題の解答をまとめて自動採点システムに送信（コルーチン）
+        
+        サーバーがまとめて採点に対応していれば POST /grade_batch で1回だけ送信し、
+        返ってきた全問題の採点結果を問題ごとに分けて保存する。対応していなければ
+        1問ずつ順番に送信する。
+        
+        Args:
+            student_email (str): 学生のメールアドレス
+            problem_cells (dict): 問題番号 -> 送信対象セルのリスト
+            auto_save (bool): 送信前の自動保存を行うか
+            output (widgets.Output): 表示先のOutputウィジェット（Noneなら現在のセル）
+            force_regrade (bool): 保存済みの採点結果を使わずに必ず採点し直すか
+        
+        Returns:
+            tuple: (success: bool, results: dict（問題番号 -> 採点結果）, error_message: str)
+        """
+        with _output_scope(output):
+            try:
+                problem_numbers = list(problem_cells)
+                if not problem_numbers:
+                    print("❌ 送信対象の問題が見つかりませんでした")
+                    return False, {}, "送信対象の問題が見つかりませんでした"
+                
+                names = "、".join(f"練習プログラム{n}" for n in problem_numbers)
+                print(f"📤 全問題（{names}）の解答をまとめて送信中...")
+                
+                loop = asyncio.get_running_loop()
+                features = await loop.run_in_executor(None, self.get_server_features)
+                if BATCH_FEATURE not in features:
+                    print("ℹ️ 採点システムがまとめて採点に対応していないため、1問ずつ送信します")
+                    return await self._submit_problems_sequentially(
+                        student_email, problem_cells, auto_save, force_regrade
+                    )
+                
+                # 最も長い送信対象が前回と同じなら、全問題とも保存済みの結果を使える
+                last_problem = max(problem_numbers, key=lambda n: len(problem_cells[n]))
+                if self.result_cache_enabled and not force_regrade:
+                    cached = self.result_cache.get(ResultCache.make_key(
+                        self.base_url, student_email, f"practice_problem_{last_problem}", self.notebook_path,
+                        problem_cells[last_problem]
+                    ))
+                    if cached:
+                        self.tracer.count("result_cache_hits")
+                        print("💾 前回の送信と内容が同じため、保存済みの採点結果を表示します")
+                        print("   もう一度採点したい場合は「再採点」にチェックを入れて送信してください")
+                        from .result_viewer import ResultViewer
+                        viewer = ResultViewer()
+                        viewer.display_batch_result_with_details(
+                            cached["result"], problem_numbers, cached_at=cached["cached_at"]
+                        )
+                        return True, viewer.split_batch_result(cached["result"], problem_numbers), None
+                
+                submission_data = self.create_batch_submission_data(student_email, problem_cells)
+                if auto_save:
+                    self.save_submission_data_to_file(submission_data, None)
+                
+                success, result, error_msg = await self._send_to_grading_system_with_retry(
+                    submission_data, path="/grade_batch"
+                )
+                
+                if not success:
+                    self._handle_submission_error(error_msg)
+                    if error_msg in QUEUEABLE_ERRORS and self.offline_queue_enabled:
+                        for problem_number in problem_numbers:
+                            self.submission_queue.enqueue(
+                                self.base_url,
+                                self.create_submission_data(student_email, problem_number, problem_cells[problem_number]),
+                                problem_number, error_msg
+                            )
+                        print("📮 送信できなかった解答を送信キューに保存しました（問題ごとに自動で送信します）")
+                        self.get_queue_flusher().start()
+                    return False, {}, error_msg
+                
+                print(f"✅ 送信完了！（{len(problem_numbers)}問を1回で送信）")
+                print(f"   メールアドレス: {student_email}")
+                print(f"   ノートブック: {self.notebook_path}")
+                print(f"   送信セル数: {len(submission_data['notebook']['cells'])}")
+                print("")
+                print("🎉 採点が完了しました")
+                
+                from .result_viewer import ResultViewer
+                viewer = ResultViewer()
+                results = viewer.split_batch_result(result, problem_numbers)
+                for problem_number, problem_result in results.items():
+                    if self.result_cache_enabled:
+                        self.result_cache.put(ResultCache.make_key(
+                            self.base_url, student_email, f"practice_problem_{problem_number}", self.notebook_path,
+                            problem_cells[problem_number]
+                        ), problem_result)
+                    self.submission_queue.remove(self.base_url, student_email, f"practice_problem_{problem_number}")
+                
+                _ = viewer.save_result_to_file(result)
+                viewer.display_batch_result_with_details(result, problem_numbers)
+                return True, results, None
+                
+            except asyncio.CancelledError as e:
+                if SUPERSEDED_ERROR not in e.args:
+                    raise
+                print("🚫 新しい内容の送信に置き換えられたため、この送信を取り消しました")
+                return False, {}, SUPERSEDED_ERROR
+            except Exception as e:
+                import traceback
+                error_msg = f"予期しないエラー: {str(e)}"
+                print(f"❌ {error_msg}")
+                print(f"📋 トレースバック:")
+                traceback.print_exc()
+                return False, {}, error_msg
+    
+    async def _submit_problems_sequentially(self, student_email, problem_cells, auto_save, force_regrade):
+        """まとめて採点に対応していないサーバー向けに、1問ずつ順番に送信する"""
+        results = {}
+        errors = []
+        for problem_number, cells in problem_cells.items():
+            success, result, error_msg = await self.submit_assignment_async(
+                student_email, problem_number, cells, auto_save=auto_save, force_regrade=force_regrade
+            )
+            if success:
+                results[problem_number] = result
+            elif error_msg == CANCELLED_ERROR:
+                return False, results, CANCELLED_ERROR
+            else:
+                errors.append(f"問題{problem_number}: {error_msg}")
+        
+        if errors:
+            return False, results, " / ".join(errors)
+        return True, results, None
+    
+    def submit_all_problems(self, student_email, problem_cells, auto_save=True, output=None, force_regrade=False):
+        """
+        全問題の解答をまとめて自動採点システムに送信
+        
+        submit_assignment と同じく、カーネルのイベントループ上で送信処理を開始してすぐに戻る。
+        
+        Returns:
+            asyncio.Future: 結果は (success: bool, results: dict, error_message: str)
+        """
+        problem_numbers = list(problem_cells)
+        content_key = ResultCache.make_key(
+            self.base_url, student_email, BATCH_ASSIGNMENT_ID, self.notebook_path,
+            [cell for cells in problem_cells.values() for cell in cells]
+        )
+        
+        def show_result(results):
+            from .result_viewer import ResultViewer
+            last_problem = max(results, key=lambda n: len(problem_cells[n]))
+            ResultViewer().display_batch_result_with_details(results[last_problem], problem_numbers)
+        
+        return self._start_or_attach(
+            (student_email, BATCH_ASSIGNMENT_ID), content_key, output, force_regrade, show_result,
+            lambda: self.submit_all_problems_async(
+                student_email, problem_cells, auto_save=auto_save, output=output, force_regrade=force_regrade
+            )
+        )
+    
+    def has_in_flight_submission(self, student_email, problem_number=None):
+        """この問題（Noneなら全問題一括）の送信がカーネル内のどこかで実行中か"""
+        assignment_id = BATCH_ASSIGNMENT_ID if problem_number is None else f"practice_problem_{problem_number}"
+        entry = _in_flight_submissions.get((self.base_url, student_email, assignment_id))
+        return entry is not None and not entry["future"].done()
+    
+    def _start_or_attach(self, key, content_key, output, force_regrade, show_result, make_coroutine):
+        """
+        送信を開始する（同じ問題の送信が実行中なら、それに合流するか置き換える）
+        
+        - 送信内容が同じなら、新しく送信せずに実行中の送信の結果を待つ
+        - 送信内容が変わっていれば（または再採点の指定があれば）、実行中の送信を取り消して送り直す
+        
+        Args:
+            key (tuple): (メールアドレス, 課題ID)
+            content_key (str): 送信内容のハッシュ
+            show_result (callable): 合流した側で、成功時の結果を表示する関数
+            make_coroutine (callable): 送信処理のコルーチンを作る関数
+        """
+        key = (self.base_url,) + tuple(key)
+        entry = _in_flight_submissions.get(key)
+        if entry is not None and not entry["future"].done():
+            if entry["content_key"] == content_key and not force_regrade:
+                self.tracer.count("coalesced_clicks")
+                return run_coroutine(self._attach_to_submission(entry, output, show_result))
+            with _output_scope(output):
+                print("🔁 解答が変わったため、送信中の処理を取り消して新しい内容で送信します")
+            entry["future"].cancel(SUPERSEDED_ERROR)
+        
+        entry = {"content_key": content_key, "output": output}
+        entry["future"] = run_coroutine(self._trace_submission(make_coroutine(), assignment_id=key[-1]))
+        if not entry["future"].done():
+            _in_flight_submissions[key] = entry
             
-            def on_error(error_msg):
-                self._handle_submission_error(error_msg)
+            def on_done(_):
+                if _in_flight_submissions.get(key) is entry:
+                    del _in_flight_submissions[key]
             
-            # リトライ機能付きで送信（新しいコールバック方式）
-            self._send_to_grading_system_with_retry(
-                submission_data, 
-                success_callback=on_success,
-                error_callback=on_error
-            )
-                
-        except Exception as e:
-            import traceback
-            error_msg = f"予期しないエラー: {str(e)}"
-            print(f"❌ {error_msg}")
-            print(f"📋 トレースバック:")
-            traceback.print_exc()
-            return False, None, error_msg
\ No newline at end of file
+            entry["future"].add_done_callback(on_done)
+        return entry["future"]
+    
+    async def _trace_submission(self, coroutine, **tags):
+        """送信処理全体の所要時間と結果を計測する（コルーチン）"""
+        with self.tracer.span("submit", **tags) as span:
+            success, result, error_msg = await coroutine
+            if success:
+                outcome = "success"
+            elif error_msg == SUPERSEDED_ERROR:
+                outcome = "superseded"
+            elif error_msg in QUEUEABLE_ERRORS and self.offline_queue_enabled:
+                outcome = "queued"
+            else:
+                outcome = "failed"
+            span.set_tag("outcome", outcome)
+            self.tracer.count("submissions", outcome=outcome)
+            return success, result, error_msg
+    
+    async def _attach_to_submission(self, entry, output, show_result):
+        """実行中の同じ送信の結果を待つ（コルーチン）"""
+        with _output_scope(output):
+            print("⏳ 同じ解答を送信中です。二重に送信せず、その結果を待っています...")
+        success, result, error_msg = await entry["future"]
+        if output is entry["output"]:
+            return success, result, error_msg  # 同じ表示先には送信した側が結果を表示済み
+        with _output_scope(output):
+            if success:
+                print("✅ 送信中だった解答の採点が完了しました")
+                show_result(result)
+            else:
+                print(f"❌ 送信中だった解答の送信に失敗しました: {error_msg}")
+        return success, result, error_msg
+    
+    def submit_assignment(self, student_email, problem_number, notebook_cells, auto_save=True, output=None,
+                          force_regrade=False):
+        """
+        課題を自動採点システムに送信
+        
+        カーネルのイベントループ上で送信処理を開始し、すぐに戻る。
+        戻り値のFutureは await したり asyncio.gather で複数まとめて待つことができる。
+        同じ問題の送信が実行中の場合は、内容が同じならその結果を待ち、
+        内容が変わっていれば実行中の送信を取り消して送り直す（カーネル内の全ボタン共通）。
+        
+        Args:
+            student_email (str): 学生のメールアドレス
+            problem_number (int): 問題番号
+            notebook_cells (list): ノートブックセルデータ
+            auto_save (bool): 送信前の自動保存を行うか
+            output (widgets.Output): 表示先のOutputウィジェット（Noneなら現在のセル）
+            force_regrade (bool): 保存済みの採点結果を使わずに必ず採点し直すか
+        
+        Returns:
+            asyncio.Future: 結果は (success: bool, result_data: dict, error_message: str)
+        """
+        assignment_id = f"practice_problem_{problem_number}"
+        content_key = ResultCache.make_key(
+            self.base_url, student_email, assignment_id, self.notebook_path, notebook_cells
+        )
+        
+        def show_result(result):
+            from .result_viewer import ResultViewer
+            ResultViewer().display_grading_result_with_details(result, problem_number)
+        
+        return self._start_or_attach(
+            (student_email, assignment_id), content_key, output, force_regrade, show_result,
+            lambda: self.submit_assignment_async(student_email, problem_number, notebook_cells, auto_save, output,
+                                                 force_regrade)
+        )
@@ -0,0 +1,311 @@
+"""
+HTTP通信モジュール - 採点システムとの接続プール（Keep-Alive）管理
+"""
+
+import contextlib
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 接続プールのデフォルト設定
+DEFAULT_POOL_CONNECTIONS = 4   # ホスト単位で保持するプール数
+DEFAULT_POOL_MAXSIZE = 16      # 1ホストあたりの最大同時接続数
+
+# 送信中のスレッドに結び付けた CancelToken（接続クラスから参照する）
+_bound_tokens = threading.local()
+
+
+class CancelToken:
+    """
+    送信中のHTTP通信を中断するためのトークン
+
+    送信に使っているソケットを記録しておき、cancel() でソケットを shutdown して
+    応答待ち・受信中のスレッドを即座に戻す（requests は ConnectionError を送出する）。
+    中断した接続は壊れたものとして捨てられ、接続プールの枠は空く。
+    """
+
+    def __init__(self, submission_id=None):
+        self.submission_id = submission_id
+        self.cancelled = False
+        self._sockets = set()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def bind(self):
+        """このスレッドで送信するリクエストのソケットを記録する"""
+        previous = getattr(_bound_tokens, "token", None)
+        _bound_tokens.token = self
+        try:
+            yield self
+        finally:
+            _bound_tokens.token = previous
+
+    def attach(self, sock):
+        """送信に使うソケットを記録（中断済みなら即座に切断）"""
+        if sock is None:
+            return
+        with self._lock:
+            if not self.cancelled:
+                self._sockets.add(sock)
+                return
+        _shutdown(sock)
+
+    def release(self):
+        """送信が終わったソケットを記録から外す（接続プールに戻った後は切断しない）"""
+        with self._lock:
+            self._sockets.clear()
+
+    def cancel(self):
+        """送信中の通信を中断する"""
+        with self._lock:
+            self.cancelled = True
+            sockets = list(self._sockets)
+            self._sockets.clear()
+        for sock in sockets:
+            _shutdown(sock)
+
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _CancellableConnectionMixin:
+    """送信時に、スレッドに結び付いた CancelToken へソケットを登録する接続クラス"""
+
+    def connect(self):
+        super().connect()
+        token = getattr(_bound_tokens, "token", None)
+        if token is not None:
+            token.attach(self.sock)
+
+    def request(self, *args, **kwargs):
+        token = getattr(_bound_tokens, "token", None)
+        if token is not None:
+            token.attach(self.sock)  # 再利用する接続（新しい接続は connect() で登録）
+        return super().request(*args, **kwargs)
+
+
+class _CancellableHTTPConnection(_CancellableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CancellableHTTPSConnection(_CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CancellableHTTPConnection
+
+
+class _CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+
+class CancellableHTTPAdapter(HTTPAdapter):
+    """CancelToken で中断できる接続を使う HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CancellableHTTPConnectionPool,
+            "https": _CancellableHTTPSConnectionPool,
+        }
+
+
+class HttpTransport:
+    """
+    採点システムへのHTTP通信を担当するクラス
+
+    requests.Session を1つだけ保持し、TCP/TLS接続をKeep-Aliveで使い回す。
+    同一カーネル内の全 SubmitWidget / GradingClient で共有される想定のため、
+    送信処理はスレッドセーフにしている。
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._closed = False
+
+        # 接続再利用の統計
+        self._request_count = 0
+        self._error_count = 0
+        # 作り直す前の接続プールの接続数・リクエスト数（configure_pool() 後も統計を通算する）
+        self._retired_connections = 0
+        self._retired_requests = 0
+
+    def _get_session(self):
+        """セッションを取得（未作成なら作成）"""
+        with self._lock:
+            if self._session is None:
+                if self._closed:
+                    raise RuntimeError("HttpTransport は既にクローズされています")
+                session = requests.Session()
+                adapter = CancellableHTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+                self._adapter = adapter
+            return self._session
+
+    def request(self, method, url, cancel_token=None, **kwargs):
+        """
+        HTTPリクエストを送信（プール済み接続を再利用）
+        
+        Args:
+            cancel_token (CancelToken): 指定すると、別スレッドから cancel() で通信を中断できる。
+                stream=True の場合は、受信し終えたら呼び出し側で cancel_token.release() を呼ぶ
+        """
+        session = self._get_session()
+        with self._lock:
+            self._request_count += 1
+        try:
+            if cancel_token is None:
+                return session.request(method, url, **kwargs)
+            if cancel_token.cancelled:
+                raise requests.exceptions.ConnectionError("送信はキャンセルされました")
+            with cancel_token.bind():
+                response = session.request(method, url, **kwargs)
+            if not kwargs.get("stream"):
+                cancel_token.release()
+            return response
+        except requests.exceptions.RequestException:
+            if cancel_token is not None:
+                cancel_token.release()
+            with self._lock:
+                self._error_count += 1
+            raise
+
+    def post(self, url, **kwargs):
+        """POSTリクエストを送信"""
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """GETリクエストを送信"""
+        return self.request("GET", url, **kwargs)
+
+    def configure_pool(self, pool_connections=None, pool_maxsize=None, pool_block=None):
+        """
+        接続プールの上限を変更（既存の接続は閉じて作り直す）
+
+        Args:
+            pool_connections (int): ホスト単位で保持するプール数
+            pool_maxsize (int): 1ホストあたりの最大同時接続数
+            pool_block (bool): 上限到達時に空きを待つか
+        """
+        with self._lock:
+            if pool_connections is not None:
+                self.pool_connections = pool_connections
+            if pool_maxsize is not None:
+                self.pool_maxsize = pool_maxsize
+            if pool_block is not None:
+                self.pool_block = pool_block
+            old_session = self._session
+            self._retire_pool()
+        if old_session is not None:
+            old_session.close()
+
+    def _retire_pool(self):
+        """今の接続プールの接続数・リクエスト数を通算に移し、セッションを手放す（ロック内で呼ぶ）"""
+        new_connections, pooled_requests = self._pool_counters()
+        self._retired_connections += new_connections
+        self._retired_requests += pooled_requests
+        self._session = None
+        self._adapter = None
+
+    def _pool_counters(self):
+        """urllib3の接続プールから接続数・リクエスト数を集計（今の接続プールの分だけ）"""
+        new_connections = 0
+        pooled_requests = 0
+        adapter = self._adapter
+        if adapter is None:
+            return new_connections, pooled_requests
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += getattr(pool, "num_connections", 0)
+            pooled_requests += getattr(pool, "num_requests", 0)
+        return new_connections, pooled_requests
+
+    def is_closed(self):
+        """クローズ済みかどうか"""
+        return self._closed
+
+    def get_stats(self):
+        """
+        接続再利用の統計を取得
+
+        Returns:
+            dict: requests（送信数）, new_connections（新規接続数）,
+                  reused_connections（再利用数）, errors（通信エラー数）など
+        """
+        with self._lock:
+            new_connections, pooled_requests = self._pool_counters()
+            new_connections += self._retired_connections
+            pooled_requests += self._retired_requests
+            return {
+                "requests": self._request_count,
+                "errors": self._error_count,
+                "new_connections": new_connections,
+                "reused_connections": max(0, pooled_requests - new_connections),
+                "pool_connections": self.pool_connections,
+                "pool_maxsize": self.pool_maxsize,
+                "closed": self._closed,
+            }
+
+    def print_stats(self):
+        """接続再利用の統計を表示"""
+        stats = self.get_stats()
+        print(f"🔌 HTTP接続統計")
+        print(f"   送信回数: {stats['requests']}")
+        print(f"   新規接続: {stats['new_connections']}")
+        print(f"   接続再利用: {stats['reused_connections']}")
+        print(f"   通信エラー: {stats['errors']}")
+
+    def close(self):
+        """保持している全接続を閉じる"""
+        with self._lock:
+            session = self._session
+            self._retire_pool()
+            self._closed = True
+        if session is not None:
+            session.close()
+
+
+# カーネル内で共有するトランスポート
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport():
+    """カーネル内で共有する HttpTransport を取得（未作成・クローズ済みなら作成）"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None or _shared_transport.is_closed():
+            _shared_transport = HttpTransport()
+        return _shared_transport
+
+
+def close_shared_transport():
+    """共有 HttpTransport の接続を全て閉じる"""
+    global _shared_transport
+    with _shared_lock:
+        transport = _shared_transport
+        _shared_transport = None
+    if transport is not None:
+        transport.close()
@@ -0,0 +1,72 @@
+"""
+採点ジョブ記録モジュール - 採点待ちのジョブIDをファイルに保存（カーネル再起動後の再開用）
+"""
+
+import json
+import os
+import threading
+import time
+
+DEFAULT_JOB_FILE = ".grading_jobs.json"
+
+
+class JobStore:
+    """採点待ちジョブの記録を管理するクラス"""
+
+    def __init__(self, job_file=DEFAULT_JOB_FILE):
+        self.job_file = job_file
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if os.path.exists(self.job_file):
+            try:
+                with open(self.job_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return {}
+        return {}
+
+    def _save(self, jobs):
+        tmp_file = self.job_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(jobs, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.job_file)
+
+    def add(self, job_id, base_url, student_email, problem_number, assignment_id):
+        """採点待ちジョブを記録"""
+        with self._lock:
+            jobs = self._load()
+            jobs[job_id] = {
+                "job_id": job_id,
+                "base_url": base_url,
+                "student_email": student_email,
+                "problem_number": problem_number,
+                "assignment_id": assignment_id,
+                "submitted_at": time.time(),
+            }
+            try:
+                self._save(jobs)
+            except OSError as e:
+                print(f"⚠️ 採点ジョブの記録に失敗しました: {e}")
+
+    def remove(self, job_id):
+        """完了したジョブの記録を削除"""
+        with self._lock:
+            jobs = self._load()
+            if jobs.pop(job_id, None) is not None:
+                try:
+                    self._save(jobs)
+                except OSError:
+                    pass
+
+    def list_jobs(self, base_url=None, student_email=None, problem_number=None):
+        """条件に合う採点待ちジョブを古い順に返す"""
+        with self._lock:
+            jobs = list(self._load().values())
+        if base_url is not None:
+            jobs = [j for j in jobs if j.get("base_url") == base_url]
+        if student_email is not None:
+            jobs = [j for j in jobs if j.get("student_email") == student_email]
+        if problem_number is not None:
+            jobs = [j for j in jobs if j.get("problem_number") == problem_number]
+        return sorted(jobs, key=lambda j: j.get("submitted_at", 0))
@@ -0,0 +1,397 @@
+"""
+負荷試験モジュール - 授業中に多数の学生が同時に送信した場合の動作を確認する
+
+学生ごとに GradingClient を1つずつ作り（接続プールも学生ごと）、asyncio のタスクとして
+指定した到着パターンで送信させる。送信データは 03_値と変数/ と 04_組み込み関数/ の
+ノートブックから、実際の送信ボタンと同じ範囲のセルを取り出して作る。
+
+使い方:
+    # 同梱のローカル採点サーバーに対して、120人が一斉に送信
+    python -m python.load_test --students 120 --pattern burst
+
+    # 任意の採点システムに対して、60秒かけて徐々に増える送信
+    python -m python.load_test --url http://127.0.0.1:8080 --pattern ramp --duration 60 --json report.json
+
+結果は p50/p95/p99 の応答時間・リトライ回数・エラーの種類・スループットを
+表とJSONで出力する。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import glob
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission_control import AdmissionController
+from .grading_client import GradingClient
+from .http_transport import HttpTransport
+from .job_store import JobStore
+from .local_grading_server import LocalGradingServer
+from .notebook_reader import NotebookReader
+from .retry_policy import RetryPolicy
+
+# 送信データの元にするノートブックのフォルダ（リポジトリのルートからの相対パス）
+PAYLOAD_NOTEBOOK_DIRS = ("03_値と変数", "04_組み込み関数")
+DEFAULT_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+ARRIVAL_PATTERNS = ("burst", "ramp", "steady")
+
+
+def load_payloads(repo_root=DEFAULT_REPO_ROOT, notebook_dirs=PAYLOAD_NOTEBOOK_DIRS):
+    """
+    コースのノートブックから送信対象セルを取り出す
+
+    Returns:
+        list: (notebook_path, problem_number, cells) のリスト
+    """
+    reader = NotebookReader()
+    payloads = []
+    for notebook_dir in notebook_dirs:
+        for path in sorted(glob.glob(os.path.join(repo_root, notebook_dir, "*.ipynb"))):
+            with open(path, "r", encoding="utf-8") as f:
+                all_cells = json.load(f).get("cells", [])
+            notebook_path = os.path.relpath(path, repo_root)
+            for problem_number, index in reader.find_problem_numbers(all_cells):
+                cells = reader.filter_submission_cells(all_cells[:index])
+                payloads.append((notebook_path, problem_number, cells))
+    return payloads
+
+
+def personalize_cells(cells, student_index):
+    """学生ごとに解答が少しずつ違うように、最後のコードセルにコメントを足す"""
+    cells = copy.deepcopy(list(cells))
+    for cell in reversed(cells):
+        if cell.get("cell_type") == "code":
+            source = cell.get("source", "")
+            if isinstance(source, list):
+                source = "".join(source)
+            cell["source"] = f"{source}\n# student {student_index:03d}"
+            break
+    return cells
+
+
+def arrival_offsets(pattern, count, duration, rng=random):
+    """
+    到着パターンから、各学生が送信する時刻（開始からの秒数）を作る
+
+    - burst: 全員がほぼ同時（duration 秒以内にランダム、既定は0秒で一斉）
+    - ramp: 送信の頻度が0から直線的に増える（累積人数が時間の2乗に比例）
+    - steady: 一定間隔
+    """
+    if pattern == "burst":
+        return sorted(rng.uniform(0, duration) for _ in range(count))
+    if pattern == "ramp":
+        return [duration * math.sqrt(i / count) for i in range(count)]
+    if pattern == "steady":
+        return [duration * i / count for i in range(count)]
+    raise ValueError(f"未対応の到着パターンです: {pattern}")
+
+
+def percentile(values, p):
+    """線形補間によるパーセンタイル（値が無ければNone）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = math.floor(k)
+    upper = math.ceil(k)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def classify_error(response, exc):
+    """失敗した送信をエラーの種類に分類"""
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    if exc is not None:
+        return type(exc).__name__
+    return "unknown"
+
+
+class LoadTestClient(GradingClient):
+    """
+    送信ごとの試行回数・エラー・送信サイズを記録する GradingClient
+
+    送信制御は本来カーネル（＝学生）ごとなので、同じプロセス内で共有せず学生ごとに持つ。
+    """
+
+    def __init__(self, base_url, transport):
+        super().__init__(base_url, transport=transport)
+        self._admission = AdmissionController()
+        self.attempts = 0
+        self.attempt_errors = []
+        self.sent_bytes = 0
+
+    def get_admission_controller(self):
+        return self._admission if self.admission_control_enabled else None
+
+    def reset_metrics(self):
+        self.attempts = 0
+        self.attempt_errors = []
+        self.sent_bytes = 0
+
+    def _record_attempt(self, outcome):
+        success, _, _, response, exc = outcome
+        self.attempts += 1
+        if response is not None and getattr(response, "payload_stats", None):
+            self.sent_bytes += response.payload_stats["sent_bytes"]
+        if not success:
+            self.attempt_errors.append(classify_error(response, exc))
+        return outcome
+
+    async def _send_attempt(self, submission_data, budget, path="/grade", cancel_token=None):
+        return self._record_attempt(await super()._send_attempt(submission_data, budget, path, cancel_token))
+
+    async def _send_stream_attempt(self, submission_data, budget, on_stream_event=None, cancel_token=None):
+        return self._record_attempt(
+            await super()._send_stream_attempt(submission_data, budget, on_stream_event, cancel_token)
+        )
+
+
+async def _simulate_student(index, client, payload, test_start, offset, retry_policy):
+    """1人分の送信を予定時刻（test_start + offset）に行い、結果を返す"""
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(max(0.0, test_start + offset - loop.time()))
+
+    notebook_path, problem_number, cells = payload
+    client.set_notebook_path(notebook_path)
+    submission_data = client.create_submission_data(
+        f"student{index:03d}@example.ac.jp", problem_number, personalize_cells(cells, index)
+    )
+    client.reset_metrics()
+    started = loop.time()
+    try:
+        success, _, error_msg = await client._send_to_grading_system_with_retry(
+            submission_data, retry_policy=retry_policy, problem_number=problem_number
+        )
+    except Exception as e:
+        success, error_msg = False, f"{type(e).__name__}: {e}"
+        client.attempt_errors.append(type(e).__name__)
+    finished = loop.time()
+
+    return {
+        "student": index,
+        "notebook_path": notebook_path,
+        "problem_number": problem_number,
+        "scheduled_at": offset,
+        "latency": finished - started,
+        "success": success,
+        "attempts": client.attempts,
+        "retries": max(0, client.attempts - 1),
+        "attempt_errors": list(client.attempt_errors),
+        "error_class": None if success else (client.attempt_errors[-1] if client.attempt_errors else "unknown"),
+        "error": error_msg,
+        "sent_bytes": client.sent_bytes,
+    }
+
+
+async def run_load_test(url, students=120, pattern="burst", duration=0.0, retry_policy=None,
+                        streaming=True, payloads=None, seed=None):
+    """
+    負荷試験を実行して、送信ごとの記録を返す（コルーチン）
+
+    Args:
+        url (str): 採点システムのURL
+        students (int): 同時に送信する学生数
+        pattern (str): 到着パターン（burst / ramp / steady）
+        duration (float): 全員の送信が始まるまでの秒数
+        retry_policy (RetryPolicy): リトライ方針（Noneなら GradingClient の既定値）
+        streaming (bool): サーバーが対応していればストリーミング方式を使うか
+        payloads (list): load_payloads() の結果（Noneならコースのノートブックから作る）
+        seed (int): 乱数のシード（到着時刻・送信データの割り当て）
+
+    Returns:
+        tuple: (records: list, wall_time: float)
+    """
+    rng = random.Random(seed)
+    payloads = payloads or load_payloads()
+    if not payloads:
+        raise RuntimeError("送信データの元になるノートブックが見つかりません")
+
+    loop = asyncio.get_running_loop()
+    # 学生ごとに別のカーネルで送信する想定なので、スレッド数で頭打ちにならないようにする
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=students + 4))
+
+    job_dir = tempfile.mkdtemp(prefix="grading_load_test_")
+    job_store = JobStore(os.path.join(job_dir, "jobs.json"))
+    clients = []
+    for _ in range(students):
+        client = LoadTestClient(url, transport=HttpTransport(pool_connections=1, pool_maxsize=2))
+        client.set_result_cache(False)
+        client.set_offline_queue(False)
+        client.set_streaming(streaming)
+        client.job_store = job_store
+        clients.append(client)
+
+    offsets = arrival_offsets(pattern, students, duration, rng)
+    start = loop.time() + 0.1
+    tasks = [
+        _simulate_student(i, client, rng.choice(payloads), start, offset, retry_policy)
+        for i, (client, offset) in enumerate(zip(clients, offsets))
+    ]
+    try:
+        records = await asyncio.gather(*tasks)
+    finally:
+        wall_time = loop.time() - start
+        for client in clients:
+            client.close()
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return records, wall_time
+
+
+def summarize(records, wall_time, config=None):
+    """送信ごとの記録から集計結果（JSONに出力する辞書）を作る"""
+    latencies = [r["latency"] for r in records]
+    success_latencies = [r["latency"] for r in records if r["success"]]
+    successes = sum(1 for r in records if r["success"])
+    retries = [r["retries"] for r in records]
+
+    def latency_stats(values):
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else None,
+            "mean": sum(values) / len(values) if values else None,
+        }
+
+    return {
+        "config": config or {},
+        "submissions": len(records),
+        "succeeded": successes,
+        "failed": len(records) - successes,
+        "wall_time": wall_time,
+        "throughput_per_second": successes / wall_time if wall_time > 0 else None,
+        "latency": latency_stats(latencies),
+        "success_latency": latency_stats(success_latencies),
+        "retries": {
+            "total": sum(retries),
+            "mean": sum(retries) / len(retries) if retries else 0,
+            "max": max(retries) if retries else 0,
+            "distribution": dict(sorted(Counter(retries).items())),
+        },
+        "attempt_error_classes": dict(Counter(e for r in records for e in r["attempt_errors"])),
+        "final_error_classes": dict(Counter(r["error_class"] for r in records if not r["success"])),
+        "sent_bytes": sum(r["sent_bytes"] for r in records),
+    }
+
+
+def _pad(text, width):
+    """全角文字を2桁として、表示幅が width になるように右側を空白で埋める"""
+    display_width = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+    return text + " " * max(0, width - display_width)
+
+
+def print_summary(summary):
+    """集計結果を表で表示"""
+    def fmt(value, unit="s"):
+        return "-" if value is None else f"{value:.3f}{unit}"
+
+    config = summary["config"]
+    print("=" * 64)
+    print("📈 負荷試験結果")
+    print("=" * 64)
+    if config:
+        print(f"  送信先: {config.get('url')}  学生数: {config.get('students')}  "
+              f"パターン: {config.get('pattern')}  期間: {config.get('duration')}s")
+    print(f"  送信数: {summary['submissions']}  成功: {summary['succeeded']}  失敗: {summary['failed']}")
+    print(f"  全体時間: {summary['wall_time']:.2f}s  "
+          f"スループット: {fmt(summary['throughput_per_second'], ' 件/s')}")
+    print(f"  送信量: {summary['sent_bytes']:,} bytes")
+    print("-" * 64)
+    print(f"  {_pad('応答時間', 12)}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'mean':>10}")
+    for label, key in (("全送信", "latency"), ("成功のみ", "success_latency")):
+        stats = summary[key]
+        print(f"  {_pad(label, 12)}{fmt(stats['p50']):>10}{fmt(stats['p95']):>10}{fmt(stats['p99']):>10}"
+              f"{fmt(stats['max']):>10}{fmt(stats['mean']):>10}")
+    print("-" * 64)
+    retries = summary["retries"]
+    print(f"  リトライ: 合計 {retries['total']} 回  平均 {retries['mean']:.2f} 回  最大 {retries['max']} 回")
+    print(f"  リトライ回数の分布: {retries['distribution']}")
+    if summary["attempt_error_classes"]:
+        print(f"  試行ごとのエラー: {summary['attempt_error_classes']}")
+    if summary["final_error_classes"]:
+        print(f"  最終的な失敗の原因: {summary['final_error_classes']}")
+    print("=" * 64)
+
+
+def main(argv=None):
+    """コマンドラインから負荷試験を実行"""
+    parser = argparse.ArgumentParser(description="採点クライアントの負荷試験")
+    parser.add_argument("--url", help="採点システムのURL（省略時は同梱のローカル採点サーバーを起動）")
+    parser.add_argument("--students", type=int, default=120, help="同時に送信する学生数")
+    parser.add_argument("--pattern", choices=ARRIVAL_PATTERNS, default="burst", help="到着パターン")
+    parser.add_argument("--duration", type=float, default=0.0, help="全員の送信が始まるまでの秒数")
+    parser.add_argument("--grading-delay", type=float, default=1.0, help="ローカル採点サーバーの採点時間（秒）")
+    parser.add_argument("--max-attempts", type=int, default=4, help="1人あたりの最大送信回数")
+    parser.add_argument("--deadline", type=float, default=300.0, help="1人あたりの送信の締め切り（秒）")
+    parser.add_argument("--no-stream", action="store_true", help="ストリーミング方式を使わない")
+    parser.add_argument("--repo-root", default=DEFAULT_REPO_ROOT, help="コースのノートブックがあるフォルダ")
+    parser.add_argument("--seed", type=int, default=None, help="乱数のシード")
+    parser.add_argument("--json", dest="json_path", help="集計結果のJSONを保存するファイル（- で標準出力）")
+    parser.add_argument("--records", action="store_true", help="JSONに送信ごとの記録も含める")
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.repo_root)
+    print(f"📚 送信データ: {len(payloads)}問分（{', '.join(PAYLOAD_NOTEBOOK_DIRS)}）")
+
+    server = None
+    url = args.url
+    if url is None:
+        server = LocalGradingServer(grading_delay=args.grading_delay).start()
+        url = server.url
+        print(f"🧪 ローカル採点サーバーを起動しました: {url}（採点時間 {args.grading_delay}s）")
+
+    retry_policy = RetryPolicy(max_attempts=args.max_attempts, deadline=args.deadline,
+                               max_attempt_timeout=min(180.0, args.deadline))
+    config = {
+        "url": url,
+        "students": args.students,
+        "pattern": args.pattern,
+        "duration": args.duration,
+        "max_attempts": args.max_attempts,
+        "deadline": args.deadline,
+        "streaming": not args.no_stream,
+        "local_server": server is not None,
+    }
+    print(f"🚀 {args.students}人分の送信を開始します（{args.pattern}）...")
+    try:
+        # 送信処理の表示（進捗・リトライのカウントダウン等）は集計の邪魔になるので捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            records, wall_time = asyncio.run(run_load_test(
+                url, args.students, args.pattern, args.duration, retry_policy,
+                streaming=not args.no_stream, payloads=payloads, seed=args.seed
+            ))
+    finally:
+        if server is not None:
+            server.stop()
+
+    summary = summarize(records, wall_time, config)
+    print_summary(summary)
+
+    if args.json_path:
+        report = dict(summary, records=records) if args.records else summary
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.json_path == "-":
+            print(text)
+        else:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"💾 集計結果を保存しました: {args.json_path}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
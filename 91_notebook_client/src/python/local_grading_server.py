@@ -0,0 +1,746 @@
+"""
+ローカル採点サーバーモジュール - 本番の採点システムの代わりに使うテスト用サーバー
+
+本番（CloudRun）に送らずに送信処理を試すためのもの。採点は行わず、
+送信データの形式に沿った採点結果をそれらしく組み立てて返す。
+
+使い方:
+    server = LocalGradingServer().start()
+    client = GradingClient(server.url)
+    ...
+    server.stop()
+
+    # 遅延・障害を注入する場合（リトライ・タイムアウトの確認用）
+    server = LocalGradingServer(faults=FaultInjector(latency=("uniform", 0.5, 2.0), throttle_rate=0.2))
+
+    # コマンドラインから起動する場合
+    python -m python.local_grading_server --port 8080
+    python -m python.local_grading_server --latency lognormal:0.8:0.5 --error-rate 0.05 --reset-rate 0.05
+"""
+
+import contextlib
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .payload_codec import decode_body
+from .delta_submission import cell_hash, resolve_delta_cells, DELTA_FEATURE, DELTA_ENCODING
+from .fault_injection import (
+    FaultInjector, ACTION_ERROR, ACTION_THROTTLE, ACTION_UNAVAILABLE, ACTION_SLOW_DRIP, ACTION_RESET
+)
+
+# ジョブ方式に対応していることを示す機能名（grading_client.JOBS_FEATURE と同じ）
+JOBS_FEATURE = "jobs"
+
+# ストリーミング方式の機能名とContent-Type（grading_client.STREAM_FEATURE と同じ）
+STREAM_FEATURE = "stream"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# まとめて採点に対応していることを示す機能名（grading_client.BATCH_FEATURE と同じ）
+BATCH_FEATURE = "batch"
+
+# 採点の取り消しに対応していることを示す機能名と送信IDのヘッダー（grading_client と同じ）
+CANCEL_FEATURE = "cancel"
+SUBMISSION_ID_HEADER = "X-Submission-Id"
+
+# 問題の区切りとみなすマークダウン見出し（例: 「## 練習プログラム2 ...」）
+PROBLEM_HEADING_PATTERN = re.compile(r"練習プログラム\s*(\d+)")
+
+# 送信データの形式チェック（create_submission_data / create_batch_submission_data と同じ形式）
+ASSIGNMENT_ID_PATTERN = re.compile(r"^practice_problem_(\d+|all)$")
+CELL_TYPES = ("code", "markdown", "raw")
+
+
+def validate_submission(submission, batch=False):
+    """
+    送信データの形式をチェック
+
+    Args:
+        submission (dict): 受信した送信データ（差分送信は元に戻したもの）
+        batch (bool): 全問題まとめて採点の送信データか
+
+    Returns:
+        list: 形式の誤り（問題がなければ空のリスト）
+    """
+    if not isinstance(submission, dict):
+        return ["送信データがJSONオブジェクトではありません"]
+    errors = []
+    email = submission.get("student_email")
+    if not isinstance(email, str) or "@" not in email:
+        errors.append("student_email: メールアドレスの文字列が必要です")
+    assignment_id = submission.get("assignment_id")
+    if not isinstance(assignment_id, str) or not ASSIGNMENT_ID_PATTERN.match(assignment_id):
+        errors.append(f"assignment_id: practice_problem_N の形式が必要です: {assignment_id!r}")
+    if submission.get("notebook_path") is not None and not isinstance(submission["notebook_path"], str):
+        errors.append("notebook_path: 文字列またはnullが必要です")
+
+    notebook = submission.get("notebook")
+    cells = notebook.get("cells") if isinstance(notebook, dict) else None
+    if not isinstance(cells, list):
+        errors.append("notebook.cells: セルのリストが必要です")
+        cells = []
+    for index, cell in enumerate(cells):
+        prefix = f"notebook.cells[{index}]"
+        if not isinstance(cell, dict):
+            errors.append(f"{prefix}: オブジェクトが必要です")
+            continue
+        if cell.get("cell_type") not in CELL_TYPES:
+            errors.append(f"{prefix}.cell_type: {', '.join(CELL_TYPES)} のいずれかが必要です")
+        source = cell.get("source")
+        if not isinstance(source, str) and not (
+                isinstance(source, list) and all(isinstance(line, str) for line in source)):
+            errors.append(f"{prefix}.source: 文字列または文字列のリストが必要です")
+        if "outputs" in cell and not isinstance(cell["outputs"], list):
+            errors.append(f"{prefix}.outputs: リストが必要です")
+
+    if batch:
+        problems = submission.get("problems")
+        if not isinstance(problems, list) or not problems:
+            errors.append("problems: 問題のリストが必要です")
+            problems = []
+        for index, entry in enumerate(problems):
+            if (not isinstance(entry, dict) or not isinstance(entry.get("problem_number"), int) or
+                    not isinstance(entry.get("cell_count"), int) or not 0 <= entry["cell_count"] <= len(cells)):
+                errors.append(f"problems[{index}]: problem_number と 0〜{len(cells)} の cell_count が必要です")
+    return errors
+
+
+def _join_source(cell):
+    """セルのsourceを文字列で取得"""
+    source = cell.get("source", "")
+    if isinstance(source, list):
+        source = "".join(source)
+    return source
+
+
+def _split_problems(cells, default_problem_number):
+    """「練習プログラムN」の見出しでセルを問題ごとに分ける（見出しが無ければ全体で1問）"""
+    groups = []
+    for cell in cells:
+        match = None
+        if cell.get("cell_type") == "markdown":
+            match = PROBLEM_HEADING_PATTERN.search(_join_source(cell))
+        if match:
+            groups.append((int(match.group(1)), [cell]))
+        elif groups:
+            groups[-1][1].append(cell)
+    return groups or [(default_problem_number, cells)]
+
+
+def _grade_problem(problem_number, cells):
+    """1問分の採点結果を組み立てる"""
+    # マークダウンセルと、その後に続くコードセルの組を小問として扱う
+    sub_problems = []
+    for cell in cells:
+        if cell.get("cell_type") == "markdown":
+            sub_problems.append({
+                "student_markdown_cell": _join_source(cell),
+                "answer_markdown_cell": _join_source(cell),
+                "markdown_similarity": 1.0,
+                "student_code_cells": [],
+                "student_score_rate": 0.0,
+                "feedbacks": [],
+            })
+        elif cell.get("cell_type") == "code" and sub_problems:
+            code = _join_source(cell)
+            if code.strip():
+                sub_problems[-1]["student_code_cells"].append(code)
+                sub_problems[-1]["student_score_rate"] = 1.0
+
+    graded = [s for s in sub_problems if s["student_code_cells"]] or sub_problems[-1:]
+    return {
+        "problem_number": problem_number,
+        "student_score": sum(10 for s in graded if s["student_score_rate"] >= 1.0),
+        "answer_full_score": 10 * len(graded),
+        "sub_problems": graded,
+    }
+
+
+def _problem_number(submission):
+    try:
+        return int(submission.get("assignment_id", "practice_problem_1").rsplit("_", 1)[-1])
+    except ValueError:
+        return 1
+
+
+def iter_grading_events(submission, grading_delay=0.0, sleep=time.sleep):
+    """
+    採点結果をストリーミング用のイベントとして1つずつ返す
+
+    start（送信者情報）→ problem（1問ごと）→ end（総合フィードバック）の順。
+    grading_delay は問題数で割って、各問題の採点時間として待つ。
+    sleep が真を返したら（採点が取り消されたら）そこで終える。
+
+    Yields:
+        dict: "type" が "start" / "problem" / "end" のイベント
+    """
+    cells = submission.get("notebook", {}).get("cells", [])
+    groups = _split_problems(cells, _problem_number(submission))
+    yield {
+        "type": "start",
+        "student_email": submission.get("student_email"),
+        "assignment_id": submission.get("assignment_id", "practice_problem_1"),
+        "timestamp": datetime.now().isoformat(),
+        "problem_count": len(groups),
+    }
+    for problem_number, problem_cells in groups:
+        if grading_delay and sleep(grading_delay / len(groups)):
+            return
+        yield {"type": "problem", "problem": _grade_problem(problem_number, problem_cells)}
+    yield {
+        "type": "end",
+        "overall_feedback": "ローカル採点サーバーによるダミーの採点結果です",
+        "execution_log": "",
+    }
+
+
+def build_grading_result(submission):
+    """
+    送信データから採点結果（本番と同じ形式）を組み立てる
+
+    Args:
+        submission (dict): create_submission_data で作られた送信データ
+
+    Returns:
+        dict: notebook_results / problems / sub_problems を含む採点結果
+    """
+    header, problems, footer = {}, [], {}
+    for event in iter_grading_events(submission):
+        if event["type"] == "start":
+            header = event
+        elif event["type"] == "problem":
+            problems.append(event["problem"])
+        else:
+            footer = event
+    return {
+        "student_email": header["student_email"],
+        "assignment_id": header["assignment_id"],
+        "timestamp": header["timestamp"],
+        "notebook_results": {
+            "problems": problems,
+            "overall_feedback": footer["overall_feedback"],
+            "execution_log": footer["execution_log"],
+        },
+    }
+
+
+def build_batch_result(submission):
+    """
+    全問題まとめて採点の送信データから、全問題分の採点結果を組み立てる
+
+    各問題は、送信されたセルの先頭 cell_count 個を1回ずつ送信した場合と同じように採点する。
+
+    Args:
+        submission (dict): create_batch_submission_data で作られた送信データ
+
+    Returns:
+        dict: notebook_results.problems に全問題を含む採点結果
+    """
+    notebook = submission.get("notebook", {})
+    cells = notebook.get("cells", [])
+    problems = []
+    result = None
+    for entry in submission.get("problems", []):
+        problem_number = entry["problem_number"]
+        prefix = cells[:entry.get("cell_count", len(cells))]
+        result = build_grading_result(dict(
+            submission,
+            assignment_id=entry.get("assignment_id", f"practice_problem_{problem_number}"),
+            notebook=dict(notebook, cells=prefix)
+        ))
+        graded = result["notebook_results"]["problems"]
+        matched = [p for p in graded if p["problem_number"] == problem_number] or graded[-1:]
+        problems.extend(dict(p, problem_number=problem_number) for p in matched[:1])
+
+    result = result or build_grading_result(submission)
+    result["assignment_id"] = submission.get("assignment_id")
+    result["notebook_results"]["problems"] = sorted(problems, key=lambda p: p["problem_number"])
+    return result
+
+
+def _server_timing(started_at):
+    """採点にかかった時間を Server-Timing ヘッダーで返す（クライアントの計測用）"""
+    return {"Server-Timing": f"grade;dur={(time.perf_counter() - started_at) * 1000:.1f}"}
+
+
+def _job_etag(job):
+    """ジョブの状態ごとに変わるETag"""
+    return f'"{job["job_id"]}-{job["version"]}"'
+
+
+class _GradingRequestHandler(BaseHTTPRequestHandler):
+    """ローカル採点サーバーのリクエストハンドラ"""
+
+    protocol_version = "HTTP/1.1"  # Keep-Aliveを有効にする
+    _drip = None  # 少しずつ返す場合の (間隔秒, バイト数)
+
+    def log_message(self, format, *args):
+        if self.server.app.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in dict(self.server.app.response_headers, **(headers or {})).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self._drip is None:
+            self.wfile.write(body)
+            return
+        # 少しずつしか届かない応答を再現する
+        interval, chunk = self._drip
+        for start in range(0, len(body), chunk):
+            self.wfile.write(body[start:start + chunk])
+            self.wfile.flush()
+            time.sleep(interval)
+
+    def _inject_fault(self):
+        """
+        障害注入の設定に従って遅延・障害を起こす
+
+        Returns:
+            bool: 障害の応答を返した（または切断した）ならTrue。通常の処理を続けるならFalse
+        """
+        faults = self.server.app.faults
+        if faults is None or not faults.applies_to(self.path):
+            return False
+        action, delay = faults.decide(self.path)
+        if delay:
+            time.sleep(delay)
+        if action == ACTION_RESET:
+            self._reset_connection()
+            return True
+        if action == ACTION_ERROR:
+            self._send_json(faults.error_status, {"error": "injected_fault"})
+            return True
+        if action in (ACTION_THROTTLE, ACTION_UNAVAILABLE):
+            status = 429 if action == ACTION_THROTTLE else 503
+            headers = {} if faults.retry_after is None else {"Retry-After": str(faults.retry_after)}
+            self._send_json(status, {"error": "Too Many Requests" if status == 429 else "Service Unavailable"},
+                            headers=headers)
+            return True
+        if action == ACTION_SLOW_DRIP:
+            self._drip = (faults.drip_interval, faults.drip_chunk)
+        return False
+
+    def _reset_connection(self):
+        """応答を返さずに接続をリセットする（SO_LINGER=0 で閉じてRSTを送る）"""
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.connection.close()
+        self.close_connection = True
+
+    def _read_json_body(self):
+        """ボディを読み込み、Content-Encodingに従って展開してJSONとして返す"""
+        app = self.server.app
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        encoding = (self.headers.get("Content-Encoding") or "identity").lower()
+        if encoding != "identity" and encoding not in app.accepted_encodings:
+            self._send_json(415, {"error": f"Unsupported Content-Encoding: {encoding}"})
+            return None
+        try:
+            raw = decode_body(body, encoding)
+        except Exception as e:
+            self._send_json(400, {"error": f"Content-Encoding: {encoding} のボディを展開できません: {e}"})
+            return None
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except Exception as e:
+            self._send_json(400, {"error": f"リクエストボディを解釈できません: {e}"})
+            return None
+        app.record_request(len(body), len(raw), encoding)
+        return data
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/capabilities":
+            self._send_json(200, {"features": sorted(self.server.app.features)})
+            return
+        if url.path.startswith("/jobs/") and JOBS_FEATURE in self.server.app.features:
+            self._get_job(url.path[len("/jobs/"):], parse_qs(url.query))
+            return
+        self._send_json(404, {"error": f"Not Found: {self.path}"})
+
+    def do_POST(self):
+        self._drip = None
+        app = self.server.app
+        submission_id = self.headers.get(SUBMISSION_ID_HEADER)
+        if (self.path.startswith("/submissions/") and self.path.endswith("/cancel") and
+                CANCEL_FEATURE in app.features):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            cancelled = app.cancel_submission(self.path[len("/submissions/"):-len("/cancel")])
+            self._send_json(202 if cancelled else 404, {"cancelled": cancelled})
+            return
+        if self.path == "/jobs" and JOBS_FEATURE in self.server.app.features:
+            submission = self._read_submission()
+            if submission is None or self._inject_fault():
+                return
+            job = self.server.app.create_job(submission, submission_id)
+            self._send_json(202, {"job_id": job["job_id"], "status": job["status"]},
+                            headers={"Location": f"/jobs/{job['job_id']}"})
+            return
+        if self.path == "/grade_batch" and BATCH_FEATURE in self.server.app.features:
+            submission = self._read_submission(batch=True)
+            if submission is None or self._inject_fault():
+                return
+            if not submission.get("problems"):
+                self._send_json(400, {"error": "problems が指定されていません"})
+                return
+            started_at = time.perf_counter()
+            with app.grading(submission_id):
+                if app.grading_delay and app.sleep_unless_cancelled(submission_id, app.grading_delay):
+                    self.close_connection = True  # 取り消された（クライアントは切断済み）
+                    return
+            result = build_batch_result(submission)
+            self._send_json(200, result, headers=_server_timing(started_at))
+            return
+        if self.path != "/grade":
+            self._send_json(404, {"error": f"Not Found: {self.path}"})
+            return
+        submission = self._read_submission()
+        if submission is None or self._inject_fault():
+            return
+        if (STREAM_FEATURE in self.server.app.features and
+                NDJSON_CONTENT_TYPE in self.headers.get("Accept", "")):
+            with app.grading(submission_id):
+                self._send_stream(submission, submission_id)
+            return
+        started_at = time.perf_counter()
+        with app.grading(submission_id):
+            if app.grading_delay and app.sleep_unless_cancelled(submission_id, app.grading_delay):
+                self.close_connection = True  # 取り消された（クライアントは切断済み）
+                return
+        result = build_grading_result(submission)
+        self._send_json(200, result, headers=_server_timing(started_at))
+
+    def _send_stream(self, submission, submission_id=None):
+        """採点が終わった問題から1行ずつ（NDJSON、chunked転送で）返す"""
+        app = self.server.app
+        self.send_response(200)
+        self.send_header("Content-Type", f"{NDJSON_CONTENT_TYPE}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in self.server.app.response_headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        sleep = lambda seconds: app.sleep_unless_cancelled(submission_id, seconds)
+        for event in iter_grading_events(submission, app.grading_delay, sleep):
+            if self._drip is not None:
+                time.sleep(self._drip[0])
+            line = json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_submission(self, batch=False):
+        """
+        送信データを読み込み、差分送信なら元に戻して形式をチェックする
+        （エラー時はレスポンス送信済みでNone）
+        """
+        submission = self._read_json_body()
+        if submission is None:
+            return None
+        submission = self._resolve_submission(submission)
+        if submission is None or not self.server.app.validate_schema:
+            return submission
+        errors = validate_submission(submission, batch=batch)
+        if errors:
+            self.server.app.record_invalid()
+            self._send_json(422, {"error": "invalid_submission", "details": errors})
+            return None
+        return submission
+
+    def _get_job(self, job_id, query):
+        """ジョブの状態を返す（If-None-Match と同じ状態ならwait秒まで変化を待つ）"""
+        app = self.server.app
+        try:
+            wait = min(float(query.get("wait", ["0"])[0]), 60.0)
+        except ValueError:
+            wait = 0.0
+        job = app.wait_job(job_id, self.headers.get("If-None-Match"), wait)
+        if job is None:
+            self._send_json(404, {"error": f"ジョブが見つかりません: {job_id}"})
+            return
+        etag = _job_etag(job)
+        if etag == self.headers.get("If-None-Match"):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = {"job_id": job["job_id"], "status": job["status"]}
+        if job["status"] == "done":
+            body["result"] = job["result"]
+        try:
+            self._send_json(200, body, headers={"ETag": etag})
+        except (BrokenPipeError, ConnectionResetError):
+            # 取り消しでクライアントが待機中の接続を切った
+            self.close_connection = True
+
+    def _resolve_submission(self, submission):
+        """差分送信されたセルを元に戻し、受け取ったセルを記録する"""
+        app = self.server.app
+        notebook = submission.get("notebook", {})
+        cells = notebook.get("cells", [])
+        if submission.get("cell_encoding") == DELTA_ENCODING:
+            if DELTA_FEATURE not in app.features:
+                self._send_json(400, {"error": "差分送信には対応していません"})
+                return None
+            cells, missing = resolve_delta_cells(cells, app.cell_store)
+            app.record_delta(missing)
+            if missing:
+                self._send_json(409, {"error": "cell_cache_miss", "missing": missing})
+                return None
+            submission = dict(submission, notebook=dict(notebook, cells=cells))
+            submission.pop("cell_encoding")
+        if DELTA_FEATURE in app.features:
+            app.store_cells(cells)
+        return submission
+
+
+class LocalGradingServer:
+    """テスト用のローカル採点サーバー（同一プロセス内のスレッドで動作）"""
+
+    def __init__(self, host="127.0.0.1", port=0, accepted_encodings=("gzip", "zstd"),
+                 features=(DELTA_FEATURE, JOBS_FEATURE, STREAM_FEATURE, BATCH_FEATURE, CANCEL_FEATURE),
+                 grading_delay=0.0, response_headers=None, faults=None, validate_schema=True, verbose=False):
+        self.host = host
+        self.port = port
+        self.accepted_encodings = set(accepted_encodings)
+        self.features = set(features)
+        self.verbose = verbose
+        self.grading_delay = grading_delay  # 採点にかかる時間（秒）
+        # 全レスポンスに付けるヘッダー（RateLimit-Policy など送信制御の確認用）
+        self.response_headers = dict(response_headers or {})
+        # 遅延・障害の注入（FaultInjector、Noneなら注入しない）と送信データの形式チェック
+        self.faults = faults
+        self.validate_schema = validate_schema
+        self.cell_store = {}  # ハッシュ -> セル（差分送信用）
+        self.jobs = {}  # ジョブID -> ジョブ（ジョブ方式用）
+        self._cancel_events = {}  # 採点中の送信ID -> 取り消されたらセットされるEvent
+        self._grading_counts = {}  # 採点中の送信ID -> 採点中のリクエスト数（再送が重なる場合がある）
+        self._job_changed = threading.Condition()
+        self._httpd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "received_bytes": 0,
+            "decoded_bytes": 0,
+            "encodings": {},
+            "delta_requests": 0,
+            "cell_cache_misses": 0,
+            "invalid_submissions": 0,
+            "cancelled": 0,
+        }
+
+    @property
+    def url(self):
+        """サーバーのベースURL"""
+        return f"http://{self.host}:{self.port}"
+
+    def record_request(self, received_bytes, decoded_bytes, encoding):
+        """受信統計を記録"""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["received_bytes"] += received_bytes
+            self.stats["decoded_bytes"] += decoded_bytes
+            self.stats["encodings"][encoding] = self.stats["encodings"].get(encoding, 0) + 1
+
+    def record_invalid(self):
+        """形式の誤った送信データの件数を記録"""
+        with self._lock:
+            self.stats["invalid_submissions"] += 1
+
+    def get_fault_stats(self):
+        """注入した障害の件数（動作の種類ごと）"""
+        return self.faults.get_stats() if self.faults is not None else {}
+
+    def record_delta(self, missing):
+        """差分送信の統計を記録"""
+        with self._lock:
+            self.stats["delta_requests"] += 1
+            if missing:
+                self.stats["cell_cache_misses"] += 1
+
+    def store_cells(self, cells):
+        """受け取ったセルをハッシュで記録（次回の差分送信で参照される）"""
+        with self._lock:
+            for cell in cells:
+                self.cell_store[cell_hash(cell)] = cell
+
+    @contextlib.contextmanager
+    def grading(self, submission_id):
+        """送信IDを採点中として登録し（取り消しの対象になる）、終わったら取り除く"""
+        if not submission_id:
+            yield
+            return
+        with self._lock:
+            self._cancel_events.setdefault(submission_id, threading.Event())
+            self._grading_counts[submission_id] = self._grading_counts.get(submission_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._grading_counts[submission_id] -= 1
+                if not self._grading_counts[submission_id]:
+                    del self._grading_counts[submission_id]
+                    del self._cancel_events[submission_id]
+
+    def sleep_unless_cancelled(self, submission_id, seconds):
+        """
+        採点時間として seconds 秒待つ（採点中の送信IDが途中で取り消されたらすぐ戻る）
+
+        Returns:
+            bool: 取り消されたならTrue
+        """
+        with self._lock:
+            event = self._cancel_events.get(submission_id) if submission_id else None
+        if event is None:
+            time.sleep(seconds)
+            return False
+        return event.wait(seconds)
+
+    def cancel_submission(self, submission_id):
+        """
+        送信IDの採点を取り消す（採点中なら中止し、ジョブは cancelled にする）
+
+        Returns:
+            bool: 取り消す対象が見つかったか
+        """
+        with self._lock:
+            event = self._cancel_events.get(submission_id)
+        found = event is not None
+        if found:
+            event.set()
+        with self._job_changed:
+            jobs = [job for job in self.jobs.values() if job.get("submission_id") == submission_id]
+        for job in jobs:
+            if job["status"] in ("queued", "running"):
+                self._update_job(job, status="cancelled")
+                found = True
+        if found:
+            with self._lock:
+                self.stats["cancelled"] += 1
+        return found
+
+    def create_job(self, submission, submission_id=None):
+        """採点ジョブを登録し、バックグラウンドで採点する"""
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "version": 0, "result": None,
+               "submission_id": submission_id}
+        with self._job_changed:
+            self.jobs[job["job_id"]] = job
+        threading.Thread(target=self._run_job, args=(job, submission), daemon=True).start()
+        return dict(job)
+
+    def _update_job(self, job, **changes):
+        with self._job_changed:
+            job.update(changes)
+            job["version"] += 1
+            self._job_changed.notify_all()
+
+    def _run_job(self, job, submission):
+        with self.grading(job["submission_id"]):
+            with self._job_changed:
+                if job["status"] == "cancelled":
+                    return  # 採点を始める前に取り消された
+            self._update_job(job, status="running")
+            if self.sleep_unless_cancelled(job["submission_id"], self.grading_delay):
+                self._update_job(job, status="cancelled")
+                return
+            self._update_job(job, status="done", result=build_grading_result(submission))
+
+    def wait_job(self, job_id, etag, wait):
+        """ジョブの状態がetagから変わるか、wait秒経つまで待ってジョブのコピーを返す"""
+        deadline = time.monotonic() + wait
+        with self._job_changed:
+            job = self.jobs.get(job_id)
+            while job is not None and etag == _job_etag(job):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._job_changed.wait(remaining)
+            return dict(job) if job is not None else None
+
+    def clear_cell_store(self):
+        """記録したセルを消す（キャッシュミス時の動作確認用）"""
+        with self._lock:
+            self.cell_store.clear()
+
+    def start(self):
+        """バックグラウンドスレッドでサーバーを起動"""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _GradingRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.app = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if self.verbose:
+            print(f"🧪 ローカル採点サーバー起動: {self.url}")
+        return self
+
+    def stop(self):
+        """サーバーを停止"""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """コマンドラインからローカル採点サーバーを起動"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="ローカル採点サーバー（テスト用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--grading-delay", type=float, default=0.0, help="採点にかかる時間（秒）")
+    parser.add_argument("--latency", default=None,
+                        help="応答までの遅延（例: 1.5 / uniform:0.5:2 / normal:1:0.3 / lognormal:0.8:0.5 / exponential:1）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す確率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="429を返す確率")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="503を返す確率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429/503 の Retry-After（秒）")
+    parser.add_argument("--slow-drip-rate", type=float, default=0.0, help="応答を少しずつ返す確率")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="接続をリセットする確率")
+    parser.add_argument("--seed", type=int, default=None, help="乱数のシード")
+    args = parser.parse_args()
+
+    faults = None
+    if (args.latency or args.error_rate or args.throttle_rate or args.unavailable_rate or
+            args.slow_drip_rate or args.reset_rate):
+        faults = FaultInjector(
+            latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+            unavailable_rate=args.unavailable_rate, retry_after=args.retry_after,
+            slow_drip_rate=args.slow_drip_rate, reset_rate=args.reset_rate, seed=args.seed
+        )
+    server = LocalGradingServer(args.host, args.port, grading_delay=args.grading_delay, faults=faults,
+                                verbose=True).start()
+    print("🛑 停止するには Ctrl+C を押してください")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
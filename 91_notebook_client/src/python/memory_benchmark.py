@@ -0,0 +1,201 @@
+"""
+メモリ計測モジュール - 大きなノートブックの送信1回分で使うメモリを段階ごとに測る
+
+送信ボタンを押してから送信データを送り出すまでの、通信以外の段階
+
+- read: 送信ボタンまでのセルの読み込み・#@title除外・軽量化
+- cache_key: 採点結果キャッシュのキー
+- delta: 差分送信のセルのハッシュ
+- encode: 送信データのJSON化と圧縮
+- debug: デバッグ用ファイルの書き出し
+
+を tracemalloc で計測し、段階ごとの最大使用量（peak）と、段階の後に残った
+メモリ（retained）・ブロック数（blocks）を表示する。ノートブックは出力付きのものを生成するか、
+--notebook で既存のファイルを指定する。
+
+使い方:
+    # 3000セル（1セル4KBの出力付き）のノートブックを生成して計測
+    python -m python.memory_benchmark --cells 3000 --output-kb 4
+
+    # 既存のノートブックの問題2で計測し、結果をJSONで保存
+    python -m python.memory_benchmark --notebook 01_練習.ipynb --problem 2 --json memory.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .debug_artifacts import ArtifactWriter
+from .delta_submission import DeltaTracker
+from .grading_client import GradingClient
+from .notebook_reader import NotebookReader
+from .payload_codec import encode_json_body
+from .result_cache import ResultCache
+
+STAGES = ("read", "cache_key", "delta", "encode", "debug")
+
+BENCHMARK_EMAIL = "benchmark@example.ac.jp"
+
+
+def make_notebook(cells=3000, source_lines=30, output_kb=4, seed=0):
+    """
+    出力付きのコードセルが並び、最後に送信ボタンがあるノートブックを作る
+
+    Returns:
+        dict: ノートブック（問題1の送信ボタンが最後のセル）
+    """
+    rng = random.Random(seed)
+    line_count = max(1, output_kb * 1024 // 81)
+    notebook_cells = []
+    for i in range(cells):
+        notebook_cells.append({
+            "cell_type": "code",
+            "id": f"cell-{i}",
+            "metadata": {"id": f"cell-{i}", "tags": ["benchmark"]},
+            "execution_count": i + 1,
+            "source": [f"value_{i}_{j} = {rng.random()!r}  # 計測用のコメント {j}\n" for j in range(source_lines)],
+            "outputs": [{"output_type": "stream", "name": "stdout", "text": ["x" * 80 + "\n"] * line_count}],
+        })
+    notebook_cells.append({
+        "cell_type": "code", "id": "submit", "metadata": {}, "execution_count": None,
+        "source": "create_submit_button(1)", "outputs": [],
+    })
+    return {"cells": notebook_cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+
+
+def _measure(function):
+    """function() の所要時間・最大使用量・残ったメモリとブロック数を測る"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+    finally:
+        tracemalloc.stop()
+    return value, {
+        "seconds": elapsed,
+        "peak_bytes": peak,
+        "retained_bytes": sum(stat.size_diff for stat in diff),
+        "retained_blocks": sum(stat.count_diff for stat in diff),
+    }
+
+
+def run_benchmark(notebook_file, problem_number=1, repeat=3):
+    """
+    送信1回分の各段階を repeat 回計測する（ノートブックのキャッシュは毎回捨てて読み直す）
+
+    Returns:
+        dict: 段階 -> {"seconds", "peak_bytes", "retained_bytes", "retained_blocks"}（各回の最大値）
+              と raw_bytes（送信データのJSONのバイト数）
+    """
+    reader = NotebookReader()
+    reader.set_notebook_path(notebook_file)
+    client = GradingClient()
+    client.set_notebook_path(notebook_file)
+    assignment_id = f"practice_problem_{problem_number}"
+    debug_dir = tempfile.mkdtemp(prefix="memory_benchmark_")
+    results = {stage: {} for stage in STAGES}
+    raw_bytes = 0
+    try:
+        for _ in range(repeat):
+            reader.invalidate_notebook_cache()
+            # 前回送信したセルの記録がある状態（2回目以降の送信）で差分を作る
+            tracker = DeltaTracker()
+            delta_key = ("benchmark",)
+            with contextlib.redirect_stdout(io.StringIO()):
+                cells, stats = _measure(lambda: reader.get_notebook_cells_before_submit(problem_number))
+            tracker.remember(delta_key, tracker.build_delta(delta_key, cells)[1])
+            submission_data = client.create_submission_data(BENCHMARK_EMAIL, problem_number, cells)
+            measured = {"read": stats}
+            _, measured["cache_key"] = _measure(
+                lambda: ResultCache.make_key(
+                    client.base_url, BENCHMARK_EMAIL, assignment_id, notebook_file, cells
+                )
+            )
+            _, measured["delta"] = _measure(lambda: tracker.build_delta(delta_key, cells))
+            encoded, measured["encode"] = _measure(lambda: encode_json_body(submission_data, ["gzip"]))
+            _, measured["debug"] = _measure(
+                lambda: ArtifactWriter._write_file(os.path.join(debug_dir, "request.json"), submission_data, False)
+            )
+            raw_bytes = encoded[2]["raw_bytes"]
+            for stage, stats in measured.items():
+                for key, value in stats.items():
+                    results[stage][key] = max(results[stage].get(key, value), value)
+    finally:
+        shutil.rmtree(debug_dir, ignore_errors=True)
+    return {"stages": results, "raw_bytes": raw_bytes, "cells": len(cells)}
+
+
+def print_report(report):
+    """計測結果を表で表示"""
+    print("=" * 64)
+    print(f"📏 メモリ計測結果（ファイル {report['file_bytes']:,} bytes, "
+          f"送信 {report['cells']}セル / {report['raw_bytes']:,} bytes）")
+    print("=" * 64)
+    print(f"  {'段階':<10}{'時間':>10}{'peak MB':>12}{'retained MB':>14}{'blocks':>10}")
+    for stage in STAGES:
+        stats = report["stages"][stage]
+        print(f"  {stage:<10}{stats['seconds'] * 1000:>8.0f}ms{stats['peak_bytes'] / 1e6:>12.2f}"
+              f"{stats['retained_bytes'] / 1e6:>14.2f}{stats['retained_blocks']:>10,}")
+    print("=" * 64)
+
+
+def main(argv=None):
+    """コマンドラインからメモリ計測を実行"""
+    parser = argparse.ArgumentParser(description="送信処理のメモリ計測")
+    parser.add_argument("--notebook", help="計測に使うノートブック（省略時は生成する）")
+    parser.add_argument("--problem", type=int, default=1, help="送信する問題番号")
+    parser.add_argument("--cells", type=int, default=3000, help="生成するノートブックのセル数")
+    parser.add_argument("--source-lines", type=int, default=30, help="生成するセルのソースの行数")
+    parser.add_argument("--output-kb", type=int, default=4, help="生成するセルの出力の大きさ（KB）")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数（各段階の最大値を表示）")
+    parser.add_argument("--json", dest="json_path", help="計測結果のJSONを保存するファイル（- で標準出力）")
+    args = parser.parse_args(argv)
+
+    work_dir = None
+    notebook_file = args.notebook
+    if notebook_file is None:
+        work_dir = tempfile.mkdtemp(prefix="memory_benchmark_")
+        notebook_file = os.path.join(work_dir, "benchmark.ipynb")
+        with open(notebook_file, "w", encoding="utf-8") as f:
+            json.dump(make_notebook(args.cells, args.source_lines, args.output_kb), f, ensure_ascii=False)
+    try:
+        # ノートブックは作業ディレクトリから探すので、ファイルのあるフォルダで実行する
+        directory, name = os.path.split(os.path.abspath(notebook_file))
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            report = run_benchmark(name, args.problem, args.repeat)
+        finally:
+            os.chdir(cwd)
+        report["file_bytes"] = os.path.getsize(notebook_file)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json_path:
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.json_path == "-":
+            print(text)
+        else:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"💾 計測結果を保存しました: {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+ノートブック読み込みキャッシュモジュール - 変更の無いノートブックを読み直さない
+
+VS Code では送信ボタンを押すたびにノートブックファイルを開いて json.load し直していたが、
+大きなノートブックでは解析に時間がかかる。解析済みのノートブックを
+（実パス, 更新時刻 st_mtime_ns, サイズ st_size）で照合して使い回し、
+ファイルが変わっていなければ読み込みも解析も行わない。
+
+キャッシュはカーネル内の全ての送信ボタン（NotebookReader）で共有し、
+件数・ファイルサイズの合計の上限を超えたら最近使っていないものから捨てる（LRU）。
+
+送信ボタンまでだけを読む逐次読み込み（StreamingNotebook）も kind="stream" で同じように
+キャッシュし、読み進めた所から続きを読めるようにする。
+
+キャッシュしたノートブックは全ての送信ボタンで同じオブジェクトを返すので、
+呼び出し側で変更しないこと（セルを加工する場合はコピーする）。
+ノートブックから作った索引など（送信ボタンの位置）は memo() でノートブックと一緒に保持できる。
+"""
+
+import collections
+import json
+import os
+import threading
+
+from .notebook_stream import StreamingNotebook
+
+# キャッシュするものの種類
+KIND_PARSED = "parsed"   # json.load したノートブック全体（dict）
+KIND_STREAM = "stream"   # 送信ボタンまでだけを読む StreamingNotebook
+
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024   # キャッシュするノートブックのファイルサイズの合計
+
+
+class NotebookCache:
+    """解析済みのノートブックを実パス・更新時刻・サイズで照合して使い回すクラス（スレッドセーフ）"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._entries = collections.OrderedDict()  # (実パス, 種類) -> (st_mtime_ns, st_size, notebook)
+        self._memos = {}    # id(ノートブック または セル一覧) -> ((実パス, 種類), {名前: 値})
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(stat_result):
+        """ファイルが変わったかどうかの判定に使う値（更新時刻 ns, サイズ）"""
+        return stat_result.st_mtime_ns, stat_result.st_size
+
+    def load(self, path, stat_result=None, kind=KIND_PARSED):
+        """
+        ノートブックを読み込む（変更が無ければキャッシュを返す）
+
+        Args:
+            path (str): ノートブックファイルのパス
+            stat_result (os.stat_result): 呼び出し側で取得済みの os.stat(path) の結果（省略可）
+            kind (str): KIND_PARSED（全体を解析）または KIND_STREAM（StreamingNotebook）
+
+        Returns:
+            dict または StreamingNotebook: 変更しないこと
+        """
+        realpath = os.path.realpath(path)
+        if stat_result is None:
+            stat_result = os.stat(realpath)
+        mtime_ns, size = self.signature(stat_result)
+        key = (realpath, kind)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == (mtime_ns, size):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[2]
+            self.stats["misses"] += 1
+
+        if kind == KIND_STREAM:
+            notebook = StreamingNotebook(realpath, stat_result)
+        else:
+            notebook = self._parse(realpath)
+
+        with self._lock:
+            self._remove(key)
+            if size <= self.max_bytes:
+                self._entries[key] = (mtime_ns, size, notebook)
+                self._total_bytes += size
+                memos = {}
+                self._memos[id(notebook)] = (key, memos)
+                if isinstance(notebook, dict) and isinstance(notebook.get("cells"), list):
+                    self._memos[id(notebook["cells"])] = (key, memos)
+                self._evict()
+        return notebook
+
+    def memo(self, owner, name, build):
+        """
+        キャッシュしたノートブックから作った値を、ノートブックと一緒に保持する
+
+        Args:
+            owner: load() が返したノートブック（StreamingNotebook を含む）、またはその "cells" のリスト
+            name (str): 値の名前
+            build (callable): build(owner) 値を作る関数（初回だけ呼ばれる）
+
+        Returns:
+            owner がキャッシュ中なら保持している値、そうでなければ build(owner) の結果
+        """
+        with self._lock:
+            memo = self._memos.get(id(owner))
+            if memo is not None and self._is_owner(memo[0], owner) and name in memo[1]:
+                return memo[1][name]
+        value = build(owner)
+        with self._lock:
+            memo = self._memos.get(id(owner))
+            if memo is not None and self._is_owner(memo[0], owner):
+                memo[1].setdefault(name, value)
+        return value
+
+    def _is_owner(self, key, owner):
+        entry = self._entries.get(key)
+        return entry is not None and (entry[2] is owner or
+                                      (isinstance(entry[2], dict) and entry[2].get("cells") is owner))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._total_bytes -= entry[1]
+        notebook = entry[2]
+        self._memos.pop(id(notebook), None)
+        if isinstance(notebook, dict):
+            self._memos.pop(id(notebook.get("cells")), None)
+        return entry
+
+    @staticmethod
+    def _parse(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def invalidate(self, path=None):
+        """
+        キャッシュを捨てる（path を省略すると全て）
+
+        Returns:
+            int: 捨てた件数
+        """
+        with self._lock:
+            if path is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._memos.clear()
+                self._total_bytes = 0
+            else:
+                realpath = os.path.realpath(path)
+                removed = sum(self._remove((realpath, kind)) is not None for kind in (KIND_PARSED, KIND_STREAM))
+            self.stats["invalidations"] += removed
+            return removed
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), total_bytes=self._total_bytes)
+
+
+# カーネル内で共有するNotebookCache（全ての送信ボタンで共有）
+_notebook_cache = NotebookCache()
+
+
+def get_notebook_cache():
+    """カーネル内で共有するNotebookCacheを取得"""
+    return _notebook_cache
@@ -0,0 +1,289 @@
+"""
+ノートブック一覧モジュール - 作業ディレクトリの *.ipynb をカーネル内で覚えておく
+
+VS Code では送信ボタンを押すたびに glob で送信対象のノートブックを探し、見つからなければ
+*.ipynb を全て列挙してファイル名をNFC正規化し、見つかったファイルの更新時刻を1つずつ調べていた。
+ノートブックやデバッグ用ファイルの多いディレクトリでは、これが毎回のディスク読み込みになる。
+
+このモジュールはディレクトリ内の *.ipynb の一覧（NFC正規化した名前 -> 元の名前・更新時刻・サイズ）を
+保持し、変更があった分だけ更新する。変更の検知は
+
+- inotify（Linux）: ファイルの作成・削除・変更・名前の変更の通知を、検索のたびにまとめて受け取る
+- それ以外（macOS / Windows）: ディレクトリの更新時刻が変わったときだけ一覧を作り直し、
+  見つかったノートブックだけ stat し直す（ファイルの中身の変更はディレクトリの更新時刻に出ないため）
+
+のどちらかで行い、どちらもバックグラウンドスレッドは使わない。
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import stat
+import struct
+import threading
+import time
+import unicodedata
+
+NOTEBOOK_SUFFIX = ".ipynb"
+
+# ディレクトリの更新時刻がこの秒数以内なら、同じ時刻のまま次の変更が起きうるので次回も作り直す
+RACY_WINDOW_NS = 2 * 10**9
+
+# カーネル内で監視するディレクトリの数の上限（超えたら古いものから監視をやめる）
+MAX_WATCHED_DIRECTORIES = 4
+
+# inotify（<sys/inotify.h> の値）
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_WATCH_LOST_MASK = _IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _InotifyWatcher:
+    """ディレクトリの変更通知を受け取る（ノンブロッキングのファイル記述子を検索のたびに読む）"""
+
+    def __init__(self, libc, directory):
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch に失敗しました")
+
+    def drain(self):
+        """
+        溜まっている通知を全て読む
+
+        Returns:
+            tuple: (changed_names: set, rescan: bool, lost: bool)
+                rescan は通知があふれて一覧を作り直す必要がある場合、
+                lost はディレクトリが削除・移動されて監視できなくなった場合にTrue
+        """
+        changed, rescan, lost = set(), False, False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed, rescan, lost
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & _WATCH_LOST_MASK:
+                    lost = True
+                elif mask & _IN_Q_OVERFLOW:
+                    rescan = True
+                elif name:
+                    changed.add(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class NotebookDirectoryIndex:
+    """1つのディレクトリの *.ipynb の一覧（NFC正規化した名前で引ける）"""
+
+    def __init__(self, directory, use_inotify=True):
+        self.directory = directory      # 検索結果のパスの先頭に付ける（呼び出し側の指定どおり）
+        self._path = os.path.realpath(directory)
+        self.stats = {"lookups": 0, "scans": 0, "events": 0, "restats": 0}
+        self._entries = {}      # NFC正規化した名前 -> {元の名前: os.stat_result}
+        self._dir_mtime_ns = None
+        self._stale = True
+        self._watcher = None
+        self._lock = threading.Lock()
+        libc = _load_libc() if use_inotify else None
+        if libc is not None:
+            try:
+                self._watcher = _InotifyWatcher(libc, self._path)
+            except OSError:
+                self._watcher = None
+
+    @property
+    def mode(self):
+        """変更の検知方法（"inotify" または "poll"）"""
+        return "inotify" if self._watcher is not None else "poll"
+
+    def find(self, pattern):
+        """
+        パターンに一致するノートブックを探す
+
+        glob と同じく元のファイル名で照合し、見つからなければ（macOS で貼り付けた名前の
+        濁点などの表現が違う場合に備えて）NFC正規化した名前どうしで照合する。
+
+        Args:
+            pattern (str): ファイル名のパターン（例: "01_プログラミング言語Python*.ipynb"）
+
+        Returns:
+            list: [(path: str, stat_result: os.stat_result)]
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._refresh()
+            files = [(name, st) for names in self._entries.values() for name, st in names.items()]
+            hits = [(name, st) for name, st in files if _matches(name, pattern)]
+            if not hits:
+                normalized_pattern = unicodedata.normalize("NFC", pattern)
+                hits = [(name, st) for name, st in files
+                        if _matches(unicodedata.normalize("NFC", name), normalized_pattern)]
+            if self._watcher is None:
+                hits = self._restat(hits)
+        return [(os.path.join(self.directory, name) if self.directory != os.curdir else name, st)
+                for name, st in hits]
+
+    def invalidate(self):
+        """次の検索で一覧を作り直す"""
+        with self._lock:
+            self._stale = True
+
+    def close(self):
+        """変更の監視をやめる"""
+        with self._lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            self._stale = True
+
+    def _refresh(self):
+        if self._watcher is not None:
+            try:
+                changed, rescan, lost = self._watcher.drain()
+            except OSError:
+                changed, rescan, lost = set(), True, True
+            self.stats["events"] += len(changed)
+            if lost:
+                # 以降はディレクトリの更新時刻で検知する
+                self._watcher.close()
+                self._watcher = None
+                self._stale = True
+            elif rescan:
+                self._stale = True
+            elif not self._stale:
+                for name in changed:
+                    if name.endswith(NOTEBOOK_SUFFIX):
+                        self._update(name)
+                return
+        else:
+            try:
+                dir_mtime_ns = os.stat(self._path).st_mtime_ns
+            except OSError:
+                dir_mtime_ns = None
+            if dir_mtime_ns != self._dir_mtime_ns:
+                self._stale = True
+        if self._stale:
+            self._scan()
+
+    def _scan(self):
+        """ディレクトリを列挙して一覧を作り直す"""
+        self.stats["scans"] += 1
+        self._entries = {}
+        try:
+            dir_mtime_ns = os.stat(self._path).st_mtime_ns
+            with os.scandir(self._path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(NOTEBOOK_SUFFIX):
+                        continue
+                    try:
+                        if entry.is_file():
+                            self._add(entry.name, entry.stat())
+                    except OSError:
+                        continue
+        except OSError:
+            dir_mtime_ns = None
+        self._dir_mtime_ns = dir_mtime_ns
+        # 更新時刻の粒度が粗いファイルシステムでは、直後の変更で時刻が変わらないことがある
+        self._stale = dir_mtime_ns is None or (self._watcher is None and
+                                                time.time_ns() - dir_mtime_ns < RACY_WINDOW_NS)
+
+    def _add(self, name, stat_result):
+        self._entries.setdefault(unicodedata.normalize("NFC", name), {})[name] = stat_result
+
+    def _remove(self, name):
+        key = unicodedata.normalize("NFC", name)
+        names = self._entries.get(key)
+        if names is not None:
+            names.pop(name, None)
+            if not names:
+                del self._entries[key]
+
+    def _update(self, name):
+        """通知のあった1ファイルだけ stat し直す"""
+        self._remove(name)
+        try:
+            stat_result = os.stat(os.path.join(self._path, name))
+        except OSError:
+            return
+        if stat.S_ISREG(stat_result.st_mode):
+            self._add(name, stat_result)
+
+    def _restat(self, hits):
+        """見つかったノートブックだけ stat し直す（poll ではファイルの中身の変更を検知できないため）"""
+        fresh = []
+        for name, _ in hits:
+            self.stats["restats"] += 1
+            self._remove(name)
+            try:
+                stat_result = os.stat(os.path.join(self._path, name))
+            except OSError:
+                continue
+            self._add(name, stat_result)
+            fresh.append((name, stat_result))
+        return fresh
+
+
+def _matches(name, pattern):
+    """glob と同じ照合（. で始まるファイルは、パターンも . で始まる場合だけ一致）"""
+    if name.startswith(".") and not pattern.startswith("."):
+        return False
+    return fnmatch.fnmatch(name, pattern)
+
+
+# ディレクトリ（実パス）ごとの共有NotebookDirectoryIndex
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_notebook_index(directory=os.curdir):
+    """
+    ディレクトリのNotebookDirectoryIndexを取得（無ければ作成、カーネル内で共有）
+
+    監視するディレクトリが MAX_WATCHED_DIRECTORIES を超えたら、最も古いものの監視をやめる。
+    """
+    key = os.path.realpath(directory)
+    with _indexes_lock:
+        index = _indexes.pop(key, None)
+        if index is None:
+            index = NotebookDirectoryIndex(directory)
+        elif index.directory != directory:
+            # 同じディレクトリを別の書き方（相対パス等）で指定した場合は、返すパスの形だけ合わせる
+            index.directory = directory
+        _indexes[key] = index
+        while len(_indexes) > MAX_WATCHED_DIRECTORIES:
+            _indexes.pop(next(iter(_indexes))).close()
+        return index
@@ -2,12 +2,90 @@
 ノートブック読み込みモジュール - セル内容の取得とフィルタリング
 """
 
-import json
+import itertools
 import os
-import glob
+import re
 from typing import List
-from datetime import datetime
 from .environment_detector import EnvironmentDetector
+from .debug_artifacts import get_artifact_writer, KIND_REQUEST
+from .payload_minimizer import get_shared_minimizer, format_minimize_report
+from .notebook_cache import get_notebook_cache, KIND_STREAM
+from .notebook_stream import NotebookChangedError
+from .notebook_index import get_notebook_index
+from .colab_snapshot import get_colab_snapshot
+from .cell_model import CellList, source_text
+
+# 送信ボタンセルから問題番号を取り出すパターン（problem_number = 2 のような空白・位置引数も許す）
+SUBMIT_BUTTON_PATTERN = re.compile(r"create_submit_button\(\s*(?:problem_number\s*=\s*)?(\d+)\s*\)")
+
+# 共通プログラム実行セルの目印（送信ボタンが見つからない場合はこのセルより前を送る）
+COMMON_PROGRAM_MARKER = "送信処理用共通プログラム実行"
+
+# 送信ボタンと共通プログラムの目印を1回の走査で同時に探すパターン
+PROBLEM_INDEX_PATTERN = re.compile(
+    SUBMIT_BUTTON_PATTERN.pattern + "|(?P<common>" + re.escape(COMMON_PROGRAM_MARKER) + ")"
+)
+
+
+class ProblemIndex:
+    """
+    ノートブック内の送信ボタンの位置をまとめた索引
+    
+    全セルを1回だけ走査して、問題番号ごとの送信ボタンセルの位置・問題の範囲の先頭と、
+    共通プログラム実行セルの位置を記録する。作った索引は解析済みノートブックと一緒に
+    キャッシュするので、どの送信ボタンも辞書を引くだけで送信範囲が決まる。
+    逐次読み込み（StreamingNotebook）では、読んだセルを1つずつ add_cell() で追加する。
+    """
+    
+    def __init__(self, cells=()):
+        self.cell_count = 0
+        self.buttons = {}           # 問題番号 -> 送信ボタンセルの位置（ノートブック内の順）
+        self.region_starts = {}     # 問題番号 -> 問題の範囲の先頭（前の送信ボタン・共通プログラムの次のセル）
+        self.common_program_index = None
+        self._region_start = 0
+        for i, cell in enumerate(cells):
+            self.add_cell(i, cell)
+    
+    def add_cell(self, i, cell):
+        """
+        i 番目のセルを索引に追加（セルの順に呼ぶ）
+        
+        Returns:
+            list: このセルで見つかった送信ボタンの問題番号
+        """
+        self.cell_count = i + 1
+        if cell.get('cell_type') != 'code' or 'source' not in cell:
+            return []
+        source = source_text(cell)
+        found = []
+        for match in PROBLEM_INDEX_PATTERN.finditer(source):
+            if match.group('common'):
+                if self.common_program_index is None:
+                    self.common_program_index = i
+                    if not self.buttons:
+                        self._region_start = i + 1
+                continue
+            problem_number = int(match.group(1))
+            if problem_number not in self.buttons:
+                self.buttons[problem_number] = i
+                self.region_starts[problem_number] = self._region_start
+                self._region_start = i + 1
+                found.append(problem_number)
+        return found
+    
+    def submit_range_end(self, problem_number):
+        """
+        送信対象の範囲の終わり（このセルの手前まで送る）
+        
+        Returns:
+            tuple: (end: int, source: str) source は "button"（送信ボタン）、
+                   "common"（共通プログラム実行セル）、"all"（全セル）のいずれか
+        """
+        if problem_number in self.buttons:
+            return self.buttons[problem_number], "button"
+        if self.common_program_index is not None:
+            return self.common_program_index, "common"
+        return self.cell_count, "all"
 
 class NotebookReader:
     """ノートブックの読み込みとセル管理を行うクラス"""
@@ -15,55 +93,76 @@ class NotebookReader:
     def __init__(self):
         self.env_detector = EnvironmentDetector()
         self.notebook_path = None
+        # 送信前に出力・メタデータを取り除く（ルールはカーネル内で共有）
+        self.minimize_enabled = True
+        self.minimizer = get_shared_minimizer()
+        self.last_minimize_report = None
+        # 解析済みノートブック（カーネル内の全ての送信ボタンで共有）
+        self.notebook_cache = get_notebook_cache()
+        # Colab のセルの控え（セルの実行を記録するため、ここでフックを登録しておく）
+        self.colab_snapshot = get_colab_snapshot()
+        if self.env_detector.is_colab():
+            self.colab_snapshot.install()
     
     def filter_submission_cells(self, cells):
-        """送信対象外セルを除外するフィルター（#@titleで始まるセルを除外）"""
-        filtered_cells = []
+        """
+        送信対象外セルを除外するフィルター（#@titleで始まるセルを除外）
         
-        for cell in cells:
-            # セルタイプがcodeの場合のみチェック
-            if cell.get('cell_type') == 'code' and 'source' in cell:
-                source = cell['source']
-                if isinstance(source, list):
-                    source = ''.join(source)
-                
-                # #@titleで始まるセルは除外
-                if source.strip().startswith('#@title'):
-                    # print(f"🚫 除外セル（#@title）: {source[:50]}...")
-                    continue
-            
-            # 除外対象でない場合は追加
-            filtered_cells.append(cell)
+        Returns:
+            CellList: 残ったセルのビュー（セルはコピーしない）
+        """
+        # セルタイプがcodeの場合のみチェックし、#@titleで始まるセルは除外
+        return CellList(cells).filter(
+            lambda cell: not (cell.cell_type == 'code' and cell.source.strip().startswith('#@title'))
+        )
+    
+    def set_minimize(self, enabled=True):
+        """送信前の軽量化（出力・メタデータの削除）を有効/無効にする"""
+        self.minimize_enabled = enabled
+    
+    def minimize_submission_cells(self, cells, assignment_id=None):
+        """
+        送信対象セルから採点に不要な出力・メタデータを取り除く
+        
+        Args:
+            assignment_id (str): 課題ID（課題ごとのルールを選ぶ）
         
-        return filtered_cells
+        Returns:
+            list: 軽量化したセル（元のセルは変更しない）
+        """
+        if not self.minimize_enabled:
+            return cells
+        minimized, report = self.minimizer.minimize_cells(cells, assignment_id)
+        self.last_minimize_report = report
+        return minimized
     
     def set_notebook_path(self, notebook_path):
         """ノートブックパスを設定"""
         self.notebook_path = notebook_path
         # print(f"📋 ノートブックパス設定: {notebook_path}")
     
-    def get_notebook_cells_colab(self):
-        """Google Colabからノートブック情報を取得"""
-        try:
-            from google.colab import _message
-            notebook_data = _message.blocking_request('get_ipynb', request='', timeout_sec=10)
-            
-            # レスポンス構造: {'ipynb': {'cells': [...]}}
-            if (isinstance(notebook_data, dict) and 
-                'ipynb' in notebook_data and 
-                isinstance(notebook_data['ipynb'], dict) and
-                'cells' in notebook_data['ipynb']):
-                
-                all_cells = notebook_data['ipynb']['cells']
-                print(f"✅ Google Colab: {len(all_cells)}セル取得")
-                return all_cells
-            else:
-                print("❌ Google Colab: Notebook構造が取得できませんでした")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Google Colab API エラー: {str(e)}")
-            return []
+    def invalidate_notebook_cache(self, path=None):
+        """解析済みノートブックのキャッシュを捨てる（path を省略すると全て、ノートブックの一覧も読み直す）"""
+        if path is None:
+            get_notebook_index().invalidate()
+            self.colab_snapshot.invalidate()
+        return self.notebook_cache.invalidate(path)
+    
+    def get_notebook_cells_colab(self, need_outputs=True):
+        """
+        Google Colabからノートブック情報を取得
+        
+        前回取り寄せたセルの控え（実行したセルを反映済み）が使えればそれを返し、
+        使えない場合だけブラウザから取り寄せる（ColabNotebookSnapshot）。
+        
+        Args:
+            need_outputs (bool): 出力も必要か（送信前に出力を削除するならFalse）
+        """
+        return self.colab_snapshot.get_cells(need_outputs)
+
+    def _needs_outputs(self, assignment_id=None):
+        """送信するセルに出力が必要か（送信前に出力を削除する設定ならFalse）"""
+        return not (self.minimize_enabled and self.minimizer.get_rules(assignment_id)["drop_outputs"])
 
 
     def _find_ipynb(self, glob1_pattern: str) -> List[str]:
@@ -76,6 +175,8 @@ class NotebookReader:
         どうもMac環境化では、ファイル名をクリップボードに貼り付けると違う文字コードになっている様子（逆かもしれない）
         NFCなどの仕組みは調べてください（プとかドとか濁点付きのカタカナを2文字で記憶する、とかなんとか）
 
+        ディレクトリの一覧は NotebookDirectoryIndex が覚えていて、変更があった分だけ読み直す。
+
         Parameters
         ----------
         glob1_pattern : str
@@ -86,46 +187,41 @@ class NotebookReader:
         str
             見つかったファイルのオリジナルパス。見つからなければ ""。
         """
-        import fnmatch
-        import unicodedata
-
-        # ① 普通に glob 検索
-        hits = glob.glob(glob1_pattern)
-        if hits:
-            return hits
-
-        # ② フォールバック検索
-        candidates = glob.glob("*.ipynb")
+        return [path for path, _ in self._find_ipynb_with_stats(glob1_pattern)]
 
-        # パターンと候補をNFC正規化して比較
-        normalized_pattern = unicodedata.normalize("NFC", glob1_pattern)
-        # print(f"candidates={candidates}, normalized_pattern={normalized_pattern}")
-        hits = []
-        for orig in candidates:
-            norm_path = unicodedata.normalize("NFC", orig)
-            if fnmatch.fnmatch(norm_path, normalized_pattern):
-                hits.append(orig)
-
-        return hits
+    def _find_ipynb_with_stats(self, glob1_pattern):
+        """_find_ipynb と同じ検索で、(パス, os.stat_result) の一覧を返す"""
+        directory, pattern = os.path.split(glob1_pattern)
+        return get_notebook_index(directory or os.curdir).find(pattern)
 
+    def _find_notebook_file(self):
+        """
+        VS Code環境で読み込むノートブックファイルを探す
+        
+        Returns:
+            tuple: (notebook_file: str, stat_result: os.stat_result) 見つからなければ (None, None)
+        """
+        # set_notebook_path() で指定したパスからファイル名のみ抽出（フォルダパスは無視）
+        target_filename = os.path.basename(self.notebook_path)
+        base_filename = os.path.splitext(target_filename)[0]                 # 拡張子を除いた部分 を抽出
+        search_path = base_filename + "*.ipynb"
+        # search_path = "*.ipynb"
+        # print(f"❌ debug: search_path={search_path}")
+        # ipynb_files = glob.glob(search_path)                   # glob.globで検索（拡張子を除いた部分 + *.ipynb）※解答Notebook等を考慮している
+        # 更新日付が最新のものを取得（stat は一覧が覚えている値、結果はキャッシュの照合にも使う）
+        hits = self._find_ipynb_with_stats(search_path)
+        if not hits:
+            return None, None
+        return max(hits, key=lambda hit: hit[1].st_mtime_ns)
+    
     def get_notebook_cells_vscode(self):
         """VS Code環境からノートブックファイルを読み込み"""
         try:
-            notebook_file = None
+            notebook_file, stat_result = self._find_notebook_file()
             
-            # set_notebook_path() で指定したパスからファイル名のみ抽出（フォルダパスは無視）
-            target_filename = os.path.basename(self.notebook_path)
-            base_filename = os.path.splitext(target_filename)[0]                 # 拡張子を除いた部分 を抽出
-            search_path = base_filename + "*.ipynb"
-            ipynb_files = self._find_ipynb(search_path)
-            # search_path = "*.ipynb"
-            # print(f"❌ debug: search_path={search_path}")
-            # ipynb_files = glob.glob(search_path)                   # glob.globで検索（拡張子を除いた部分 + *.ipynb）※解答Notebook等を考慮している
-            notebook_file = max(ipynb_files, key=lambda f: os.path.getmtime(f))  # 更新日付が最新のものを取得
-            
-            if notebook_file and os.path.exists(notebook_file):
-                with open(notebook_file, 'r', encoding='utf-8') as f:
-                    notebook_json = json.load(f)
+            if notebook_file:
+                # 前回から変更が無ければ解析済みのノートブックを使う
+                notebook_json = self.notebook_cache.load(notebook_file, stat_result)
                 
                 if 'cells' in notebook_json:
                     all_cells = notebook_json['cells']
@@ -150,58 +246,145 @@ class NotebookReader:
         try:
             print(f"🔍 環境検出: Google Colab = {self.env_detector.is_colab()}")
             
-            # 環境に応じてセル取得
+            assignment_id = f"practice_problem_{problem_number}"
+            skipped_output_bytes = 0
+            
+            # 環境に応じてセル取得（VS Code では送信ボタンのセルまでだけを読む）
             if self.env_detector.is_colab():
-                all_cells = self.get_notebook_cells_colab()
+                all_cells = self.get_notebook_cells_colab(self._needs_outputs(assignment_id))
+                if not all_cells:
+                    print("🔄 フォールバック: 空のセルリストを返します")
+                    return []
+                # 指定された問題番号の送信ボタンを索引から引く
+                end, found_by = self.get_problem_index(all_cells).submit_range_end(problem_number)
+                cells_before_submit = CellList(itertools.islice(all_cells, end))
+                total_label = f"全{len(all_cells)}セル中"
             else:
-                all_cells = self.get_notebook_cells_vscode()
-            
-            if not all_cells:
-                print("🔄 フォールバック: 空のセルリストを返します")
-                return []
-            
-            # 指定された問題番号の送信ボタンを検索
-            submit_button_index = None
-            search_pattern = f"create_submit_button(problem_number={problem_number})"
-            
-            for i, cell in enumerate(all_cells):
-                if cell.get('cell_type') == 'code' and 'source' in cell:
-                    source = cell['source']
-                    if isinstance(source, list):
-                        source = ''.join(source)
-                    if search_pattern in source:
-                        submit_button_index = i
-                        break
+                read = self.read_vscode_cells_before_submit(problem_number, assignment_id)
+                if read is None:
+                    print("🔄 フォールバック: 空のセルリストを返します")
+                    return []
+                cells_before_submit, found_by, skipped_output_bytes, total_label = read
             
-            # 送信ボタンより前のセルを取得
-            if submit_button_index is not None:
-                cells_before_submit = all_cells[:submit_button_index]
-                print(f"✅ 問題{problem_number}送信ボタン前の{len(cells_before_submit)}セル（全{len(all_cells)}セル中）")
-            else:
+            if found_by == "button":
+                print(f"✅ 問題{problem_number}送信ボタン前の{len(cells_before_submit)}セル（{total_label}）")
+            elif found_by == "common":
                 # 共通プログラム実行セルより前を取得（フォールバック）
-                for i, cell in enumerate(all_cells):
-                    if cell.get('cell_type') == 'code' and 'source' in cell:
-                        source = cell['source']
-                        if isinstance(source, list):
-                            source = ''.join(source)
-                        if '送信処理用共通プログラム実行' in source:
-                            cells_before_submit = all_cells[:i]
-                            print(f"✅ フォールバック: 共通プログラム前の{len(cells_before_submit)}セル")
-                            break
-                else:
-                    print(f"⚠️ 送信ボタンが見つからないため全セルを返します: {len(all_cells)}セル")
-                    cells_before_submit = all_cells
+                print(f"✅ フォールバック: 共通プログラム前の{len(cells_before_submit)}セル")
+            else:
+                print(f"⚠️ 送信ボタンが見つからないため全セルを返します: {len(cells_before_submit)}セル")
             
             # #@titleで始まるセルを除外
             filtered_cells = self.filter_submission_cells(cells_before_submit)
             print(f"📋 送信対象セル: {len(filtered_cells)}セル（#@title除外後）")
             
+            filtered_cells = self.minimize_submission_cells(filtered_cells, assignment_id)
+            if self.minimize_enabled:
+                self.last_minimize_report["skipped_output_bytes"] = skipped_output_bytes
+                print(format_minimize_report(self.last_minimize_report))
             return filtered_cells
             
         except Exception as e:
             print(f"❌ セル内容取得エラー: {str(e)}")
             return []
     
+    def read_vscode_cells_before_submit(self, problem_number, assignment_id=None):
+        """
+        VS Code環境でノートブックを先頭から逐次読み込み、送信ボタンのセルまでで止める
+        
+        読み進めた所はキャッシュに残るので、同じノートブックの前の問題はファイルを読まずに、
+        後ろの問題は続きから読む。送信前に出力を削除する設定なら、出力は読み込まない。
+        
+        Returns:
+            tuple: (cells_before_submit: CellList, found_by: str, skipped_output_bytes: int, total_label: str)
+                   found_by は ProblemIndex.submit_range_end() と同じ。セルが無ければNone
+        """
+        for _ in range(2):
+            notebook_file, stat_result = self._find_notebook_file()
+            if not notebook_file:
+                print("❌ VS Code: Notebookファイルが見つかりません")
+                return None
+            stream = self.notebook_cache.load(notebook_file, stat_result, kind=KIND_STREAM)
+            index = self.notebook_cache.memo(stream, "problem_index", lambda _: ProblemIndex())
+            try:
+                if problem_number not in index.buttons:
+                    stream.read_until(lambda i, cell: problem_number in index.add_cell(i, cell))
+                break
+            except NotebookChangedError:
+                # 読み進めている間に保存された（ファイルを探し直して最初から読む）
+                self.notebook_cache.invalidate(notebook_file)
+        else:
+            raise NotebookChangedError(notebook_file)
+        
+        if not stream.cells:
+            return None
+        print(f"✅ VS Code: {len(stream.cells)}セル取得（{notebook_file}）")
+        total_label = f"全{len(stream.cells)}セル中" if stream.complete else "送信ボタンまで読み込み"
+        
+        end, found_by = index.submit_range_end(problem_number)
+        if not self._needs_outputs(assignment_id):
+            return CellList(itertools.islice(stream.cells, end)), found_by, stream.output_bytes(end), total_label
+        return CellList(stream.with_outputs(end)), found_by, 0, total_label
+    
+    def get_all_notebook_cells(self, need_outputs=True):
+        """環境に応じてノートブックの全セルを取得"""
+        if self.env_detector.is_colab():
+            return self.get_notebook_cells_colab(need_outputs)
+        return self.get_notebook_cells_vscode()
+    
+    def get_problem_index(self, cells):
+        """セル一覧の送信ボタンの索引（キャッシュ中のノートブックならノートブックと一緒に保持）"""
+        return self.notebook_cache.memo(cells, "problem_index", ProblemIndex)
+    
+    def find_problem_numbers(self, cells):
+        """
+        送信ボタンセルから問題番号を取得
+        
+        Returns:
+            list: (問題番号, セル位置) のリスト（ノートブック内の順）
+        """
+        return list(self.get_problem_index(cells).buttons.items())
+    
+    def get_cells_for_all_problems(self):
+        """
+        ノートブック内の全問題について、送信ボタンより前のセルを取得（#@titleセル除外）
+        
+        Returns:
+            dict: 問題番号 -> 送信対象セルのリスト（ノートブック内の順）
+        """
+        try:
+            # 出力が必要な課題が1つも無ければ、Colab ではセルの控えを使える
+            need_outputs = any(self._needs_outputs(assignment_id)
+                               for assignment_id in [None, *self.minimizer.assignment_rules])
+            all_cells = self.get_all_notebook_cells(need_outputs)
+            if not all_cells:
+                return {}
+            # 問題ごとの範囲は同じセルを参照するビューにする
+            cell_list = CellList(all_cells)
+            
+            problem_cells = {}
+            saved_bytes = 0
+            for problem_number, index in self.find_problem_numbers(all_cells):
+                problem_cells[problem_number] = self.minimize_submission_cells(
+                    self.filter_submission_cells(cell_list[:index]), f"practice_problem_{problem_number}"
+                )
+                if self.minimize_enabled:
+                    saved_bytes = max(saved_bytes, self.last_minimize_report["original_bytes"] -
+                                      self.last_minimize_report["minimized_bytes"])
+            
+            if problem_cells:
+                summary = ", ".join(f"問題{n}: {len(cells)}セル" for n, cells in problem_cells.items())
+                print(f"✅ 送信ボタンを{len(problem_cells)}個検出（{summary}）")
+                if saved_bytes:
+                    print(f"🧹 送信データ軽量化: 出力・メタデータを削除して {saved_bytes:,} bytes 削減")
+            else:
+                print("⚠️ 送信ボタンが見つかりませんでした")
+            return problem_cells
+            
+        except Exception as e:
+            print(f"❌ セル内容取得エラー: {str(e)}")
+            return {}
+    
     def save_request_packet(self, student_email, assignment_id):
         """現在のNotebookをリクエスト形式でファイル保存（デバッグ用）"""
         try:
@@ -221,15 +404,12 @@ class NotebookReader:
                 'notebook_path': '02_プログラミング言語Python/01_プログラミング言語Python.ipynb'
             }
             
-            # ファイル保存
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"request_packet_{timestamp}.json"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(request_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"✅ リクエストパケット保存完了: {filename}")
-            print(f"📦 ファイルサイズ: {len(json.dumps(request_data)):,} bytes")
+            # ファイル保存（バックグラウンドで .grading_debug/ に保存）
+            filename = get_artifact_writer().write(KIND_REQUEST, request_data)
+            if filename:
+                print(f"✅ リクエストパケット保存: {filename}")
+            else:
+                print("⚠️ デバッグ用ファイルの保存レベルが all ではないため保存しませんでした")
             
         except Exception as e:
             print(f"❌ 保存エラー: {e}")
\ No newline at end of file
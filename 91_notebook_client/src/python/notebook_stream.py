@@ -0,0 +1,253 @@
+"""
+ノートブック逐次読み込みモジュール - 送信ボタンのセルまでだけを読む
+
+ノートブック全体を json.load すると、送信ボタンより後ろのセルや、画像などの大きな出力まで
+全て解析することになる。このモジュールはファイルをメモリマップし、cells 配列を
+先頭から1セルずつ取り出す。
+
+- セルの区切りは文字列・括弧だけを追って探し（長い文字列は find でまとめて読み飛ばす）、
+  1セル分のバイト列だけを json.loads する
+- outputs は解析せずにファイル内の位置（バイト範囲）だけを覚え、必要になったら読み込む
+- 読み進めた位置を覚えておき、後ろの送信ボタンが必要になったらそこから続きを読む
+
+ファイルを開いたままにはしない（VS Code がノートブックを保存できなくなるため）。
+続きを読むときは更新時刻・サイズを確認し、変わっていれば NotebookChangedError を送出する。
+"""
+
+import json
+import mmap
+import os
+import re
+import threading
+
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+_STRUCTURE = re.compile(rb'["\[\]{}]')
+
+
+class NotebookChangedError(Exception):
+    """読み込みの途中でノートブックファイルが変更された"""
+
+
+class NotebookFormatError(ValueError):
+    """ノートブックのJSONとして読めない"""
+
+
+def _skip_whitespace(buf, pos):
+    return _WHITESPACE.match(buf, pos).end()
+
+
+def _expect(buf, pos, char):
+    pos = _skip_whitespace(buf, pos)
+    if buf[pos:pos + 1] != char:
+        raise NotebookFormatError(f"{pos}バイト目に {char.decode()} がありません")
+    return pos + 1
+
+
+def _skip_string(buf, pos):
+    """pos の " から始まる文字列を読み飛ばす（画像のbase64など長い文字列は find でまとめて飛ばす）"""
+    end = pos + 1
+    while True:
+        end = buf.find(b'"', end)
+        if end < 0:
+            raise NotebookFormatError(f"{pos}バイト目の文字列が閉じていません")
+        # 直前の \ の数が奇数なら、エスケープされた " なので続きを探す
+        backslash = end - 1
+        while buf[backslash] == 0x5C:
+            backslash -= 1
+        if (end - 1 - backslash) % 2 == 0:
+            return end + 1
+        end += 1
+
+
+def _skip_value(buf, pos):
+    """pos から始まるJSONの値を読み飛ばし、値の終わりの位置を返す"""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        return _skip_string(buf, pos)
+    if first not in (b"{", b"["):
+        # 数値・true/false/null
+        end = pos
+        while end < len(buf) and buf[end:end + 1] not in b",]} \t\r\n":
+            end += 1
+        return end
+
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(buf, pos)
+        if match is None:
+            raise NotebookFormatError("括弧が閉じていません")
+        pos = match.start()
+        char = buf[pos:pos + 1]
+        if char == b'"':
+            pos = _skip_string(buf, pos)
+            continue
+        depth += 1 if char in b"{[" else -1
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+def _read_key(buf, pos):
+    """オブジェクトのキーを読み、(キー, 値の先頭位置) を返す"""
+    pos = _skip_whitespace(buf, pos)
+    end = _skip_string(buf, pos)
+    key = json.loads(buf[pos:end])
+    pos = _expect(buf, end, b":")
+    return key, _skip_whitespace(buf, pos)
+
+
+def _find_cells_array(buf):
+    """トップレベルの "cells" 配列の中身の先頭位置を返す"""
+    pos = _expect(buf, 0 if buf[:3] != b"\xef\xbb\xbf" else 3, b"{")
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        if buf[pos:pos + 1] == b"}":
+            raise NotebookFormatError("cells がありません")
+        key, pos = _read_key(buf, pos)
+        if key == "cells":
+            return _expect(buf, pos, b"[")
+        pos = _skip_whitespace(buf, _skip_value(buf, pos))
+        if buf[pos:pos + 1] == b",":
+            pos += 1
+
+
+def _scan_cell(buf, pos):
+    """
+    1セル分のオブジェクトの範囲と、その中の outputs の値の範囲を調べる
+
+    Returns:
+        tuple: (start, end, outputs_range) outputs_range は (start, end) または None
+    """
+    start = pos
+    pos = _expect(buf, pos, b"{")
+    outputs_range = None
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        if buf[pos:pos + 1] == b"}":
+            return start, pos + 1, outputs_range
+        key, value_start = _read_key(buf, pos)
+        value_end = _skip_value(buf, value_start)
+        if key == "outputs":
+            outputs_range = (value_start, value_end)
+        pos = _skip_whitespace(buf, value_end)
+        if buf[pos:pos + 1] == b",":
+            pos += 1
+
+
+class StreamingNotebook:
+    """
+    ノートブックのセルを必要な所まで読み進めるクラス
+
+    読み込んだセルの outputs は空のリストにしておき、元の範囲を output_ranges に覚える
+    （with_outputs() で読み込む）。cells は読み込み済みのセル（呼び出し側で変更しないこと）。
+    """
+
+    def __init__(self, path, stat_result=None):
+        self.path = path
+        stat_result = stat_result or os.stat(path)
+        self.signature = (stat_result.st_mtime_ns, stat_result.st_size)
+        self.cells = []
+        self.output_ranges = {}     # セルの位置 -> outputs のバイト範囲
+        self.complete = False       # 最後のセルまで読んだか
+        self.parsed_bytes = 0       # json.loads したバイト数（outputs を除く）
+        self._offset = None         # 次に読むセルの位置（None なら cells 配列をまだ探していない）
+        self._lock = threading.Lock()
+
+    def read_until(self, stop=None):
+        """
+        セルを読み進める
+
+        Args:
+            stop (callable): stop(index, cell) 新しく読んだセルごとに呼ばれ、Trueを返したらそこで止める
+                             （Noneなら最後まで読む）
+
+        Returns:
+            bool: stop がTrueを返して止まったならTrue、最後のセルまで読んだならFalse
+        """
+        with self._lock:
+            if self.complete:
+                return False
+            with self._open() as buf:
+                pos = self._offset if self._offset is not None else _find_cells_array(buf)
+                while True:
+                    pos = _skip_whitespace(buf, pos)
+                    if buf[pos:pos + 1] == b"]":
+                        self.complete = True
+                        self._offset = pos
+                        return False
+                    start, end, outputs_range = _scan_cell(buf, pos)
+                    cell = self._parse_cell(buf, start, end, outputs_range)
+                    index = len(self.cells)
+                    self.cells.append(cell)
+                    if outputs_range is not None:
+                        self.output_ranges[index] = outputs_range
+
+                    pos = _skip_whitespace(buf, end)
+                    if buf[pos:pos + 1] == b",":
+                        pos += 1
+                    self._offset = pos
+                    if stop is not None and stop(index, cell):
+                        return True
+
+    def _parse_cell(self, buf, start, end, outputs_range):
+        if outputs_range is None:
+            data = buf[start:end]
+        else:
+            data = buf[start:outputs_range[0]] + b"[]" + buf[outputs_range[1]:end]
+        self.parsed_bytes += len(data)
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise NotebookFormatError(f"{start}バイト目のセルを解析できません: {e}") from e
+
+    def output_bytes(self, end):
+        """先頭から end 番目の手前までのセルの outputs のバイト数（読み込まずに省略した分）"""
+        return sum(stop - start for index, (start, stop) in self.output_ranges.items() if index < end)
+
+    def with_outputs(self, end):
+        """
+        先頭から end 番目の手前までのセルを、outputs を読み込んだコピーで返す
+
+        Returns:
+            list: セル（outputs の無いセルはキャッシュ中のセルそのもの）
+        """
+        with self._lock, self._open() as buf:
+            cells = []
+            for index, cell in enumerate(self.cells[:end]):
+                if index in self.output_ranges:
+                    start, stop = self.output_ranges[index]
+                    cell = dict(cell, outputs=json.loads(buf[start:stop]))
+                cells.append(cell)
+            return cells
+
+    def _open(self):
+        return _MappedFile(self.path, self.signature)
+
+
+class _MappedFile:
+    """ファイルを読み取り専用でメモリマップする（更新時刻・サイズが変わっていれば NotebookChangedError）"""
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        try:
+            stat_result = os.fstat(self._file.fileno())
+            if (stat_result.st_mtime_ns, stat_result.st_size) != self.signature:
+                raise NotebookChangedError(self.path)
+            if stat_result.st_size == 0:
+                raise NotebookFormatError("空のファイルです")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        return self._map
+
+    def __exit__(self, exc_type, exc, tb):
+        self._map.close()
+        self._file.close()
+        return False
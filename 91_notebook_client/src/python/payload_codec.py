@@ -0,0 +1,130 @@
+"""
+送信データ圧縮モジュール - リクエストボディのgzip/zstd圧縮と展開
+"""
+
+import gzip
+import zlib
+
+from .cell_model import write_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# この大きさ未満のボディは圧縮しない（圧縮しても効果が薄いため）
+COMPRESSION_THRESHOLD = 8 * 1024
+
+# 優先順位の高い順
+SUPPORTED_ENCODINGS = ("zstd", "gzip")
+
+
+def available_encodings():
+    """この環境で使える圧縮形式を優先順に返す"""
+    if zstandard is not None:
+        return ["zstd", "gzip"]
+    return ["gzip"]
+
+
+def serialize_json(data):
+    """送信用にJSONをコンパクトなUTF-8バイト列へ変換"""
+    return b"".join(serialize_json_chunks(data))
+
+
+def serialize_json_chunks(data):
+    """
+    送信用のJSONを細切れのバイト列のリストで返す
+
+    セルのJSONは Cell が覚えているバイト列そのものなので、全体を連結するまで
+    送信データの大きさの新しいバイト列は作られない。
+    """
+    chunks = []
+    write_json(data, chunks.append)
+    return chunks
+
+
+def compress_body(body, encoding):
+    """指定形式でバイト列を圧縮"""
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard がインストールされていません")
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    raise ValueError(f"未対応の圧縮形式です: {encoding}")
+
+
+def compress_chunks(chunks, encoding):
+    """細切れのバイト列を連結せずに、そのまま指定形式で圧縮"""
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard がインストールされていません")
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        raise ValueError(f"未対応の圧縮形式です: {encoding}")
+    compressed = [compressor.compress(chunk) for chunk in chunks]
+    compressed.append(compressor.flush())
+    return b"".join(compressed)
+
+
+def decode_body(body, content_encoding):
+    """
+    Content-Encoding に従ってリクエストボディを展開（ローカル採点サーバー用）
+
+    Args:
+        body (bytes): 受信したボディ
+        content_encoding (str): Content-Encoding ヘッダーの値（Noneなら無圧縮）
+
+    Returns:
+        bytes: 展開後のボディ
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard がインストールされていません")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    raise ValueError(f"未対応の圧縮形式です: {encoding}")
+
+
+def encode_json_body(data, encodings=None, threshold=COMPRESSION_THRESHOLD):
+    """
+    送信データをJSONにして、必要なら圧縮する
+
+    Args:
+        data (dict): 送信データ
+        encodings (list): 使ってよい圧縮形式（優先順、Noneなら利用可能な全て）
+        threshold (int): 圧縮を行う最小バイト数
+
+    Returns:
+        tuple: (body: bytes, headers: dict, stats: dict)
+            stats は raw_bytes（圧縮前）, sent_bytes（送信）, encoding を含む
+    """
+    # JSONは細切れのまま圧縮し、無圧縮で送る場合だけ連結する
+    chunks = serialize_json_chunks(data)
+    raw_bytes = sum(len(chunk) for chunk in chunks)
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    stats = {"raw_bytes": raw_bytes, "sent_bytes": raw_bytes, "encoding": "identity"}
+
+    if encodings is None:
+        encodings = available_encodings()
+    if raw_bytes < threshold:
+        return b"".join(chunks), headers, stats
+
+    for encoding in encodings:
+        if encoding not in available_encodings():
+            continue
+        compressed = compress_chunks(chunks, encoding)
+        if len(compressed) >= raw_bytes:
+            break  # 圧縮しても小さくならないなら無圧縮で送る
+        headers["Content-Encoding"] = encoding
+        stats["sent_bytes"] = len(compressed)
+        stats["encoding"] = encoding
+        return compressed, headers, stats
+
+    return b"".join(chunks), headers, stats
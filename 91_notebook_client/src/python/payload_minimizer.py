@@ -0,0 +1,173 @@
+"""
+送信データ軽量化モジュール - 採点に不要なセルの出力・メタデータを送信前に取り除く
+
+採点システムはコードを実行し直して採点するため、セルの出力（base64の画像を含む）・
+実行回数・添付ファイル・Colab/VS Code のメタデータは採点結果に影響しない。
+これらを送信前に取り除き、送信サイズを減らす。
+
+課題ごとにルールを変えられる（例: 出力を見て採点する課題だけ出力を残す）:
+    minimizer = get_shared_minimizer()
+    minimizer.set_rules("practice_problem_3", drop_outputs=False, max_stream_chars=1000)
+"""
+
+import copy
+import threading
+
+from .cell_model import Cell, CellList, encode_cell, iter_cells
+
+# 既定のルール
+DEFAULT_RULES = {
+    "drop_outputs": True,           # コードセルの出力を全て削除
+    "max_stream_chars": 2000,       # 出力を残す場合、stdout/stderr をこの文字数で切り詰める（Noneなら切り詰めない）
+    "drop_rich_outputs": True,      # 出力を残す場合も、画像・HTML等の表示データは削除
+    "drop_execution_count": True,   # 実行回数を消す
+    "clear_metadata": True,         # セルのメタデータを消す
+    "keep_metadata_keys": (),       # clear_metadata でも残すメタデータのキー
+    "strip_attachments": True,      # Markdownセルの添付ファイル（貼り付け画像）を削除
+}
+
+TRUNCATED_MARK = "\n...（送信時に省略しました）\n"
+
+
+def _cell_bytes(cell):
+    return len(encode_cell(cell))
+
+
+def _truncate_text(text, max_chars):
+    """stream出力のテキスト（文字列または行のリスト）を max_chars 文字に切り詰める"""
+    if isinstance(text, list):
+        text = "".join(text)
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATED_MARK
+
+
+class PayloadMinimizer:
+    """送信前にセルから採点に不要なデータを取り除くクラス（課題ごとのルールを持つ）"""
+
+    def __init__(self, **rules):
+        self.default_rules = dict(DEFAULT_RULES, **rules)
+        self.assignment_rules = {}
+        self._lock = threading.Lock()
+
+    def set_rules(self, assignment_id=None, **rules):
+        """
+        ルールを設定
+
+        Args:
+            assignment_id (str): 課題ID（practice_problem_N、Noneなら全課題の既定ルール）
+            **rules: DEFAULT_RULES のキーと値
+        """
+        unknown = set(rules) - set(DEFAULT_RULES)
+        if unknown:
+            raise ValueError(f"不明なルールです: {', '.join(sorted(unknown))}")
+        with self._lock:
+            if assignment_id is None:
+                self.default_rules.update(rules)
+            else:
+                self.assignment_rules.setdefault(assignment_id, {}).update(rules)
+
+    def get_rules(self, assignment_id=None):
+        """課題に適用するルール（既定ルールに課題ごとの設定を重ねたもの）"""
+        with self._lock:
+            return dict(self.default_rules, **self.assignment_rules.get(assignment_id, {}))
+
+    def minimize_cell(self, cell, rules):
+        """1セルを軽量化したコピーを返す（元のセルは変更しない）"""
+        minimized = {key: value for key, value in cell.items() if key not in ("outputs", "metadata")}
+
+        if "metadata" in cell:
+            if rules["clear_metadata"]:
+                keep = rules["keep_metadata_keys"]
+                minimized["metadata"] = {k: copy.deepcopy(v) for k, v in cell["metadata"].items() if k in keep}
+            else:
+                minimized["metadata"] = copy.deepcopy(cell["metadata"])
+
+        if rules["strip_attachments"]:
+            minimized.pop("attachments", None)
+
+        if cell.get("cell_type") == "code":
+            if rules["drop_execution_count"] and "execution_count" in minimized:
+                minimized["execution_count"] = None
+            if "outputs" in cell:
+                minimized["outputs"] = [] if rules["drop_outputs"] else self._minimize_outputs(cell["outputs"], rules)
+        elif "outputs" in cell:
+            minimized["outputs"] = copy.deepcopy(cell["outputs"])
+        return minimized
+
+    def _minimize_outputs(self, outputs, rules):
+        minimized = []
+        for output in outputs:
+            output_type = output.get("output_type")
+            if output_type == "stream":
+                minimized.append(dict(output, text=_truncate_text(output.get("text", ""),
+                                                                  rules["max_stream_chars"])))
+            elif output_type in ("display_data", "execute_result") and rules["drop_rich_outputs"]:
+                data = output.get("data", {})
+                if "text/plain" in data:
+                    minimized.append({
+                        "output_type": output_type,
+                        "data": {"text/plain": data["text/plain"]},
+                        "metadata": {},
+                        **({"execution_count": None} if output_type == "execute_result" else {}),
+                    })
+            else:
+                minimized.append(copy.deepcopy(output))
+        return minimized
+
+    def minimize_cells(self, cells, assignment_id=None):
+        """
+        セル一覧を軽量化
+
+        Returns:
+            tuple: (cells: CellList, report: dict)
+                report は original_bytes, minimized_bytes と、
+                セルごとの削減量 cells: [{"index", "cell_type", "saved_bytes"}] を含む
+                （軽量化したセルのJSONはサイズを測るときに作り、送信データでもそのまま使う）
+        """
+        rules = self.get_rules(assignment_id)
+        minimized_cells = []
+        report = {"assignment_id": assignment_id, "original_bytes": 0, "minimized_bytes": 0, "cells": []}
+        for index, cell in enumerate(iter_cells(cells)):
+            # ソースは変えないので、連結済みのソースがあれば引き継ぐ
+            minimized = Cell(self.minimize_cell(cell.data, rules), cell._source)
+            # 元のセルのJSONは覚えておかない（出力を含むので大きい）
+            original_bytes = _cell_bytes(cell.data)
+            minimized_bytes = len(minimized.encoded)
+            report["original_bytes"] += original_bytes
+            report["minimized_bytes"] += minimized_bytes
+            if original_bytes > minimized_bytes:
+                report["cells"].append({
+                    "index": index,
+                    "cell_type": cell.cell_type,
+                    "saved_bytes": original_bytes - minimized_bytes,
+                })
+            minimized_cells.append(minimized)
+        return CellList(minimized_cells), report
+
+
+def format_minimize_report(report, top=5):
+    """軽量化の結果を表示用の文字列にする（削減量の大きいセルを top 件まで）"""
+    saved = report["original_bytes"] - report["minimized_bytes"]
+    # ノートブックの逐次読み込みで、削除する出力を読み込まずに省略した分（ファイル上のバイト数）
+    skipped = report.get("skipped_output_bytes", 0)
+    skipped_line = f"\n   出力 {skipped:,} bytes は読み込み時に省略しました" if skipped else ""
+    if saved <= 0:
+        return "🧹 送信データ軽量化: 削除できるデータはありませんでした" + skipped_line
+    ratio = saved / report["original_bytes"] * 100
+    lines = [
+        f"🧹 送信データ軽量化: {report['original_bytes']:,} → {report['minimized_bytes']:,} bytes"
+        f"（{saved:,} bytes, {ratio:.1f}% 削減, {len(report['cells'])}セル）"
+    ]
+    for entry in sorted(report["cells"], key=lambda e: e["saved_bytes"], reverse=True)[:top]:
+        lines.append(f"   セル{entry['index'] + 1}（{entry['cell_type']}）: -{entry['saved_bytes']:,} bytes")
+    return "\n".join(lines) + skipped_line
+
+
+# カーネル内で共有するPayloadMinimizer（client_setup.py からルールを設定する）
+_shared_minimizer = PayloadMinimizer()
+
+
+def get_shared_minimizer():
+    """カーネル内で共有するPayloadMinimizerを取得"""
+    return _shared_minimizer
@@ -0,0 +1,145 @@
+"""
+採点結果キャッシュモジュール - 同じ内容の再送信に保存済みの採点結果を返す
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .cell_model import Cell, iter_cells, source_text
+
+DEFAULT_CACHE_DIR = ".grading_cache"
+DEFAULT_MAX_ENTRIES = 100
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def normalize_cell(cell):
+    """
+    キャッシュキー用にセルを正規化
+
+    採点に影響するのはセルの種類とソースだけなので、出力・実行回数・メタデータは
+    含めない。ソースは文字列に連結し、改行コードを揃える。
+    """
+    if isinstance(cell, Cell):
+        return [cell.cell_type or "", cell.source.replace("\r\n", "\n")]
+    return [cell.get("cell_type", ""), source_text(cell).replace("\r\n", "\n")]
+
+
+class ResultCache:
+    """採点結果をファイルに保存し、同じ送信内容なら再利用するクラス"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(base_url, student_email, assignment_id, notebook_path, cells):
+        """
+        送信先と送信内容からキャッシュキー（SHA-256）を作る
+
+        キー順を揃えたJSON {"assignment_id", "base_url", "cells", "notebook_path", "student_email"} のハッシュ。
+        送信先を含めるので、別の採点システム（ローカル採点サーバーなど）の結果は使わない。
+        全体を1つの文字列にせず、セルごとにハッシュへ流し込む。
+        """
+        def dumps(value):
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        digest = hashlib.sha256(b'{"assignment_id":' + dumps(assignment_id) +
+                                b',"base_url":' + dumps(base_url) + b',"cells":[')
+        for i, cell in enumerate(iter_cells(cells)):
+            if i:
+                digest.update(b",")
+            digest.update(dumps(normalize_cell(cell)))
+        digest.update(b'],"notebook_path":' + dumps(notebook_path) +
+                      b',"student_email":' + dumps(student_email) + b"}")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        キャッシュから採点結果を取得
+
+        Returns:
+            dict: {"result": 採点結果, "cached_at": 保存時刻(UNIX秒)}（無い・期限切れならNone）
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("cached_at", 0) > self.ttl_seconds:
+            self.invalidate(key)
+            return None
+        return entry
+
+    def put(self, key, result):
+        """採点結果をキャッシュに保存（上限を超えたら古いものから削除）"""
+        entry = {"cached_at": time.time(), "result": result}
+        with self._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self._path(key) + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entry, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                print(f"⚠️ 採点結果キャッシュ保存エラー: {e}")
+                return False
+            self._evict()
+        return True
+
+    def invalidate(self, key=None):
+        """キャッシュを削除（key省略時は全て）"""
+        with self._lock:
+            if key is not None:
+                paths = [self._path(key)]
+            elif os.path.isdir(self.cache_dir):
+                paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+            else:
+                paths = []
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        """期限切れのもの、および件数・サイズの上限を超えた古いものを削除"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl_seconds:
+                self._remove(path)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort(reverse=True)  # 新しい順
+        total_bytes = 0
+        for index, (_, size, path) in enumerate(entries):
+            total_bytes += size
+            if index >= self.max_entries or total_bytes > self.max_bytes:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -6,6 +6,8 @@ import json
 from datetime import datetime
 from IPython.display import display, HTML
 import ipywidgets as widgets
+from .debug_artifacts import get_artifact_writer, KIND_RESULT
+from .ui_scheduler import get_ui_scheduler
 
 class ResultViewer:
     """採点結果の表示を管理するクラス"""
@@ -80,13 +82,14 @@ class ResultViewer:
         print("📝 採点結果レポート終了")
         print("="*80)
     
-    def display_grading_result_with_details(self, result_data, submitted_problem_number):
+    def display_grading_result_with_details(self, result_data, submitted_problem_number, cached_at=None):
         """
         詳細表示ボタン付きの採点結果表示
         
         Args:
             result_data (dict): 採点システムからのレスポンスデータ
             submitted_problem_number (int): 送信した問題番号（該当問題にマークを付ける）
+            cached_at (float): キャッシュから表示する場合、その結果を保存した時刻（UNIX秒）
         """
         if not result_data:
             print("❌ 採点結果データがありません")
@@ -112,8 +115,11 @@ class ResultViewer:
         
         # 基本情報の表示
         print("="*80)
-        print("🎯 採点結果サマリー")
+        print("🎯 採点結果サマリー" + ("（💾 キャッシュ）" if cached_at is not None else ""))
         print("="*80)
+        if cached_at is not None:
+            cached_time = datetime.fromtimestamp(cached_at).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"💾 保存済みの結果です（{cached_time} に採点、再送信は行っていません）")
         print(f"🕒 採点時刻: {timestamp}")
         print(f"📊 総合得点: {total_earned}/{total_possible} ({success_rate:.1f}%)")
         
@@ -167,74 +173,7 @@ class ResultViewer:
                         break
                 
                 if submitted_problem:
-                    student_score = submitted_problem.get("student_score", 0)
-                    answer_full_score = submitted_problem.get("answer_full_score", 0)
-                    sub_problems = submitted_problem.get("sub_problems", [])
-                    
-                    print(f"\n🚀 問題 {submitted_problem_number}")
-                    print(f"   得点: {student_score}/{answer_full_score}点")
-                    print(f"   判定: {'✅ 正解' if student_score >= answer_full_score else '❌ 不正解'}")
-                    
-                    # SubProblemの詳細情報を表示
-                    # 用語としては「SubProblem」と言われても学生さんわからないので、使わないでください。
-                    if sub_problems:
-                        print(f"\n🔍 詳細情報 ({len(sub_problems)}個):")
-                        print("-" * 70)
-                        
-                        for idx, sub_problem in enumerate(sub_problems, 1):
-                            # 類似度を取得（新仕様）
-                            similarity = sub_problem["markdown_similarity"]
-                            
-                            # 学生マークダウンから問題タイトルを抽出（#を除去）
-                            student_markdown = sub_problem.get("student_markdown_cell", "")
-                            if student_markdown:
-                                # マークダウンの#を除去し、最初の行をタイトルとして使用
-                                title_line = student_markdown.split('\n')[0]
-                                clean_title = title_line.replace('#', '').strip()
-                            else:
-                                clean_title = f"詳細 {idx}"
-                            
-                            print(f"\n  📋 詳細 {idx}: {clean_title}")
-                            
-                            # 学生側コードセル（提出コード）
-                            student_code_cells = sub_problem.get("student_code_cells", [])
-                            if student_code_cells:
-                                print(f"    💻 提出コード ({len(student_code_cells)}個):")
-                                for j, code in enumerate(student_code_cells, 1):
-                                    print(f"      {j}. {code}")
-                            else:
-                                print(f"    💻 提出コード: (未検出)")
-                            
-                            # 得点率（％表記）
-                            student_score_rate = sub_problem.get("student_score_rate", 0.0)
-                            print(f"    📊 得点率: {student_score_rate*100:.0f}%")
-                            
-                            # フィードバック
-                            feedbacks = sub_problem.get("feedbacks", [])
-                            if feedbacks:
-                                print(f"    💬 フィードバック:")
-                                for feedback_item in feedbacks:
-                                    fb_messages = feedback_item.get("messages", [])
-                                    for msg in fb_messages:
-                                        print(f"      {msg}")
-                            else:
-                                print(f"    💬 フィードバック: 正解です！")
-                            
-                            # 類似度が0.9未満の場合、マークダウン文字列を警告付きで表記
-                            if similarity < 0.9:
-                                answer_markdown = sub_problem.get("answer_markdown_cell", "")
-                                print(f"    ⚠️  マークダウン類似度が低いです（{similarity:.2f}）")
-                                print(f"         問題文を誤って修正・削除した可能性があります")
-                                print(f"         教員に相談してください")
-                                if answer_markdown:
-                                    print(f"         期待される問題文: {answer_markdown[:100]}...")
-                                if student_markdown:
-                                    print(f"         提出された問題文: {student_markdown[:100]}...")
-                        
-                        print("-" * 70)
-                    else:
-                        print(f"\n⚠️  サブ問題情報が利用できません")
-                
+                    self._print_problem_details(submitted_problem, submitted_problem_number)
                 else:
                     print(f"❌ 問題 {submitted_problem_number} の詳細情報が見つかりませんでした")
                 
@@ -262,6 +201,202 @@ class ResultViewer:
             margin='10px 0'
         )))
     
+    def _print_problem_details(self, problem, problem_number):
+        """1問分の得点と詳細情報（小問ごとのコード・フィードバック）を表示"""
+        student_score = problem.get("student_score", 0)
+        answer_full_score = problem.get("answer_full_score", 0)
+        sub_problems = problem.get("sub_problems", [])
+        
+        print(f"\n🚀 問題 {problem_number}")
+        print(f"   得点: {student_score}/{answer_full_score}点")
+        print(f"   判定: {'✅ 正解' if student_score >= answer_full_score else '❌ 不正解'}")
+        
+        # SubProblemの詳細情報を表示
+        # 用語としては「SubProblem」と言われても学生さんわからないので、使わないでください。
+        if sub_problems:
+            print(f"\n🔍 詳細情報 ({len(sub_problems)}個):")
+            print("-" * 70)
+            
+            for idx, sub_problem in enumerate(sub_problems, 1):
+                # 類似度を取得（新仕様）
+                similarity = sub_problem["markdown_similarity"]
+                
+                # 学生マークダウンから問題タイトルを抽出（#を除去）
+                student_markdown = sub_problem.get("student_markdown_cell", "")
+                if student_markdown:
+                    # マークダウンの#を除去し、最初の行をタイトルとして使用
+                    title_line = student_markdown.split('\n')[0]
+                    clean_title = title_line.replace('#', '').strip()
+                else:
+                    clean_title = f"詳細 {idx}"
+                
+                print(f"\n  📋 詳細 {idx}: {clean_title}")
+                
+                # 学生側コードセル（提出コード）
+                student_code_cells = sub_problem.get("student_code_cells", [])
+                if student_code_cells:
+                    print(f"    💻 提出コード ({len(student_code_cells)}個):")
+                    for j, code in enumerate(student_code_cells, 1):
+                        print(f"      {j}. {code}")
+                else:
+                    print(f"    💻 提出コード: (未検出)")
+                
+                # 得点率（％表記）
+                student_score_rate = sub_problem.get("student_score_rate", 0.0)
+                print(f"    📊 得点率: {student_score_rate*100:.0f}%")
+                
+                # フィードバック
+                feedbacks = sub_problem.get("feedbacks", [])
+                if feedbacks:
+                    print(f"    💬 フィードバック:")
+                    for feedback_item in feedbacks:
+                        fb_messages = feedback_item.get("messages", [])
+                        for msg in fb_messages:
+                            print(f"      {msg}")
+                else:
+                    print(f"    💬 フィードバック: 正解です！")
+                
+                # 類似度が0.9未満の場合、マークダウン文字列を警告付きで表記
+                if similarity < 0.9:
+                    answer_markdown = sub_problem.get("answer_markdown_cell", "")
+                    print(f"    ⚠️  マークダウン類似度が低いです（{similarity:.2f}）")
+                    print(f"         問題文を誤って修正・削除した可能性があります")
+                    print(f"         教員に相談してください")
+                    if answer_markdown:
+                        print(f"         期待される問題文: {answer_markdown[:100]}...")
+                    if student_markdown:
+                        print(f"         提出された問題文: {student_markdown[:100]}...")
+            
+            print("-" * 70)
+        else:
+            print(f"\n⚠️  サブ問題情報が利用できません")
+    
+    def split_batch_result(self, result_data, problem_numbers):
+        """
+        全問題まとめて採点した結果を、問題ごとの採点結果に分ける
+        
+        問題Nの結果には、1回ずつ送信した場合と同じく問題N以前の問題を含める。
+        
+        Args:
+            result_data (dict): 全問題の採点結果（notebook_results.problems に全問題を含む）
+            problem_numbers (list): 送信した問題番号
+        
+        Returns:
+            dict: 問題番号 -> 採点結果
+        """
+        notebook_result = result_data.get("notebook_results", {})
+        problems = notebook_result.get("problems", [])
+        split = {}
+        for problem_number in problem_numbers:
+            split[problem_number] = dict(
+                result_data,
+                assignment_id=f"practice_problem_{problem_number}",
+                notebook_results=dict(
+                    notebook_result,
+                    problems=[p for p in problems if p.get("problem_number", 0) <= problem_number]
+                )
+            )
+        return split
+    
+    def display_batch_result_with_details(self, result_data, problem_numbers, cached_at=None):
+        """
+        全問題まとめて採点した結果を表示（問題ごとの詳細ボタン付き）
+        
+        Args:
+            result_data (dict): 全問題の採点結果
+            problem_numbers (list): 送信した問題番号
+            cached_at (float): キャッシュから表示する場合、その結果を保存した時刻（UNIX秒）
+        """
+        notebook_result = (result_data or {}).get("notebook_results")
+        if not notebook_result:
+            print("❌ 採点結果データが無効です")
+            return
+        
+        problems = {p.get("problem_number"): p for p in notebook_result.get("problems", [])}
+        overall_feedback = notebook_result.get("overall_feedback", "")
+        submitted = [problems[n] for n in problem_numbers if n in problems]
+        total_earned = sum(p.get("student_score", 0) for p in submitted)
+        total_possible = sum(p.get("answer_full_score", 0) for p in submitted)
+        success_rate = (total_earned / total_possible * 100) if total_possible > 0 else 0
+        
+        print("="*80)
+        print("🎯 採点結果サマリー（全問題まとめて送信）" + ("（💾 キャッシュ）" if cached_at is not None else ""))
+        print("="*80)
+        if cached_at is not None:
+            cached_time = datetime.fromtimestamp(cached_at).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"💾 保存済みの結果です（{cached_time} に採点、再送信は行っていません）")
+        print(f"🕒 採点時刻: {result_data.get('timestamp', '不明')}")
+        print(f"📊 総合得点: {total_earned}/{total_possible} ({success_rate:.1f}%)")
+        print(f"\n📋 問題別結果 ({len(problem_numbers)}問):")
+        print("-" * 60)
+        for problem_number in problem_numbers:
+            problem = problems.get(problem_number)
+            if problem is None:
+                print(f"  問題 {problem_number:02d}: 採点結果がありません ❓")
+                continue
+            student_score = problem.get("student_score", 0)
+            answer_full_score = problem.get("answer_full_score", 0)
+            status = "✅" if student_score >= answer_full_score else "❌"
+            rate = (student_score / answer_full_score * 100) if answer_full_score > 0 else 0
+            print(f"  問題 {problem_number:02d}: {student_score:3d}/{answer_full_score:3d}点 ({rate:5.1f}%) {status} 🚀")
+        print("-" * 60)
+        print("="*80)
+        
+        # 問題ごとの詳細表示ボタン
+        details_output = widgets.Output()
+        
+        def make_handler(problem_number):
+            def show_details(b):
+                with details_output:
+                    details_output.clear_output()
+                    print(f"📋 問題 {problem_number} 詳細情報")
+                    print("="*80)
+                    if problem_number in problems:
+                        self._print_problem_details(problems[problem_number], problem_number)
+                    else:
+                        print(f"❌ 問題 {problem_number} の詳細情報が見つかりませんでした")
+                    if overall_feedback and overall_feedback.strip():
+                        print(f"\n📝 総合フィードバック:")
+                        print("="*60)
+                        for line in overall_feedback.strip().split('\n'):
+                            print(f"  {line}")
+                        print("="*60)
+                    print("\n📄 詳細情報表示完了")
+            return show_details
+        
+        buttons = []
+        for problem_number in problem_numbers:
+            button = widgets.Button(
+                description=f'📋 問題{problem_number} 詳細',
+                button_style='info',
+                tooltip=f'問題{problem_number}の詳細情報とフィードバックを表示',
+                layout=widgets.Layout(width='130px', margin='10px 5px 10px 0')
+            )
+            button.on_click(make_handler(problem_number))
+            buttons.append(button)
+        
+        display(widgets.VBox([
+            widgets.HBox(buttons),
+            details_output
+        ], layout=widgets.Layout(
+            border='1px solid #ddd',
+            border_radius='8px',
+            padding='10px',
+            margin='10px 0'
+        )))
+    
+    def create_streaming_view(self, submitted_problem_number):
+        """
+        届いた問題から順に採点結果を表示するビューを作成して表示
+        
+        Args:
+            submitted_problem_number (int): 送信した問題番号
+        
+        Returns:
+            StreamingResultView: ストリーミング受信したイベントを渡して更新するビュー
+        """
+        return StreamingResultView(self, submitted_problem_number)
+    
     def display_grading_result_html(self, result_data):
         """
         採点結果をHTML形式で表示（Jupyter Notebook用）
@@ -415,11 +550,14 @@ class ResultViewer:
             filename (str): 保存ファイル名（Noneの場合は自動生成）
         
         Returns:
-            str: 保存されたファイル名
+            str: 保存されたファイル名（保存しなかった場合はNone）
         """
         if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"grading_result_{timestamp}.json"
+            # ファイル名の指定がなければ、デバッグ用ファイルとしてバックグラウンドで保存
+            filename = get_artifact_writer().write(KIND_RESULT, result_data)
+            if filename:
+                print(f"💾 採点結果を保存しました: {filename}")
+            return filename
         
         try:
             with open(filename, 'w', encoding='utf-8') as f:
@@ -451,4 +589,86 @@ class ResultViewer:
             
         except Exception as e:
             print(f"❌ ファイル読み込みエラー: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class StreamingResultView:
+    """採点結果を問題ごとに届いた順で表示し、その場で更新するビュー"""
+    
+    def __init__(self, viewer, submitted_problem_number):
+        self.viewer = viewer
+        self.submitted_problem_number = submitted_problem_number
+        self.problems = []
+        self.finished = False
+        
+        self.status_widget = widgets.HTML('<b>⏳ 採点中...（採点が終わった問題から表示します）</b>')
+        self.table_widget = widgets.HTML('')
+        self.details_output = widgets.Output()
+        
+        display(widgets.VBox([
+            self.status_widget,
+            self.table_widget,
+            self.details_output
+        ], layout=widgets.Layout(
+            border='1px solid #ddd',
+            border_radius='8px',
+            padding='10px',
+            margin='10px 0'
+        )))
+    
+    def handle_event(self, event):
+        """ストリーミングで受信したイベント（start / problem / end）を反映"""
+        event_type = event.get("type")
+        if event_type == "problem":
+            self.add_problem(event.get("problem", {}))
+        elif event_type == "end":
+            self.finish(event.get("overall_feedback", ""))
+    
+    def add_problem(self, problem):
+        """採点が終わった1問分を表に追加し、送信した問題なら詳細も表示"""
+        self.problems.append(problem)
+        self._render_table()
+        if problem.get("problem_number") == self.submitted_problem_number:
+            with self.details_output:
+                self.viewer._print_problem_details(problem, self.submitted_problem_number)
+    
+    def finish(self, overall_feedback=""):
+        """全問題の受信完了"""
+        self.finished = True
+        get_ui_scheduler().update(self.status_widget, value=f'<b>✅ 採点完了（{len(self.problems)}問）</b>')
+        if overall_feedback and overall_feedback.strip():
+            with self.details_output:
+                print(f"\n📝 総合フィードバック:")
+                print("="*60)
+                for line in overall_feedback.strip().split('\n'):
+                    print(f"  {line}")
+                print("="*60)
+    
+    def interrupt(self):
+        """受信が途中で終わった場合の表示（送り直した結果は新しいビューに表示される）"""
+        get_ui_scheduler().update(
+            self.status_widget, value=f'<b>⚠️ 受信が中断されました（{len(self.problems)}問受信済み）</b>'
+        )
+    
+    def _render_table(self):
+        """得点表のHTMLを作り直す"""
+        total_earned = sum(p.get("student_score", 0) for p in self.problems)
+        total_possible = sum(p.get("answer_full_score", 0) for p in self.problems)
+        success_rate = (total_earned / total_possible * 100) if total_possible > 0 else 0
+        
+        rows = ""
+        for problem in sorted(self.problems, key=lambda p: p.get("problem_number", 0)):
+            problem_number = problem.get("problem_number", "?")
+            student_score = problem.get("student_score", 0)
+            answer_full_score = problem.get("answer_full_score", 0)
+            status = "✅" if student_score >= answer_full_score else "❌"
+            rate = (student_score / answer_full_score * 100) if answer_full_score > 0 else 0
+            marker = " 🚀" if problem_number == self.submitted_problem_number else ""
+            rows += (f"<tr><td>問題 {problem_number}</td><td>{student_score}/{answer_full_score}点</td>"
+                     f"<td>{rate:.1f}%</td><td>{status}{marker}</td></tr>")
+        
+        # 問題が続けて届いても、表の送り直しは表示更新の間隔ごとに1回にまとめる
+        get_ui_scheduler().update(self.table_widget, value=f"""
+        <div><b>📊 総合得点（採点済み分）: {total_earned}/{total_possible} ({success_rate:.1f}%)</b></div>
+        <table style="border-collapse: collapse; margin-top: 5px;">{rows}</table>
+        """)
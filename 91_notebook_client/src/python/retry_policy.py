@@ -0,0 +1,164 @@
+"""
+リトライ方針モジュール - 指数バックオフ・ジッター・Retry-After・全体の締め切り管理
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# リトライしてよいHTTPステータス（これ以外の4xxは送り直しても結果が変わらない）
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Retry-After を尊重するステータス
+RETRY_AFTER_STATUS_CODES = frozenset({429, 503})
+
+
+def parse_retry_after(value, now=None):
+    """
+    Retry-After ヘッダーを秒数に変換
+
+    Args:
+        value (str): ヘッダー値（秒数 または HTTP日付）
+        now (datetime): 現在時刻（テスト用、Noneなら現在のUTC）
+
+    Returns:
+        float: 待つべき秒数（解釈できなければNone）
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class RetryPolicy:
+    """
+    送信リトライの方針
+
+    - 待ち時間は指数バックオフ + フルジッター（全員が同時に再送しないようにする）
+    - 429/503 で Retry-After が返ってきたらそれに従う
+    - リトライ可能なステータス/例外と、即座に諦めるべきものを区別する
+    - 送信全体の締め切り（deadline）を持ち、残り時間に応じて1回あたりのタイムアウトを縮める
+
+    方針を変えたい場合はこのクラスを継承してメソッドを上書きし、
+    GradingClient.set_retry_policy() で設定する。
+    """
+
+    def __init__(self, max_attempts=4, base_delay=2.0, max_delay=60.0, deadline=300.0,
+                 max_attempt_timeout=180.0, min_attempt_timeout=5.0,
+                 retryable_status_codes=RETRYABLE_STATUS_CODES):
+        """
+        Args:
+            max_attempts (int): 最大送信回数（初回を含む）
+            base_delay (float): バックオフの基準秒数
+            max_delay (float): 1回の待ち時間の上限（秒）
+            deadline (float): 送信開始からの締め切り（秒）
+            max_attempt_timeout (float): 1回の送信のタイムアウト上限（秒）
+            min_attempt_timeout (float): これより残り時間が短ければ送信を諦める（秒）
+            retryable_status_codes (set): リトライ対象のHTTPステータス
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.max_attempt_timeout = max_attempt_timeout
+        self.min_attempt_timeout = min_attempt_timeout
+        self.retryable_status_codes = frozenset(retryable_status_codes)
+
+    @property
+    def max_retries(self):
+        """最大リトライ回数（初回を除く）"""
+        return max(0, self.max_attempts - 1)
+
+    def is_retryable_status(self, status_code):
+        """HTTPステータスがリトライ対象かどうか"""
+        return status_code in self.retryable_status_codes
+
+    def is_retryable_exception(self, exc):
+        """通信例外がリトライ対象かどうか（接続失敗・タイムアウトはリトライする）"""
+        import requests
+        return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def backoff_delay(self, retry_number):
+        """
+        フルジッター付きの指数バックオフ
+
+        Args:
+            retry_number (int): 何回目のリトライか（1始まり）
+        """
+        cap = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        return random.uniform(0, cap)
+
+    def start(self, clock=time.monotonic):
+        """1回の送信処理分のリトライ状態を作成"""
+        return RetryBudget(self, clock)
+
+
+class RetryBudget:
+    """1回の送信処理（初回＋リトライ）の状態と残り時間を管理するクラス"""
+
+    def __init__(self, policy, clock=time.monotonic):
+        self.policy = policy
+        self.clock = clock
+        self.started_at = clock()
+        self.deadline_at = self.started_at + policy.deadline
+        self.attempt = 0  # 完了した送信回数
+
+    def remaining(self):
+        """締め切りまでの残り秒数"""
+        return max(0.0, self.deadline_at - self.clock())
+
+    def attempt_timeout(self):
+        """次の送信に使うタイムアウト（残り時間に合わせて縮める）"""
+        return min(self.policy.max_attempt_timeout, self.remaining())
+
+    def can_attempt(self):
+        """まだ送信してよいか"""
+        return (self.attempt < self.policy.max_attempts and
+                self.remaining() >= self.policy.min_attempt_timeout)
+
+    def record_attempt(self):
+        """送信を1回行ったことを記録"""
+        self.attempt += 1
+
+    def next_delay(self, status_code=None, retry_after=None, exc=None):
+        """
+        失敗した送信の後、次の送信までの待ち時間を決める
+
+        Args:
+            status_code (int): HTTPステータス（通信例外の場合はNone）
+            retry_after (str): Retry-After ヘッダー値
+            exc (Exception): 通信例外
+
+        Returns:
+            float: 待ち秒数。リトライすべきでなければNone
+        """
+        policy = self.policy
+        if status_code is not None and not policy.is_retryable_status(status_code):
+            return None
+        if exc is not None and not policy.is_retryable_exception(exc):
+            return None
+        if self.attempt >= policy.max_attempts:
+            return None
+
+        delay = None
+        if status_code in RETRY_AFTER_STATUS_CODES:
+            delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = policy.backoff_delay(self.attempt)
+
+        # 待った後に最低限の送信時間が残らないなら諦める
+        if self.remaining() - delay < policy.min_attempt_timeout:
+            return None
+        return delay
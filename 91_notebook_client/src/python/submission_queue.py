@@ -0,0 +1,392 @@
+"""
+送信キューモジュール - 送れなかった解答をSQLiteに保存し、バックグラウンドで送り直す
+
+リトライしても採点システムに届かなかった送信を .grading_queue.sqlite3 に保存する。
+同じ問題の解答は1件にまとめ（最新の内容で上書き）、カーネルを再起動しても残る。
+QueueFlusher がバックグラウンドスレッドで接続の回復を確認し、同時送信数を
+制限しながらキューを送り出す。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .payload_codec import serialize_json
+
+DEFAULT_QUEUE_FILE = ".grading_queue.sqlite3"
+DEFAULT_FLUSH_INTERVAL = 30.0      # 接続確認の間隔（秒）
+DEFAULT_FLUSH_CONCURRENCY = 2      # 同時に送り直す件数
+MAX_RETRY_INTERVAL = 600.0         # 1件あたりの再送間隔の上限（秒）
+
+# キュー内の状態
+STATE_PENDING = "pending"   # 送信待ち
+STATE_SENDING = "sending"   # 送信中
+STATE_FAILED = "failed"     # 送り直しても解決しないエラー（自動では送らない）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    base_url TEXT NOT NULL,
+    student_email TEXT NOT NULL,
+    assignment_id TEXT NOT NULL,
+    problem_number INTEGER,
+    submission_json TEXT NOT NULL,
+    state TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    enqueued_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    UNIQUE (base_url, student_email, assignment_id)
+)
+"""
+
+
+class SubmissionQueue:
+    """送信できなかった解答を保存するキュー（SQLite）"""
+
+    def __init__(self, queue_file=DEFAULT_QUEUE_FILE):
+        self.queue_file = queue_file
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def exists(self):
+        """キューのファイルがあるか（まだ一度も保存していなければFalse）"""
+        return os.path.exists(self.queue_file)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.queue_file, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            # 送信中のままカーネルが止まったものは送信待ちに戻す
+            conn.execute("UPDATE submissions SET state = ? WHERE state = ?", (STATE_PENDING, STATE_SENDING))
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    cursor = conn.execute(sql, params)
+                    return cursor.fetchall(), cursor.rowcount
+            finally:
+                conn.close()
+
+    def enqueue(self, base_url, submission_data, problem_number=None, error=None):
+        """
+        送信データをキューに追加（同じ問題の送信待ちがあれば最新の内容で置き換える）
+
+        Returns:
+            bool: 保存できたか
+        """
+        now = time.time()
+        try:
+            self._execute(
+                """
+                INSERT INTO submissions (base_url, student_email, assignment_id, problem_number,
+                                         submission_json, state, last_error, enqueued_at, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (base_url, student_email, assignment_id) DO UPDATE SET
+                    problem_number = excluded.problem_number,
+                    submission_json = excluded.submission_json,
+                    state = excluded.state,
+                    version = version + 1,
+                    attempts = 0,
+                    last_error = excluded.last_error,
+                    enqueued_at = excluded.enqueued_at,
+                    next_attempt_at = excluded.next_attempt_at
+                """,
+                (base_url, submission_data.get("student_email"), submission_data.get("assignment_id"),
+                 problem_number, serialize_json(submission_data).decode("utf-8"), STATE_PENDING,
+                 error, now, now)
+            )
+        except sqlite3.Error as e:
+            print(f"⚠️ 送信キューへの保存に失敗しました: {e}")
+            return False
+        return True
+
+    def claim_due(self, base_url, limit):
+        """
+        送信時刻になった送信待ちを取り出して送信中にする
+
+        Returns:
+            list: dict（id, version, problem_number, submission_data など）のリスト
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    rows = conn.execute(
+                        """
+                        SELECT * FROM submissions
+                        WHERE base_url = ? AND state = ? AND next_attempt_at <= ?
+                        ORDER BY enqueued_at LIMIT ?
+                        """,
+                        (base_url, STATE_PENDING, time.time(), limit)
+                    ).fetchall()
+                    conn.executemany(
+                        "UPDATE submissions SET state = ? WHERE id = ?",
+                        [(STATE_SENDING, row["id"]) for row in rows]
+                    )
+            finally:
+                conn.close()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["submission_data"] = json.loads(entry.pop("submission_json"))
+            entries.append(entry)
+        return entries
+
+    def complete(self, entry):
+        """送信できた項目を削除（送信中に新しい内容で置き換えられていれば残す）"""
+        self._execute("DELETE FROM submissions WHERE id = ? AND version = ?", (entry["id"], entry["version"]))
+
+    def retry_later(self, entry, error, retry_interval):
+        """送信に失敗した項目を、retry_interval 秒後に送り直すよう戻す"""
+        attempts = entry["attempts"] + 1
+        delay = min(MAX_RETRY_INTERVAL, retry_interval * (2 ** (attempts - 1)))
+        self._execute(
+            """
+            UPDATE submissions SET state = ?, attempts = ?, last_error = ?, next_attempt_at = ?
+            WHERE id = ? AND version = ?
+            """,
+            (STATE_PENDING, attempts, error, time.time() + delay, entry["id"], entry["version"])
+        )
+
+    def release(self, entry):
+        """取り出した項目を、送信せずに送信待ちへ戻す"""
+        self._execute("UPDATE submissions SET state = ? WHERE id = ? AND version = ? AND state = ?",
+                      (STATE_PENDING, entry["id"], entry["version"], STATE_SENDING))
+
+    def mark_failed(self, entry, error):
+        """送り直しても解決しないエラーの項目を、自動送信の対象から外す"""
+        self._execute(
+            "UPDATE submissions SET state = ?, attempts = attempts + 1, last_error = ? WHERE id = ? AND version = ?",
+            (STATE_FAILED, error, entry["id"], entry["version"])
+        )
+
+    def remove(self, base_url, student_email, assignment_id):
+        """指定した問題の項目を削除（新しい送信が直接届いた場合など）"""
+        if not self.exists():
+            return
+        try:
+            self._execute(
+                "DELETE FROM submissions WHERE base_url = ? AND student_email = ? AND assignment_id = ?",
+                (base_url, student_email, assignment_id)
+            )
+        except sqlite3.Error:
+            pass
+
+    def list_entries(self, base_url=None, student_email=None, problem_number=None):
+        """
+        条件に合う項目を古い順に返す（送信データ本体は含めない）
+
+        Returns:
+            list: dict（problem_number, state, attempts, last_error, enqueued_at など）のリスト
+        """
+        if not self.exists():
+            return []
+        conditions = []
+        params = []
+        for column, value in (("base_url", base_url), ("student_email", student_email),
+                              ("problem_number", problem_number)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            rows, _ = self._execute(
+                f"""
+                SELECT id, base_url, student_email, assignment_id, problem_number, state, version,
+                       attempts, last_error, enqueued_at, next_attempt_at
+                FROM submissions {where} ORDER BY enqueued_at
+                """,
+                params
+            )
+        except sqlite3.Error:
+            return []
+        return [dict(row) for row in rows]
+
+    def has_pending(self, base_url):
+        """送信待ちの項目があるか"""
+        return any(entry["state"] != STATE_FAILED for entry in self.list_entries(base_url))
+
+
+class QueueFlusher:
+    """
+    送信キューをバックグラウンドスレッドで送り出すクラス
+
+    interval 秒ごとに採点システムへの接続を確認し、つながれば送信時刻になった
+    項目を concurrency 件ずつ並行して送る。送信結果は add_listener で登録した
+    関数に (entry, success, result, error_msg) で通知する（呼び出しは
+    バックグラウンドスレッドから行われる）。
+    """
+
+    def __init__(self, client, queue, interval=DEFAULT_FLUSH_INTERVAL, concurrency=DEFAULT_FLUSH_CONCURRENCY):
+        self.client = client
+        self.queue = queue
+        self.interval = interval
+        self.concurrency = concurrency
+        self._listeners = {}  # キー -> 関数（キーを指定しなければ関数自身）
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener, key=None):
+        """
+        送信結果を受け取る関数を登録
+
+        key を指定すると、同じ key で登録済みの関数を置き換える
+        （セルを再実行して作り直した送信ボタンが、古いウィジェットを残さないようにする）
+        """
+        with self._lock:
+            self._listeners[listener if key is None else key] = listener
+
+    def remove_listener(self, listener):
+        """登録した関数を解除"""
+        with self._lock:
+            for key in [key for key, value in self._listeners.items() if value is listener]:
+                del self._listeners[key]
+
+    def start(self):
+        """バックグラウンドスレッドを開始（開始済みなら、すぐに接続確認させる）"""
+        with self._lock:
+            if not self.is_running:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="grading-queue-flusher", daemon=True)
+                self._thread.start()
+        self.wake()
+        return self
+
+    def wake(self):
+        """待ち時間を打ち切って、すぐにキューを確認させる"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        """バックグラウンドスレッドを停止"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="grading-queue") as executor:
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    self.flush_once(executor)
+                except Exception as e:
+                    print(f"⚠️ 送信キューの処理中にエラーが発生しました: {e}")
+
+    def flush_once(self, executor):
+        """
+        キューを1回分処理する
+
+        Returns:
+            int: 送信を試みた件数
+        """
+        base_url = self.client.get_grading_system_url()
+        if not self.queue.has_pending(base_url):
+            return 0
+        # 混雑で送信を止めている間は何もしない
+        if self.client.get_service_busy_seconds() > 0:
+            return 0
+        # 採点システムに接続できるか確認
+        if not self._is_reachable():
+            return 0
+
+        attempted = 0
+        while not self._stop.is_set():
+            entries = self.queue.claim_due(base_url, self.concurrency)
+            if not entries:
+                break
+            attempted += len(entries)
+            outcomes = list(executor.map(self._send_entry, entries))
+            if not any(outcomes):
+                break  # 全て失敗した場合は次の確認まで待つ
+        return attempted
+
+    def _is_reachable(self):
+        import requests
+        try:
+            self.client._get_transport().get(self.client.get_grading_system_url(), timeout=10)
+        except requests.exceptions.RequestException:
+            return False
+        return True
+
+    def _send_entry(self, entry):
+        """1件送信し、結果に応じてキューを更新する"""
+        client = self.client
+        policy = client.retry_policy
+        if not client.admit_request():
+            self.queue.release(entry)
+            return False
+        try:
+            success, result, error_msg, response, exc = client._send_request(
+                entry["submission_data"], timeout=policy.max_attempt_timeout
+            )
+        except Exception as e:
+            # 応答の解釈に失敗した場合など（送信中のままにせず、間隔を空けて送り直す）
+            success, result, error_msg, response = False, None, f"予期しないエラー: {e}", None
+        if success:
+            self.queue.complete(entry)
+        elif response is not None and not policy.is_retryable_status(response.status_code):
+            self.queue.mark_failed(entry, error_msg)
+        else:
+            self.queue.retry_later(entry, error_msg, self.interval)
+
+        with self._lock:
+            listeners = list(self._listeners.values())
+        for listener in listeners:
+            try:
+                listener(entry, success, result, error_msg)
+            except Exception:
+                pass
+        return success
+
+
+# 送信先URLごとの共有フラッシャー
+_flushers = {}
+_flushers_lock = threading.Lock()
+
+
+def get_queue_flusher(client, queue, on_created=None):
+    """
+    送信先URLごとに1つのQueueFlusherを取得（無ければ作成）
+
+    Args:
+        on_created (callable): 新しく作成したときに flusher を渡して呼ぶ関数
+    """
+    base_url = client.get_grading_system_url()
+    with _flushers_lock:
+        flusher = _flushers.get(base_url)
+        if flusher is None:
+            flusher = QueueFlusher(client, queue)
+            _flushers[base_url] = flusher
+            if on_created is not None:
+                on_created(flusher)
+        return flusher
+
+
+def stop_queue_flushers():
+    """全てのQueueFlusherを停止"""
+    with _flushers_lock:
+        flushers = list(_flushers.values())
+        _flushers.clear()
+    for flusher in flushers:
+        flusher.stop()
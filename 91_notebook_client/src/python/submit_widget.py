@@ -2,6 +2,7 @@
 送信ウィジェットモジュール - ipywidgetsを使った送信UI作成
 """
 
+import time
 import ipywidgets as widgets
 from IPython.display import display
 
@@ -9,6 +10,7 @@ from .email_detector import EmailDetector
 from .storage_helper import StorageManager
 from .notebook_reader import NotebookReader
 from .grading_client import GradingClient
+from .ui_scheduler import get_ui_scheduler
 
 class SubmitWidget:
     """送信UIの管理を行うクラス"""
@@ -87,14 +89,57 @@ class SubmitWidget:
             layout=widgets.Layout(width='120px')
         )
         
+        # 取り消しボタン（送信中だけ押せる、通信を切断してサーバーに採点の中止を依頼する）
+        cancel_button = widgets.Button(
+            description='🛑 中止',
+            disabled=True,
+            button_style='danger',
+            tooltip=f'送信中の練習プログラム{problem_number}の採点を取り消す',
+            layout=widgets.Layout(width='80px')
+        )
+        
+        # 再採点チェックボックス（キャッシュを使わずに採点し直す）
+        force_regrade_checkbox = widgets.Checkbox(
+            value=False,
+            description='🔁 再採点',
+            indent=False,
+            tooltip='前回と同じ内容でも保存済みの結果を使わずに採点し直す',
+            layout=widgets.Layout(width='100px')
+        )
+        
         # ステータス表示
         status_widget = widgets.HTML(
             value='<small>💡 メールアドレスは自動保存されます</small>'
         )
         
+        # 送信キューの状態表示（送信できなかった解答が残っている場合のみ表示）
+        queue_status_widget = widgets.HTML(value='')
+        
         # 結果表示
         output_widget = widgets.Output()
         
+        def refresh_queue_status(*_):
+            """送信キューの状態表示を更新"""
+            student_email = email_widget.value.strip()
+            entries = self.grading_client.get_queue_entries(student_email, problem_number) if student_email else []
+            # 送信キューのバックグラウンド送信からも呼ばれるので、表示の更新はスケジューラーに任せる
+            get_ui_scheduler().update(queue_status_widget, value=self._format_queue_status(
+                entries, self.grading_client.get_service_busy_seconds()
+            ))
+        
+        def on_queue_entry_sent(entry, success, result, error_msg):
+            """送信キューの送信結果を受け取る（バックグラウンドスレッドから呼ばれる）"""
+            if entry.get("problem_number") != problem_number:
+                return
+            if entry.get("student_email") != email_widget.value.strip():
+                return
+            refresh_queue_status()
+            if success:
+                output_widget.append_stdout(
+                    f"📮 送信キューに保存されていた練習プログラム{problem_number}の解答を送信しました\n"
+                    f"💾 もう一度送信ボタンを押すと採点結果を表示します\n"
+                )
+        
         def on_reload_python_clicked(b):
             """Python版メールアドレス取得ボタンのハンドラ"""
             with output_widget:
@@ -112,9 +157,10 @@ class SubmitWidget:
         def on_submit_clicked(b):
             """送信ボタンのハンドラ"""
             with output_widget:
-                output_widget.clear_output()
-                
                 student_email = email_widget.value.strip()
+                # 送信中なら、その進捗表示を残したまま合流・置き換えの案内を追記する
+                if not self.grading_client.has_in_flight_submission(student_email, problem_number):
+                    output_widget.clear_output()
                 
                 if not student_email:
                     print("⚠️ メールアドレスを入力してください")
@@ -129,32 +175,65 @@ class SubmitWidget:
                     print(f"💾 メールアドレスを保存しました: {student_email}")
                 
                 # 指定された問題番号の送信ボタン前のセル内容を取得
-                notebook_cells = self.notebook_reader.get_notebook_cells_before_submit(problem_number)
+                with self.grading_client.tracer.span("read_cells", problem_number=problem_number) as span:
+                    notebook_cells = self.notebook_reader.get_notebook_cells_before_submit(problem_number)
+                    span.set_tag("cells", len(notebook_cells or []))
                 
                 if not notebook_cells:
                     print("❌ 送信対象のセルが見つかりませんでした")
                     return
                 
-                # 自動採点システムに送信
-                self.grading_client.submit_assignment(
+                # 自動採点システムに送信（イベントループ上で非同期に実行）
+                future = self.grading_client.submit_assignment(
                     student_email, 
                     problem_number, 
                     notebook_cells,
-                    auto_save=True
+                    auto_save=True,
+                    output=output_widget,
+                    force_regrade=force_regrade_checkbox.value
                 )
+                force_regrade_checkbox.value = False
+                get_ui_scheduler().update(cancel_button, disabled=False)
+                future.add_done_callback(refresh_queue_status)
+                future.add_done_callback(lambda _: get_ui_scheduler().update(cancel_button, disabled=True))
                 
         
+        # カーネル再起動前に送信して採点待ちのままのジョブがあれば、結果の受け取りを再開
+        if email_widget.value:
+            pending_jobs = self.grading_client.job_store.list_jobs(
+                self.grading_client.get_grading_system_url(), email_widget.value, problem_number
+            )
+            if pending_jobs:
+                self.grading_client.resume_pending_jobs(email_widget.value, problem_number, output=output_widget)
+        
+        # 送信キューの状態を表示し、残っていればバックグラウンド送信を再開
+        # 同じ問題のボタンを作り直した場合は、前のボタンの通知先を置き換える
+        flusher = self.grading_client.get_queue_flusher()
+        flusher.add_listener(on_queue_entry_sent, key=("submit_button", problem_number))
+        refresh_queue_status()
+        self.grading_client.start_queue_flusher()
+        
+        def on_cancel_clicked(b):
+            """取り消しボタンのハンドラ"""
+            with output_widget:
+                if not self.grading_client.cancel_submission(
+                        student_email=email_widget.value.strip(), problem_number=problem_number):
+                    print("ℹ️ 取り消せる送信はありません")
+        
         submit_button.on_click(on_submit_clicked)
+        cancel_button.on_click(on_cancel_clicked)
         reload_python_button.on_click(on_reload_python_clicked)
+        email_widget.observe(refresh_queue_status, names='value')
         
         # ウィジェット組み立て
-        button_row = widgets.HBox([submit_button, reload_python_button])
+        button_row = widgets.HBox([submit_button, cancel_button, reload_python_button, force_regrade_checkbox])
         submit_widget = widgets.VBox([
             widgets.HTML(f"<h4>📤 練習プログラム{problem_number} 解答送信</h4>"),
             status_widget,
             email_widget,
             button_row,
-            widgets.HTML('<small>🔄=localStorage/ファイル保存、📡=3回リトライ機能付き送信、🔍=送信時自動保存</small>'),
+            queue_status_widget,
+            widgets.HTML('<small>🔄=localStorage/ファイル保存、📡=自動リトライ機能付き送信、📮=送信できなかった解答は接続回復後に自動送信、🔍=送信時自動保存、💾=同じ内容は保存済みの結果を表示</small>'),
             output_widget
         ], layout=widgets.Layout(
             border='2px solid #4CAF50',
@@ -165,6 +244,138 @@ class SubmitWidget:
         
         return submit_widget
     
+    def create_submit_all_button(self):
+        """
+        ノートブック内の全問題をまとめて送信するボタンを作成
+        
+        送信ボタンセル（create_submit_button(problem_number=N)）から問題番号を探し、
+        全問題の解答を1回で送信する。
+        
+        Returns:
+            widgets.VBox: 送信ウィジェット
+        """
+        email_widget = widgets.Text(
+            value='',
+            placeholder='99ZZ888@okiu.ac.jp',
+            description='メールアドレス:',
+            disabled=False,
+            style={'description_width': '100px'}
+        )
+        
+        saved_email = self.storage_manager.load_email_address()
+        if saved_email and self.email_detector.is_valid_email(saved_email):
+            email_widget.value = saved_email
+            print(f"🎯 保存済みメールアドレスを自動設定: {saved_email}")
+        elif self.detected_email and self.email_detector.is_valid_email(self.detected_email):
+            email_widget.value = self.detected_email
+            print(f"🎯 共通プログラムで取得したメールアドレスを自動設定: {self.detected_email}")
+        
+        submit_button = widgets.Button(
+            description='📤 全問題をまとめて送信',
+            disabled=False,
+            button_style='success',
+            tooltip='ノートブック内の全ての練習プログラムの解答を1回で送信',
+            layout=widgets.Layout(width='250px')
+        )
+        
+        cancel_button = widgets.Button(
+            description='🛑 中止',
+            disabled=True,
+            button_style='danger',
+            tooltip='送信中の解答の採点を全て取り消す',
+            layout=widgets.Layout(width='80px')
+        )
+        
+        force_regrade_checkbox = widgets.Checkbox(
+            value=False,
+            description='🔁 再採点',
+            indent=False,
+            tooltip='前回と同じ内容でも保存済みの結果を使わずに採点し直す',
+            layout=widgets.Layout(width='100px')
+        )
+        
+        output_widget = widgets.Output()
+        
+        def on_submit_clicked(b):
+            """送信ボタンのハンドラ"""
+            with output_widget:
+                student_email = email_widget.value.strip()
+                # 送信中なら、その進捗表示を残したまま合流・置き換えの案内を追記する
+                if not self.grading_client.has_in_flight_submission(student_email):
+                    output_widget.clear_output()
+                
+                if not student_email:
+                    print("⚠️ メールアドレスを入力してください")
+                    return
+                
+                if not self.email_detector.is_valid_email(student_email):
+                    print("⚠️ 有効なメールアドレスを入力してください")
+                    return
+                
+                if self.storage_manager.save_email_address(student_email):
+                    print(f"💾 メールアドレスを保存しました: {student_email}")
+                
+                # 全問題の送信ボタン前のセル内容を取得
+                with self.grading_client.tracer.span("read_cells", problem_number="all") as span:
+                    problem_cells = self.notebook_reader.get_cells_for_all_problems()
+                    span.set_tag("problems", len(problem_cells or {}))
+                
+                if not problem_cells:
+                    print("❌ 送信対象の問題が見つかりませんでした")
+                    return
+                
+                future = self.grading_client.submit_all_problems(
+                    student_email,
+                    problem_cells,
+                    auto_save=True,
+                    output=output_widget,
+                    force_regrade=force_regrade_checkbox.value
+                )
+                force_regrade_checkbox.value = False
+                get_ui_scheduler().update(cancel_button, disabled=False)
+                future.add_done_callback(lambda _: get_ui_scheduler().update(cancel_button, disabled=True))
+        
+        def on_cancel_clicked(b):
+            """取り消しボタンのハンドラ（1問ずつ送信している場合も含めて、このメールアドレスの送信を全て取り消す）"""
+            with output_widget:
+                if not self.grading_client.cancel_submission(student_email=email_widget.value.strip()):
+                    print("ℹ️ 取り消せる送信はありません")
+        
+        submit_button.on_click(on_submit_clicked)
+        cancel_button.on_click(on_cancel_clicked)
+        
+        return widgets.VBox([
+            widgets.HTML("<h4>📤 全問題まとめて解答送信</h4>"),
+            email_widget,
+            widgets.HBox([submit_button, cancel_button, force_regrade_checkbox]),
+            widgets.HTML('<small>📦=全問題を1回で送信（採点システムが対応していない場合は1問ずつ送信）、💾=同じ内容は保存済みの結果を表示</small>'),
+            output_widget
+        ], layout=widgets.Layout(
+            border='2px solid #4CAF50',
+            border_radius='8px',
+            padding='15px',
+            margin='10px 0'
+        ))
+    
+    @staticmethod
+    def _format_queue_status(entries, busy_seconds=0.0):
+        """送信キューの状態表示用HTMLを作成（busy_seconds: 混雑で送信を止めている残り秒数）"""
+        if not entries:
+            return ''
+        entry = entries[-1]
+        if entry["state"] != "failed" and busy_seconds > 0:
+            return (f'<small>🚦 採点システム混雑中・送信待ち'
+                    f'（約 {busy_seconds:.0f} 秒後から自動で送信します。もう一度押す必要はありません）</small>')
+        if entry["state"] == "failed":
+            return (f'<small>⚠️ 送信キュー: 自動送信できないエラーのため停止中'
+                    f'（{entry["last_error"]}）。もう一度送信ボタンを押してください</small>')
+        if entry["state"] == "sending":
+            return '<small>📮 送信キュー: 送信中...</small>'
+        wait_seconds = max(0, int(entry["next_attempt_at"] - time.time()))
+        attempts = f'、再送 {entry["attempts"]} 回失敗' if entry["attempts"] else ''
+        when = f'{wait_seconds} 秒後以降に' if wait_seconds else '接続が回復したら'
+        return f'<small>📮 送信キュー: 送信待ち（{when}自動送信{attempts}）</small>'
+    
     def get_detected_email(self):
         """検出済みメールアドレスを取得"""
         return self.detected_email
@@ -0,0 +1,247 @@
+"""
+計測モジュール - 送信処理の段階ごとの所要時間を記録する
+
+送信ボタンを押してから結果が表示されるまでのどこに時間がかかっているかを調べるため、
+段階（セル読み込み・送信データ作成・JSON変換・デバッグ保存・通信・サーバー採点・表示）ごとに
+所要時間を記録する。記録はメモリ上の一定件数（リングバッファ）だけ保持し、
+JSON Lines と Prometheus形式のテキストに書き出せる。
+
+計測を無効にしている間（既定）は、span() が何もしない共有オブジェクトを返すだけで
+時刻の取得も記録も行わない。
+
+使用例:
+    tracer = get_tracer()
+    tracer.set_enabled(True)
+    with tracer.span("network", attempt=1) as span:
+        response = post(...)
+        span.set_tag("status", response.status_code)
+    tracer.export_jsonl("grading_trace.jsonl")
+    tracer.export_prometheus("grading_metrics.prom")
+"""
+
+import bisect
+import collections
+import json
+import threading
+import time
+
+# メモリ上に保持する計測記録の件数
+DEFAULT_CAPACITY = 1000
+
+# 所要時間ヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "grading_client"
+
+
+class _NullSpan:
+    """計測無効時に返す、何もしない区間"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_tag(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """1つの段階の計測区間（with文で使う）"""
+
+    __slots__ = ("tracer", "name", "tags", "started_at", "_start")
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.started_at = None
+        self._start = None
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.tracer.record(self.name, duration, self.tags, started_at=self.started_at)
+        return False
+
+    def set_tag(self, key, value):
+        """問題番号・送信サイズ・試行回数などの付加情報を設定"""
+        self.tags[key] = value
+
+
+class Tracer:
+    """
+    段階ごとの所要時間を記録するクラス（スレッドセーフ）
+
+    個々の記録はリングバッファに、段階ごとの集計（ヒストグラム）と
+    カウンターは別に保持するので、古い記録が押し出されても集計は残る。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, buckets=LATENCY_BUCKETS, enabled=False):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._spans = collections.deque(maxlen=capacity)
+        self._histograms = {}
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def set_enabled(self, enabled=True, capacity=None):
+        """計測の有効/無効を切り替える（capacity を指定するとリングバッファの件数を変更）"""
+        with self._lock:
+            if capacity is not None and capacity != self._spans.maxlen:
+                self._spans = collections.deque(self._spans, maxlen=capacity)
+            self.enabled = enabled
+
+    def span(self, name, **tags):
+        """
+        段階の計測区間を作る
+
+        Args:
+            name (str): 段階の名前（read_cells, serialize, network 等）
+            **tags: 付加情報（problem_number, attempt 等）
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, tags)
+
+    def record(self, name, duration, tags=None, started_at=None):
+        """計測済みの所要時間を記録（サーバーが報告した採点時間など、span を使えない場合）"""
+        if not self.enabled:
+            return
+        entry = {
+            "name": name,
+            "started_at": started_at if started_at is not None else time.time() - duration,
+            "duration": duration,
+            "tags": dict(tags or {}),
+        }
+        with self._lock:
+            self._spans.append(entry)
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0, "errors": 0}
+                self._histograms[name] = histogram
+            index = bisect.bisect_left(self.buckets, duration)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += duration
+            histogram["count"] += 1
+            if "error" in entry["tags"]:
+                histogram["errors"] += 1
+
+    def count(self, name, value=1, **labels):
+        """カウンターを増やす（送信結果の件数など）"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def get_spans(self, name=None):
+        """保持している計測記録（古い順）。name を指定するとその段階だけ"""
+        with self._lock:
+            spans = list(self._spans)
+        if name is not None:
+            spans = [span for span in spans if span["name"] == name]
+        return spans
+
+    def get_summary(self):
+        """段階ごとの件数・合計・平均（秒）"""
+        with self._lock:
+            return {
+                name: {
+                    "count": histogram["count"],
+                    "errors": histogram["errors"],
+                    "total": histogram["sum"],
+                    "mean": histogram["sum"] / histogram["count"] if histogram["count"] else 0.0,
+                }
+                for name, histogram in self._histograms.items()
+            }
+
+    def clear(self):
+        """計測記録と集計を消去"""
+        with self._lock:
+            self._spans.clear()
+            self._histograms.clear()
+            self._counters.clear()
+
+    def export_jsonl(self, path):
+        """
+        計測記録をJSON Lines形式（1行1区間）で書き出す
+
+        Returns:
+            int: 書き出した件数
+        """
+        spans = self.get_spans()
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+
+    def format_prometheus(self):
+        """集計をPrometheusのテキスト形式にする"""
+        metric = f"{METRIC_PREFIX}_phase_seconds"
+        lines = [
+            f"# HELP {metric} Time spent in each phase of the submit pipeline.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        for name in sorted(histograms):
+            histogram = histograms[name]
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{phase="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{phase="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{metric}_sum{{phase="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{metric}_count{{phase="{name}"}} {histogram["count"]}')
+
+        errors = f"{METRIC_PREFIX}_phase_errors_total"
+        lines.append(f"# HELP {errors} Phases that ended with an exception.")
+        lines.append(f"# TYPE {errors} counter")
+        for name in sorted(histograms):
+            lines.append(f'{errors}{{phase="{name}"}} {histograms[name]["errors"]}')
+
+        for counter_name in sorted({name for name, _ in counters}):
+            metric_name = f"{METRIC_PREFIX}_{counter_name}_total"
+            lines.append(f"# TYPE {metric_name} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name != counter_name:
+                    continue
+                label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+                lines.append(f"{metric_name}{{{label_text}}} {value}" if label_text else f"{metric_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        """集計をPrometheusのテキスト形式（node_exporter の textfile 等で読める）で書き出す"""
+        text = self.format_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# カーネル内で共有するTracer
+_tracer = Tracer()
+
+
+def get_tracer():
+    """カーネル内で共有するTracerを取得"""
+    return _tracer
@@ -0,0 +1,237 @@
+"""
+表示更新スケジューラーモジュール - カーネル内の全ウィジェット更新を1つのタイマーでまとめて行う
+
+問題ごとの送信ボタンが同時にリトライ待機やストリーミング受信をすると、ウィジェットの
+プロパティ変更1つごとにフロントエンドへメッセージが送られ、Colabの画面が重くなる。
+このモジュールはカーネルのイベントループ上の1つのタイマー（tick）で
+
+- 全てのリトライ待機のカウントダウンを進め、
+- 溜まったプロパティ変更を1ウィジェットにつき1回の hold_sync() にまとめて送る
+
+ので、スレッドを作らず、フロントエンドへの更新も1ウィジェットにつき interval 秒に1回までになる。
+カウントダウンも保留中の更新も無い間はタイマーを止めるので、ウィジェットを閉じたり
+セルを再実行したりしても何も残らない（閉じたウィジェットへの更新は捨てる）。
+
+使用例:
+    scheduler = get_ui_scheduler()
+    scheduler.update(progress_bar, value=3.0, description="あと 2 秒")
+    countdown = scheduler.countdown(5.0, on_tick=lambda remaining, elapsed: ...)
+    completed = await countdown
+"""
+
+import asyncio
+import contextlib
+import math
+import threading
+
+# フロントエンドへの更新間隔（秒、1ウィジェットにつきこの間隔で最大1回）
+DEFAULT_INTERVAL = 0.1
+
+# カウントダウンの表示を進める単位（秒）
+DEFAULT_STEP = 1.0
+
+# この秒数以内に表示が進む・完了するカウントダウンは同じ tick でまとめて進める
+TICK_SLACK = 0.02
+
+
+def _is_closed(widget):
+    """close() 済みのウィジェットか（ipywidgets は close() で comm を外す）"""
+    return getattr(widget, "comm", True) is None
+
+
+class Countdown:
+    """UiScheduler が進めるカウントダウン（await すると完了ならTrue、取り消されたらFalse）"""
+
+    def __init__(self, scheduler, loop, duration, on_tick, step):
+        self.scheduler = scheduler
+        self.duration = duration
+        self.on_tick = on_tick
+        self.step = step
+        self.started_at = loop.time()
+        self.deadline = self.started_at + duration
+        self.future = loop.create_future()
+        self._shown = None  # 最後に on_tick を呼んだときの残り（step単位）
+
+    def __await__(self):
+        return self.future.__await__()
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        """カウントダウンを取り消す（イベントループのスレッドから呼ぶ）"""
+        self.scheduler._finish_countdown(self, False)
+
+    def _next_change(self, now):
+        """表示が次に変わる（または完了する）までの秒数"""
+        remaining = self.deadline - now
+        if remaining <= 0:
+            return 0.0
+        shown = math.ceil(remaining / self.step)
+        if self._shown is not None:
+            shown = min(shown, self._shown)
+        return max(0.0, remaining - (shown - 1) * self.step)
+
+
+class UiScheduler:
+    """
+    カーネル内のウィジェット更新とカウントダウンを1つのタイマーで進めるクラス
+
+    update() はどのスレッドからでも呼べる（送信キューのバックグラウンド送信など）。
+    イベントループが動いていない環境（通常のスクリプト等）ではその場で反映する。
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stats = {"ticks": 0, "flushes": 0, "updates": 0, "coalesced": 0, "dropped": 0}
+        self._pending = {}      # ウィジェット -> {プロパティ名: 値}
+        self._countdowns = []
+        self._loop = None
+        self._handle = None
+        self._last_flush = None
+        self._lock = threading.Lock()
+
+    def update(self, widget, **values):
+        """
+        ウィジェットのプロパティ変更を予約する（次の tick でまとめて反映）
+
+        同じウィジェットの同じプロパティを tick までに何度変更しても、送るのは最後の値だけ。
+        """
+        with self._lock:
+            pending = self._pending.setdefault(widget, {})
+            self.stats["updates"] += len(values)
+            self.stats["coalesced"] += len(pending.keys() & values.keys())
+            pending.update(values)
+
+        loop = self._current_loop()
+        if loop is None:
+            self.flush()
+        elif _running_loop() is loop:
+            self._arm()
+        else:
+            loop.call_soon_threadsafe(self._arm)
+
+    def countdown(self, duration, on_tick=None, step=DEFAULT_STEP):
+        """
+        カウントダウンを開始する（イベントループ上で呼ぶ）
+
+        Args:
+            duration (float): 秒数
+            on_tick (callable): on_tick(remaining, elapsed) 表示が step 秒進むごとに呼ばれる
+                                （ウィジェットの変更は update() で行う）
+            step (float): 表示を進める単位（秒）
+
+        Returns:
+            Countdown: await すると完了ならTrue、取り消されたらFalse
+        """
+        loop = asyncio.get_running_loop()
+        countdown = Countdown(self, loop, max(duration, 0.0), on_tick, step)
+        if not self._bind(loop):
+            # 別スレッドのイベントループ（通常は無い）では表示を進めず、完了だけ知らせる
+            loop.call_later(countdown.duration, self._finish_countdown, countdown, True)
+            return countdown
+        self._countdowns.append(countdown)
+        self._arm()
+        return countdown
+
+    def flush(self):
+        """保留中のプロパティ変更をウィジェットごとに1回の同期で反映"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for widget, values in pending.items():
+            if _is_closed(widget):
+                self.stats["dropped"] += 1
+                continue
+            hold_sync = getattr(widget, "hold_sync", None)
+            with hold_sync() if hold_sync else contextlib.nullcontext():
+                for name, value in values.items():
+                    setattr(widget, name, value)
+            self.stats["flushes"] += 1
+        if self._loop is not None and not self._loop.is_closed():
+            self._last_flush = self._loop.time()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, active_countdowns=len(self._countdowns), pending=len(self._pending))
+
+    def _current_loop(self):
+        """更新を反映するイベントループ（動いていなければNone）"""
+        loop = _running_loop()
+        if loop is not None and self._bind(loop):
+            return loop
+        if self._loop is not None and not self._loop.is_closed() and self._loop.is_running():
+            return self._loop
+        return None
+
+    def _bind(self, loop):
+        """
+        tick を動かすイベントループを決める
+
+        前のループが終わっていれば（スクリプトで asyncio.run を繰り返した場合など）
+        新しいループに切り替え、前のループ上のカウントダウンは捨てる。
+
+        Returns:
+            bool: loop 上で tick を動かすならTrue（別のループが動いている間はFalse）
+        """
+        if loop is self._loop:
+            return True
+        if self._loop is not None and not self._loop.is_closed() and self._loop.is_running():
+            return False
+        self._loop = loop
+        self._handle = None
+        self._last_flush = None
+        self._countdowns = []
+        return True
+
+    def _arm(self):
+        """次の tick を予約する（イベントループのスレッドで呼ぶ、予約済みなら何もしない）"""
+        if self._handle is not None or self._loop is None:
+            return
+        now = self._loop.time()
+        delays = [countdown._next_change(now) for countdown in self._countdowns]
+        if self._pending:
+            last = self._last_flush
+            delays.append(0.0 if last is None else max(0.0, last + self.interval - now))
+        if delays:
+            self._handle = self._loop.call_later(min(delays), self._tick)
+
+    def _tick(self):
+        self._handle = None
+        self.stats["ticks"] += 1
+        now = self._loop.time() + TICK_SLACK
+        for countdown in list(self._countdowns):
+            remaining = countdown.deadline - now
+            if remaining <= 0:
+                self._finish_countdown(countdown, True)
+                continue
+            shown = math.ceil(remaining / countdown.step)
+            if shown != countdown._shown:
+                countdown._shown = shown
+                if countdown.on_tick:
+                    countdown.on_tick(remaining, now - countdown.started_at)
+        if self._pending:
+            self.flush()
+        self._arm()
+
+    def _finish_countdown(self, countdown, completed):
+        if countdown in self._countdowns:
+            self._countdowns.remove(countdown)
+        if not countdown.future.done():
+            countdown.future.set_result(completed)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# カーネル内で共有するUiScheduler
+_scheduler = UiScheduler()
+
+
+def get_ui_scheduler():
+    """カーネル内で共有するUiSchedulerを取得"""
+    return _scheduler
@@ -34,8 +34,25 @@ python_files=(
     "python/environment_detector.py"
     "python/storage_helper.py"
     "python/email_detector.py"
+    "python/cell_model.py"
+    "python/debug_artifacts.py"
+    "python/payload_minimizer.py"
+    "python/notebook_index.py"
+    "python/notebook_stream.py"
+    "python/notebook_cache.py"
+    "python/colab_snapshot.py"
     "python/notebook_reader.py"
     "python/result_viewer.py"
+    "python/http_transport.py"
+    "python/payload_codec.py"
+    "python/retry_policy.py"
+    "python/delta_submission.py"
+    "python/result_cache.py"
+    "python/job_store.py"
+    "python/submission_queue.py"
+    "python/admission_control.py"
+    "python/tracing.py"
+    "python/ui_scheduler.py"
     "python/grading_client.py"
     "python/submit_widget.py"
     "client_setup.py"
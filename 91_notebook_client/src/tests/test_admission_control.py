@@ -0,0 +1,69 @@
+"""送信制御（サーキットブレーカーと送信枠）"""
+
+import pytest
+
+from python.admission_control import STATE_CLOSED, STATE_HALF_OPEN
+from python.grading_client import GradingClient, SERVICE_BUSY_ERROR
+from python.local_grading_server import LocalGradingServer
+
+
+@pytest.fixture
+def server():
+    with LocalGradingServer() as server:
+        yield server
+
+
+def make_client(server):
+    client = GradingClient(server.url)
+    client.set_notebook_path("x.ipynb")
+    client.set_debug_artifacts("off")
+    return client
+
+
+def half_open(client):
+    """ブレーカーを試しの1件を送る直前の状態にする"""
+    breaker = client.get_admission_controller().breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.reset_timeout = 0
+    assert client.admit_request()
+    assert breaker.state == STATE_HALF_OPEN
+    return breaker
+
+
+def submission(client):
+    return client.create_submission_data("a@example.ac.jp", 1, [])
+
+
+def test_probe_is_returned_when_no_send_slot(server):
+    client = make_client(server)
+    client.get_admission_controller().bucket("/grade").update_from_headers(
+        {"RateLimit-Remaining": "0", "RateLimit-Reset": "60"}
+    )
+    breaker = half_open(client)
+
+    success, _, error_msg, _, _ = client._send_request(submission(client), timeout=0.1)
+
+    assert not success and error_msg == SERVICE_BUSY_ERROR
+    assert client.admit_request()  # 次の試しの1件を送れる
+    assert server.stats["requests"] == 0
+    assert breaker.state == STATE_HALF_OPEN
+
+
+def test_probe_and_slot_are_returned_when_post_raises(server, monkeypatch):
+    client = make_client(server)
+    breaker = half_open(client)
+
+    def broken_post(*args, **kwargs):
+        raise ValueError("送信データを変換できません")
+
+    monkeypatch.setattr(client, "_post_submission", broken_post)
+    with pytest.raises(ValueError):
+        client._send_request(submission(client), timeout=5)
+
+    assert client.get_admission_controller().bucket("/grade").get_stats()["in_flight"] == 0
+    monkeypatch.undo()
+    assert client.admit_request()
+    success, _, _, _, _ = client._send_request(submission(client), timeout=5)
+    assert success
+    assert breaker.state == STATE_CLOSED
@@ -0,0 +1,46 @@
+"""送信の取り消しと送信制御"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from python.admission_control import STATE_CLOSED
+from python.grading_client import GradingClient, CANCELLED_ERROR
+from python.local_grading_server import LocalGradingServer
+
+CELLS = [{"cell_type": "code", "source": "# 練習プログラム1\nprint(1)", "outputs": []}]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_repeated_cancels_keep_breaker_closed(streaming):
+    with LocalGradingServer(grading_delay=5) as server:
+        client = GradingClient(server.url)
+        client.set_notebook_path("x.ipynb")
+        client.set_result_cache(False)
+        client.set_debug_artifacts("off")
+        client.set_offline_queue(False)
+        client.set_streaming(streaming)
+        client.set_job_mode(False)
+        admission = client.get_admission_controller()
+
+        for _ in range(admission.breaker.failure_threshold + 1):
+            def cancel_soon():
+                time.sleep(0.3)
+                client.cancel_submission(student_email="a@example.ac.jp", problem_number=1)
+
+            canceller = threading.Thread(target=cancel_soon)
+            canceller.start()
+            outcome = asyncio.run(client._send_to_grading_system_with_retry(
+                client.create_submission_data("a@example.ac.jp", 1, CELLS)
+            ))
+            canceller.join()
+            assert outcome[2] == CANCELLED_ERROR
+
+        bucket = admission.bucket("/grade").get_stats()
+        assert admission.breaker.state == STATE_CLOSED
+        assert admission.breaker.consecutive_failures == 0
+        assert bucket["in_flight"] == 0
+        assert bucket["concurrency_limit"] == bucket["max_concurrency"]
+        assert client.admit_request()
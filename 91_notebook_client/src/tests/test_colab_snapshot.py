@@ -0,0 +1,92 @@
+"""Colabノートブックの控え（取り寄せに失敗したときに控えを使う条件）"""
+
+import sys
+import time
+import types
+
+import pytest
+
+from python.colab_snapshot import ColabNotebookSnapshot
+
+CELLS = [
+    {"cell_type": "code", "metadata": {"id": "c0"}, "source": "x = 1", "outputs": [], "execution_count": 1},
+    {"cell_type": "code", "metadata": {"id": "c1"}, "source": "create_submit_button(1)", "outputs": []},
+]
+
+
+class FakeEvents:
+    def __init__(self):
+        self.callbacks = {}
+
+    def register(self, event, callback):
+        self.callbacks.setdefault(event, []).append(callback)
+
+    def unregister(self, event, callback):
+        self.callbacks[event].remove(callback)
+
+
+class FakeColab:
+    """google.colab._message.blocking_request の代わり（fail=True で取り寄せに失敗する）"""
+
+    def __init__(self):
+        self.fail = False
+        self.requests = 0
+
+    def blocking_request(self, kind, request="", timeout_sec=10):
+        self.requests += 1
+        if self.fail:
+            raise TimeoutError("timeout")
+        return {"ipynb": {"cells": [dict(cell) for cell in CELLS]}}
+
+
+@pytest.fixture
+def colab(monkeypatch):
+    fake = FakeColab()
+    message = types.ModuleType("google.colab._message")
+    message.blocking_request = fake.blocking_request
+    colab_module = types.ModuleType("google.colab")
+    colab_module._message = message
+    google = types.ModuleType("google")
+    google.colab = colab_module
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.colab", colab_module)
+    monkeypatch.setitem(sys.modules, "google.colab._message", message)
+    return fake
+
+
+@pytest.fixture
+def snapshot(colab):
+    snapshot = ColabNotebookSnapshot()
+    assert snapshot.install(types.SimpleNamespace(events=FakeEvents()))
+    assert len(snapshot.get_cells()) == 2
+    return snapshot
+
+
+def run_cell(snapshot, source, cell_id):
+    snapshot._pre_run_cell(types.SimpleNamespace(raw_cell=source, cell_id=cell_id))
+    snapshot._post_run_cell(types.SimpleNamespace(execution_count=2))
+
+
+def test_edited_snapshot_is_not_used_when_fetch_fails(colab, snapshot):
+    run_cell(snapshot, "y = 1", "added")  # 控えに無いセル
+    colab.fail = True
+    assert snapshot.get_cells(need_outputs=False) == []
+
+
+def test_expired_snapshot_is_not_used_when_fetch_fails(colab, snapshot):
+    snapshot.max_age = 0
+    time.sleep(0.01)
+    colab.fail = True
+    assert snapshot.get_cells(need_outputs=False) == []
+
+
+def test_snapshot_with_old_outputs_is_used_when_fetch_fails(colab, snapshot):
+    run_cell(snapshot, "x = 2", "c0")
+    colab.fail = True
+    cells = snapshot.get_cells(need_outputs=True)
+    assert colab.requests == 2
+    assert cells[0]["source"] == "x = 2"
+
+    snapshot.max_age = 0
+    time.sleep(0.01)
+    assert snapshot.get_cells(need_outputs=True) == []
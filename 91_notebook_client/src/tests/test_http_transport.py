@@ -0,0 +1,24 @@
+"""HttpTransport の接続再利用の統計"""
+
+from python.http_transport import HttpTransport
+from python.local_grading_server import LocalGradingServer
+
+
+def test_stats_survive_configure_pool():
+    with LocalGradingServer() as server:
+        transport = HttpTransport()
+        for _ in range(3):
+            transport.get(f"{server.url}/capabilities", timeout=10).close()
+        before = transport.get_stats()
+        assert before["new_connections"] == 1
+        assert before["reused_connections"] == 2
+
+        transport.configure_pool(pool_maxsize=4)
+        transport.get(f"{server.url}/capabilities", timeout=10).close()
+        after = transport.get_stats()
+        transport.close()
+
+    assert after["requests"] == 4
+    assert after["new_connections"] == 2
+    assert after["reused_connections"] == 2
+    assert after["pool_maxsize"] == 4
@@ -0,0 +1,35 @@
+"""採点結果キャッシュ"""
+
+import asyncio
+
+from python.grading_client import GradingClient
+from python.local_grading_server import LocalGradingServer
+from python.result_cache import ResultCache
+
+CELLS = [{"cell_type": "code", "source": ["# 練習プログラム1\n", "print(1)\n"], "outputs": [], "metadata": {}}]
+
+
+def test_key_includes_base_url():
+    key = ResultCache.make_key("http://a", "a@example.ac.jp", "practice_problem_1", "x.ipynb", CELLS)
+    assert key == ResultCache.make_key("http://a", "a@example.ac.jp", "practice_problem_1", "x.ipynb", CELLS)
+    assert key != ResultCache.make_key("http://b", "a@example.ac.jp", "practice_problem_1", "x.ipynb", CELLS)
+
+
+def test_result_from_another_server_is_not_reused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ResultCache(str(tmp_path / "cache"))
+
+    def submit(server):
+        client = GradingClient(server.url)
+        client.set_notebook_path("x.ipynb")
+        client.set_result_cache(True, cache)
+        client.set_debug_artifacts("off")
+        client.set_offline_queue(False)
+        return asyncio.run(client.submit_assignment_async("a@example.ac.jp", 1, CELLS, auto_save=False))
+
+    with LocalGradingServer() as first, LocalGradingServer() as second:
+        assert submit(first)[0]
+        assert submit(first)[0]
+        assert first.stats["requests"] == 1  # 2回目は保存済みの結果
+        assert submit(second)[0]
+        assert second.stats["requests"] == 1
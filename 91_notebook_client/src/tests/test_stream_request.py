@@ -0,0 +1,46 @@
+"""ストリーミング送信の後始末（応答を閉じ、接続をプールに戻す）"""
+
+from python.delta_submission import DELTA_FEATURE
+from python.grading_client import GradingClient
+from python.http_transport import CancelToken
+from python.local_grading_server import LocalGradingServer
+
+
+def send_stream(server, submission_data):
+    client = GradingClient(server.url)
+    client.set_notebook_path("x.ipynb")
+    client.set_debug_artifacts("off")
+    transport = client._get_transport()
+    token = CancelToken("stream-test")
+    outcome = client._stream_request(submission_data(client), 5, lambda event: None, cancel_token=token)
+
+    # 同じ接続で次のリクエストを送れる（新しい接続を作らない）
+    new_connections = transport.get_stats()["new_connections"]
+    transport.get(f"{server.url}/capabilities", timeout=5).close()
+    assert transport.get_stats()["new_connections"] == new_connections
+    assert not token._sockets
+    return outcome
+
+
+def invalid_submission(client):
+    return dict(client.create_submission_data("a@example.ac.jp", 1, []), assignment_id="invalid")
+
+
+def valid_submission(client):
+    return client.create_submission_data("a@example.ac.jp", 1, [])
+
+
+def test_error_response_is_closed():
+    with LocalGradingServer() as server:
+        success, _, error_msg, response, _ = send_stream(server, invalid_submission)
+    assert not success
+    assert error_msg.startswith("HTTP 422")
+    assert response.json()["error"] == "invalid_submission"  # 閉じた後も本文は読める
+
+
+def test_plain_json_response_is_closed():
+    # ストリーミング方式に対応していないサーバーは通常のJSONで返す
+    with LocalGradingServer(features=(DELTA_FEATURE,)) as server:
+        success, result, _, _, _ = send_stream(server, valid_submission)
+    assert success
+    assert result["assignment_id"] == "practice_problem_1"